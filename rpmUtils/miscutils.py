@@ -17,6 +17,7 @@
 
 import rpm
 import types
+import re
 import gzip
 import os
 import sys
@@ -57,7 +58,60 @@ def compareEVR((e1, v1, r1), (e2, v2, r2)):
 def compareVerOnly(v1, v2):
     """compare version strings only using rpm vercmp"""
     return compareEVR(('', v1, ''), ('', v2, ''))
-    
+
+#  The vercmp keys below only support ~ and ^ if the rpm we are running
+# against does, so they always agree with rpm.labelCompare().
+_vercmp_has_tilde = rpm.labelCompare(('0', '1~', '0'), ('0', '1', '0')) < 0
+_vercmp_has_caret = rpm.labelCompare(('0', '1^', '0'), ('0', '1', '0')) > 0
+_vercmp_re = '[0-9]+|[a-zA-Z]+'
+if _vercmp_has_tilde:
+    _vercmp_re += '|~'
+if _vercmp_has_caret:
+    _vercmp_re += '|\\^'
+_vercmp_re = re.compile(_vercmp_re)
+# Segment ranks, in rpmvercmp order: ~ < end-of-string < ^ < alpha < numeric
+_VERCMP_TILDE = (0,)
+_VERCMP_END   = (1,)
+_VERCMP_CARET = (2,)
+_vercmp_key_cache = {}
+def vercmpKey(s):
+    """ Return a sort key for the version string s, such that comparing the
+        keys of two strings gives the same result as rpmvercmp() does on the
+        strings themselves. Keys are cached, so calling this repeatedly on
+        the same strings is cheap. """
+    try:
+        return _vercmp_key_cache[s]
+    except KeyError:
+        pass
+    # Note that all non-alnum chars. (apart from ~ and ^) are separators and
+    # don't take part in the comparison, so findall() just skips them.
+    key = []
+    for seg in _vercmp_re.findall(s):
+        if seg == '~':
+            key.append(_VERCMP_TILDE)
+        elif seg == '^':
+            key.append(_VERCMP_CARET)
+        elif seg[0] in '0123456789':
+            key.append((4, int(seg)))
+        else:
+            key.append((3, seg))
+    key.append(_VERCMP_END)
+    key = tuple(key)
+    _vercmp_key_cache[s] = key
+    return key
+
+def evrKey(e, v, r):
+    """ Return a sort key for (e, v, r), comparing two of these keys gives the
+        same result as compareEVR() does on the tuples. """
+    if e is None:
+        e = '0'
+    return (vercmpKey(str(e)), vercmpKey(str(v)), vercmpKey(str(r)))
+
+def compareEVRKey(evr1, evr2):
+    """ Same as compareEVR() but using evrKey(), which is much faster when
+        the same versions get compared over and over. """
+    return cmp(evrKey(*evr1), evrKey(*evr2))
+
 def checkSig(ts, package):
     """Takes a transaction set and a package, check it's sigs, 
     return 0 if they are all fine
@@ -176,7 +230,7 @@ def rangeCompare(reqtuple, provtuple):
     if r is None:
         reqr = None
 
-    rc = compareEVR((e, v, r), (reqe, reqv, reqr))
+    rc = compareEVRKey((e, v, r), (reqe, reqv, reqr))
 
     # does not match unless
     if rc >= 1:
@@ -18,8 +18,11 @@ import rpmUtils
 import rpmUtils.miscutils
 import rpmUtils.arch
 
+from itertools import groupby
+from operator import itemgetter
+
 def _vertup_cmp(tup1, tup2):
-    return rpmUtils.miscutils.compareEVR(tup1, tup2)
+    return rpmUtils.miscutils.compareEVRKey(tup1, tup2)
 class Updates:
     """
     This class computes and keeps track of updates and obsoletes.
@@ -141,7 +144,7 @@ class Updates:
         (new_e, new_v, new_r) = evrlist[0] # we'll call the first ones 'newest'
         
         for (e, v, r) in evrlist[1:]:
-            rc = rpmUtils.miscutils.compareEVR((e, v, r), (new_e, new_v, new_r))
+            rc = rpmUtils.miscutils.compareEVRKey((e, v, r), (new_e, new_v, new_r))
             if rc > 0:
                 new_e = e
                 new_v = v
@@ -218,48 +221,60 @@ class Updates:
         """figures out what things available obsolete things installed, returns
            them in a dict attribute of the class."""
 
-        obsdict = {} # obseleting package -> [obsoleted package]
-        # this needs to keep arch in mind
-        # if foo.i386 obsoletes bar
-        # it needs to obsoletes bar.i386 preferentially, not bar.x86_64
-        # if there is only one bar and only one foo then obsolete it, but try to
-        # match the arch.
-        
-        # look through all the obsoleting packages look for multiple archs per name
-        # if you find it look for the packages they obsolete
-        # 
+        #  The rules are the same as the old (n, a) dict based code (see
+        # test/nadictupdates.py) ... but we only work out once per name if the
+        # obsoleting pkg is already installed, using EVR keys.
         obs_arches = {}
         for (n, a, e, v, r) in self.rawobsoletes:
-            if n not in obs_arches:
-                obs_arches[n] = []
-            obs_arches[n].append(a)
+            obs_arches.setdefault(n, set()).add(a)
+
+        evrKey = rpmUtils.miscutils.evrKey
+        rangeCheck = rpmUtils.miscutils.rangeCheck
+        instnewest = {} # name -> (newest installed evr-key, installed evrs)
 
-        for pkgtup in self.rawobsoletes:
+        obsdict = {} # obseleting package -> [obsoleted package]
+        for pkgtup, obsoletes in self.rawobsoletes.iteritems():
             (name, arch, epoch, ver, rel) = pkgtup
-            for (obs_n, flag, (obs_e, obs_v, obs_r)) in self.rawobsoletes[(pkgtup)]:
-                if (obs_n, None) in self.installdict:
-                    for (rpm_a, rpm_e, rpm_v, rpm_r) in self.installdict[(obs_n, None)]:
-                        if flag in [None, 0] or \
-                                rpmUtils.miscutils.rangeCheck((obs_n, flag, (obs_e, obs_v, obs_r)),
-                                                              (obs_n, rpm_a, rpm_e, rpm_v, rpm_r)):
-                            # make sure the obsoleting pkg is not already installed
-                            willInstall = 1
-                            if (name, None) in self.installdict:
-                                for (ins_a, ins_e, ins_v, ins_r) in self.installdict[(name, None)]:
-                                    pkgver = (epoch, ver, rel)
-                                    installedver = (ins_e, ins_v, ins_r)
-                                    if self.returnNewest((pkgver, installedver)) == installedver:
-                                        willInstall = 0
-                                        break
-                            if rpm_a != arch and rpm_a in obs_arches[name]:
-                                willInstall = 0
-                            if willInstall:
-                                if pkgtup not in obsdict:
-                                    obsdict[pkgtup] = []
-                                obsdict[pkgtup].append((obs_n, rpm_a, rpm_e, rpm_v, rpm_r))
+            willInstall = None
+            for (obs_n, flag, obs_evr) in obsoletes:
+                if (obs_n, None) not in self.installdict:
+                    continue
+                for (rpm_a, rpm_e, rpm_v, rpm_r) in self.installdict[(obs_n, None)]:
+                    if flag not in (None, 0) and \
+                       not rangeCheck((obs_n, flag, obs_evr),
+                                      (obs_n, rpm_a, rpm_e, rpm_v, rpm_r)):
+                        continue
+
+                    # make sure the obsoleting pkg is not already installed
+                    if willInstall is None:
+                        willInstall = self._notInstalledByKey(instnewest,
+                                                              name, pkgtup)
+                    if not willInstall:
+                        break
+                    if rpm_a != arch and rpm_a in obs_arches[name]:
+                        continue
+                    obsdict.setdefault(pkgtup, []).append((obs_n, rpm_a,
+                                                           rpm_e, rpm_v, rpm_r))
+                if willInstall is False:
+                    break
         self.obsoletes = obsdict
         self.makeObsoletedDict()
 
+    def _notInstalledByKey(self, cache, name, pkgtup):
+        """returns True if nothing installed called name is the same or newer
+           than pkgtup, cache is a dict. to keep the newest installed for each
+           name in."""
+        if (name, None) not in self.installdict:
+            return True
+        if name not in cache:
+            evrKey = rpmUtils.miscutils.evrKey
+            evrs = set([(e, v, r) for (a, e, v, r) in self.installdict[(name, None)]])
+            cache[name] = (max([evrKey(*evr) for evr in evrs]), evrs)
+        (ins_key, ins_evrs) = cache[name]
+        evr = pkgtup[2:]
+        return not (evr in ins_evrs or
+                    ins_key > rpmUtils.miscutils.evrKey(*evr))
+
     def makeObsoletedDict(self):
         """creates a dict of obsoleted packages -> [obsoleting package], this
            is to make it easier to look up what package obsoletes what item in 
@@ -275,139 +290,41 @@ class Updates:
             for obsoleting in obsoletings:
                 self.obsoleting_dict.setdefault(obsoleting, []).append(obsoleted)
     
-    def doUpdates(self):
-        """check for key lists as populated then commit acts of evil to
-           determine what is updated and/or obsoleted, populate self.updatesdict
-        """
-        
-        
-        # best bet is to chew through the pkgs and throw out the new ones early
-        # then deal with the ones where there are a single pkg installed and a 
-        # single pkg available
-        # then deal with the multiples
-
-        # we should take the whole list as a 'newlist' and remove those entries
-        # which are clearly:
-        #   1. updates 
-        #   2. identical to the ones in ourdb
-        #   3. not in our archdict at all
-        
-        simpleupdate = []
-        complexupdate = []
-        
-        updatedict = {} # (old n, a, e, v, r) : [(new n, a, e, v, r)]
-                        # make the new ones a list b/c while we _shouldn't_
-                        # have multiple updaters, we might and well, it needs
-                        # to be solved one way or the other <sigh>
-        newpkgs = self.availdict
-        
-        archlist = self._archlist 
-        for (n, a) in newpkgs.keys():
-            if a not in archlist:
-                # high log here
-                del newpkgs[(n, a)]
+    def _sortedPkgs(self, pkglist, archs=None, names=None):
+        """returns the unique pkgtups from pkglist (optionally only those with
+           an arch in archs, and a name in names), as a list of
+           (n, a, evr-key, idx, (e, v, r)) sorted by name, arch and EVR. idx is
+           the position in pkglist, so equal EVRs are still sorted in the
+           order they were given to us."""
+        evrKey = rpmUtils.miscutils.evrKey
+        keys = {}
+        ret = []
+        seen = set()
+        for idx, pkgtup in enumerate(pkglist):
+            if pkgtup in seen:
                 continue
-
-        # remove the older stuff - if we're doing an update we only want the
-        # newest evrs                
-        for (n, a) in newpkgs:
-            (new_e,new_v,new_r) = self.returnNewest(newpkgs[(n, a)])
-            for (e, v, r) in newpkgs[(n, a)][:]:
-                if (new_e, new_v, new_r) != (e, v, r):
-                    newpkgs[(n, a)].remove((e, v, r))
-
-        for (n, a) in newpkgs:
-            # simple ones - look for exact matches or older stuff
-            if (n, a) in self.installdict:
-                for (rpm_e, rpm_v, rpm_r) in self.installdict[(n, a)]:
-                    try:
-                        (e, v, r) = self.returnNewest(newpkgs[(n,a)])
-                    except rpmUtils.RpmUtilsError:
-                        continue
-                    else:
-                        rc = rpmUtils.miscutils.compareEVR((e, v, r), (rpm_e, rpm_v, rpm_r))
-                        if rc <= 0:
-                            try:
-                                newpkgs[(n, a)].remove((e, v, r))
-                            except ValueError:
-                                pass
-
-        # Now we add the (n, None) entries back...
-        for na in newpkgs.keys():
-            all_arches = map(lambda x: (na[1], x[0], x[1], x[2]), newpkgs[na])
-            newpkgs.setdefault((na[0], None), []).extend(all_arches)
-
-        # get rid of all the empty dict entries:
-        for nakey in newpkgs.keys():
-            if len(newpkgs[nakey]) == 0:
-                del newpkgs[nakey]
-
-
-        # ok at this point our newpkgs list should be thinned, we should have only
-        # the newest e,v,r's and only archs we can actually use
-        for (n, a) in newpkgs:
-            if a is None: # the None archs are only for lookups
+            seen.add(pkgtup)
+            (n, a, e, v, r) = pkgtup
+            if archs is not None and a not in archs:
                 continue
-    
-            if (n, None) in self.installdict:
-                installarchs = []
-                availarchs = []
-                for (a, e, v ,r) in newpkgs[(n, None)]:
-                    availarchs.append(a)
-                for (a, e, v, r) in self.installdict[(n, None)]:
-                    installarchs.append(a)
-
-                if len(availarchs) > 1 or len(installarchs) > 1:
-                    self.debugprint('putting %s in complex update' % n)
-                    complexupdate.append(n)
-                else:
-                    #log(4, 'putting %s in simple update list' % name)
-                    self.debugprint('putting %s in simple update' % n)
-                    simpleupdate.append((n, a))
-
-        # we have our lists to work with now
-    
-        # simple cases
-        for (n, a) in simpleupdate:
-            # try to be as precise as possible
-            if n in self.exactarchlist:
-                if (n, a) in self.installdict:
-                    (rpm_e, rpm_v, rpm_r) = self.returnNewest(self.installdict[(n, a)])
-                    if (n, a) in newpkgs:
-                        (e, v, r) = self.returnNewest(newpkgs[(n, a)])
-                        rc = rpmUtils.miscutils.compareEVR((e, v, r), (rpm_e, rpm_v, rpm_r))
-                        if rc > 0:
-                            # this is definitely an update - put it in the dict
-                            if (n, a, rpm_e, rpm_v, rpm_r) not in updatedict:
-                                updatedict[(n, a, rpm_e, rpm_v, rpm_r)] = []
-                            updatedict[(n, a, rpm_e, rpm_v, rpm_r)].append((n, a, e, v, r))
-    
-            else:
-                # we could only have 1 arch in our rpmdb and 1 arch of pkg 
-                # available - so we shouldn't have to worry about the lists, here
-                # we just need to find the arch of the installed pkg so we can 
-                # check it's (e, v, r)
-                (rpm_a, rpm_e, rpm_v, rpm_r) = self.installdict[(n, None)][0]
-                if (n, None) in newpkgs:
-                    for (a, e, v, r) in newpkgs[(n, None)]:
-                        rc = rpmUtils.miscutils.compareEVR((e, v, r), (rpm_e, rpm_v, rpm_r))
-                        if rc > 0:
-                            # this is definitely an update - put it in the dict
-                            if (n, rpm_a, rpm_e, rpm_v, rpm_r) not in updatedict:
-                                updatedict[(n, rpm_a, rpm_e, rpm_v, rpm_r)] = []
-                            updatedict[(n, rpm_a, rpm_e, rpm_v, rpm_r)].append((n, a, e, v, r))
-
-
-        # complex cases
-
+            if names is not None and n not in names:
+                continue
+            evr = (e, v, r)
+            if evr not in keys:
+                keys[evr] = evrKey(e, v, r)
+            ret.append((n, a, keys[evr], idx, evr))
+        ret.sort()
+        return ret
+
+    def _complexArchLists(self):
+        """returns the list of arch sets we need to look at separately, when
+           a name has more than one installed or available arch."""
         # we're multilib/biarch
         # we need to check the name.arch in two different trees
         # one for the multiarch itself and one for the compat arch
         # ie: x86_64 and athlon(i686-i386) - we don't want to descend
         # x86_64->i686 
         # however, we do want to descend x86_64->noarch, sadly.
-        
-        archlists = []
         if self._is_multilib:
             if self.myarch in rpmUtils.arch.multilibArches:
                 biarches = [self.myarch]
@@ -417,84 +334,142 @@ class Updates:
             
             multicompat = self._multilib_compat_arches[0]
             multiarchlist = rpmUtils.arch.getArchList(multicompat)
-            archlists = [ set(biarches), set(multiarchlist) ]
-            # archlists = [ biarches, multiarchlist ]
-        else:
-            archlists = [ set(archlist) ]
-            # archlists = [ archlist ]
-            
-        for n in complexupdate:
-            for thisarchlist in archlists:
-                # we need to get the highest version and the archs that have it
-                # of the installed pkgs            
-                tmplist = []
-                for (a, e, v, r) in self.installdict[(n, None)]:
-                    tmplist.append((n, a, e, v, r))
-
-                highestinstalledpkgs = self.returnHighestVerFromAllArchsByName(n,
-                                         thisarchlist, tmplist)
-                hipdict = self.makeNADict(highestinstalledpkgs, 0)
-                                         
-                
-                if n in self.exactarchlist:
-                    tmplist = []
-                    for (a, e, v, r) in newpkgs[(n, None)]:
-                        tmplist.append((n, a, e, v, r))
-                    highestavailablepkgs = self.returnHighestVerFromAllArchsByName(n,
-                                             thisarchlist, tmplist)
+            return [ set(biarches), set(multiarchlist) ]
+        return [ set(self._archlist) ]
+
+    def _highestByKey(self, pkgs, archs):
+        """returns the (a, (e, v, r)) of the newest (a, evr-key, (e, v, r))
+           from pkgs, only looking at the archs given. Like 
+           returnHighestVerFromAllArchsByName() but using EVR keys."""
+        returnlist = []
+        high_key = None
+        high_evr = None
+        for (a, key, evr) in pkgs:
+            if a not in archs:
+                continue
+            if high_key is None or high_key < key:
+                high_key = key
+                high_evr = evr
+                returnlist = []
+            if evr == high_evr:
+                returnlist.append((a, evr))
+        return returnlist
 
-                    hapdict = self.makeNADict(highestavailablepkgs, 0)
+    def _mergeByName(self, inst, avail):
+        """takes two lists from _sortedPkgs() and yields (name, installed,
+           available) for each name that is in both."""
+        agroups = groupby(avail, itemgetter(0))
+        (an, apkgs) = next(agroups, (None, None))
+        for n, ipkgs in groupby(inst, itemgetter(0)):
+            while an is not None and an < n:
+                (an, apkgs) = next(agroups, (None, None))
+            if an is None:
+                break
+            if an != n:
+                continue
+            yield n, list(ipkgs), list(apkgs)
+
+    def doUpdates(self):
+        """check for key lists as populated then commit acts of evil to
+           determine what is updated and/or obsoleted, populate self.updatesdict
+        """
+
+        # The rules are the same as the old code (see test/nadictupdates.py),
+        # but instead of building (n, a) dicts and calling compareEVR() over
+        # and over, we sort the installed and available pkgs by
+        # (name, arch, EVR-key) once and then walk the two lists together, a
+        # name at a time.
+        # updatedict = (old n, a, e, v, r) : [(new n, a, e, v, r)]
+        updatedict = {}
+        archlists = self._complexArchLists()
+
+        inst = self._sortedPkgs(self.installed)
+        avail = self._sortedPkgs(self.available, set(self._archlist),
+                                 set([pkg[0] for pkg in inst]))
+        for (n, ipkgs, apkgs) in self._mergeByName(inst, avail):
+            # Newest installed EVR-key for each arch.
+            inewest = {}
+            for (n, a, key, idx, evr) in ipkgs:
+                inewest[a] = key
+
+            #  The newest available for each arch, if it's newer than what we
+            # have installed for that arch (equal EVRs are sorted by idx, so we
+            # take the first of the newest).
+            newpkgs = []
+            for a, pkgs in groupby(apkgs, itemgetter(1)):
+                pkgs = list(pkgs)
+                newest = pkgs[-1]
+                for pkg in reversed(pkgs):
+                    if pkg[2] != newest[2]:
+                        break
+                    newest = pkg
+                if a not in inewest or newest[2] > inewest[a]:
+                    newpkgs.append((a, newest[2], newest[4]))
+            if not newpkgs:
+                continue
 
-                    for (n, a) in hipdict:
-                        if (n, a) in hapdict:
+            ipkgs.sort(key=itemgetter(3))
+            ipkgs = [(a, key, evr) for (n, a, key, idx, evr) in ipkgs]
+
+            if len(newpkgs) == 1 and len(ipkgs) == 1:
+                self.debugprint('putting %s in simple update' % n)
+                (a, key, evr) = newpkgs[0]
+                (rpm_a, rpm_key, rpm_evr) = ipkgs[0]
+                if n in self.exactarchlist and a != rpm_a:
+                    continue
+                if key > rpm_key:
+                    # this is definitely an update - put it in the dict
+                    updatedict.setdefault((n, rpm_a) + rpm_evr,
+                                          []).append((n, a) + evr)
+                continue
+
+            self.debugprint('putting %s in complex update' % n)
+            updates = []
+            for thisarchlist in archlists:
+                # these are lists of (a, evr), with the arches unique
+                hip = self._highestByKey(ipkgs, thisarchlist)
+                hap = self._highestByKey(newpkgs, thisarchlist)
+                hapdict = dict(hap)
+
+                if n in self.exactarchlist:
+                    for (a, rpm_evr) in hip:
+                        if a in hapdict:
                             self.debugprint('processing %s.%s' % (n, a))
-                            # we've got a match - get our versions and compare
-                            (rpm_e, rpm_v, rpm_r) = hipdict[(n, a)][0] # only ever going to be first one
-                            (e, v, r) = hapdict[(n, a)][0] # there can be only one
-                            rc = rpmUtils.miscutils.compareEVR((e, v, r), (rpm_e, rpm_v, rpm_r))
-                            if rc > 0:
-                                # this is definitely an update - put it in the dict
-                                if (n, a, rpm_e, rpm_v, rpm_r) not in updatedict:
-                                    updatedict[(n, a, rpm_e, rpm_v, rpm_r)] = []
-                                updatedict[(n, a, rpm_e, rpm_v, rpm_r)].append((n, a, e, v, r))
+                            evr = hapdict[a]
+                            if (rpmUtils.miscutils.compareEVRKey(evr, rpm_evr)
+                                > 0):
+                                updates.append(((n, a) + rpm_evr,
+                                                (n, a) + evr))
                 else:
                     self.debugprint('processing %s' % n)
                     # this is where we have to have an arch contest if there
                     # is more than one arch updating with the highest ver
-                    instarchs = []
-                    for (n,a) in hipdict:
-                        instarchs.append(a)
-                    
-                    rpm_a = rpmUtils.arch.getBestArchFromList(instarchs, myarch=self.myarch)
+                    instarchs = [a for (a, evr) in hip]
+                    rpm_a = rpmUtils.arch.getBestArchFromList(instarchs,
+                                                              myarch=self.myarch)
                     if rpm_a is None:
                         continue
-
-                    tmplist = []
-                    for (a, e, v, r) in newpkgs[(n, None)]:
-                        tmplist.append((n, a, e, v, r))
-                    highestavailablepkgs = self.returnHighestVerFromAllArchsByName(n,
-                                             thisarchlist, tmplist)
-
-                    hapdict = self.makeNADict(highestavailablepkgs, 0)
-                    availarchs = []
-                    for (n,a) in hapdict:
-                        availarchs.append(a)
-                    a = rpmUtils.arch.getBestArchFromList(availarchs, myarch=self.myarch)
+                    availarchs = [a for (a, evr) in hap]
+                    a = rpmUtils.arch.getBestArchFromList(availarchs,
+                                                          myarch=self.myarch)
                     if a is None:
                         continue
-                        
-                    (rpm_e, rpm_v, rpm_r) = hipdict[(n, rpm_a)][0] # there can be just one
-                    (e, v, r) = hapdict[(n, a)][0] # just one, I'm sure, I swear!
-                    rc = rpmUtils.miscutils.compareEVR((e, v, r), (rpm_e, rpm_v, rpm_r))
-                    if rc > 0:
-                        # this is definitely an update - put it in the dict
-                        if (n, rpm_a, rpm_e, rpm_v, rpm_r) not in updatedict:
-                            updatedict[(n, rpm_a, rpm_e, rpm_v, rpm_r)] = []
-                        updatedict[(n, rpm_a, rpm_e, rpm_v, rpm_r)].append((n, a, e, v, r))
-                   
-        self.updatesdict = updatedict                    
+
+                    rpm_evr = dict(hip)[rpm_a]
+                    evr = hapdict[a]
+                    if rpmUtils.miscutils.compareEVRKey(evr, rpm_evr) > 0:
+                        updates.append(((n, rpm_a) + rpm_evr, (n, a) + evr))
+
+            #  The old code looks at complex names once per available arch,
+            # so we add the updates that many times too (condenseUpdates()
+            # gets rid of the dups.).
+            for i in range(len(newpkgs)):
+                for (old, new) in updates:
+                    updatedict.setdefault(old, []).append(new)
+
+        self.updatesdict = updatedict
         self.makeUpdatingDict()
-        
+
     def makeUpdatingDict(self):
         """creates a dict of available packages -> [installed package], this
            is to make it easier to look up what package  will be updating what
@@ -704,7 +679,7 @@ class Updates:
                 pkgtup2 = highdict[(n, a)]
                 done = True
                 (n2, a2, e2, v2, r2) = pkgtup2
-                rc = rpmUtils.miscutils.compareEVR((e,v,r), (e2, v2, r2))
+                rc = rpmUtils.miscutils.compareEVRKey((e,v,r), (e2, v2, r2))
                 if rc > 0:
                     highdict[(n, a)] = pkgtup
         
@@ -0,0 +1,86 @@
+import unittest
+import tempfile
+import shutil
+import settestpath
+
+from yum import misc
+from yum import packages
+
+class WorkerPoolTests(unittest.TestCase):
+
+    def _square(self, num):
+        if num < 0:
+            raise ValueError, num
+        return num * num
+
+    def _check(self, workers):
+        pool = misc.WorkerPool(self._square, workers, 'test')
+        for num in range(50):
+            pool.put(num)
+        pool.put(-1)
+        res = pool.done() + pool.wait()
+        self.assertEquals(pool.wait(), [])
+        self.assertEquals(len(res), 51)
+        good = sorted([(num, ret) for (num, ret, e) in res if e is None])
+        self.assertEquals(good, [(num, num * num) for num in range(50)])
+        bad = [(num, e) for (num, ret, e) in res if e is not None]
+        self.assertEquals(len(bad), 1)
+        self.assertEquals(bad[0][0], -1)
+        self.assert_(isinstance(bad[0][1], ValueError))
+
+        # Reusable, after it's finished.
+        pool.put(3)
+        self.assertEquals(pool.wait(), [(3, 9, None)])
+
+    def testUnthreaded(self):
+        self._check(1)
+        pool = misc.WorkerPool(self._square)
+        pool.put(2)
+        self.assertEquals(pool.done(), [(2, 4, None)])
+
+    def testThreaded(self):
+        self._check(4)
+
+class VerifyLocalFileTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.fn = self.tmpdir + '/foo.rpm'
+        fo = open(self.fn, 'w')
+        fo.write('x' * 1000)
+        fo.close()
+        self.csum = misc.checksum('sha256', self.fn)
+        self.xattrs = {}
+        self._orig = (misc.xattr_get_chksum, misc.xattr_set_chksum)
+        misc.xattr_get_chksum = lambda fn, ctype: self.xattrs.get((fn, ctype))
+        def _set(fn, ctype, csum):
+            self.xattrs[(fn, ctype)] = csum
+        misc.xattr_set_chksum = _set
+
+    def tearDown(self):
+        (misc.xattr_get_chksum, misc.xattr_set_chksum) = self._orig
+        shutil.rmtree(self.tmpdir)
+
+    def testGood(self):
+        nst = packages.verify_local_file(self.fn, 'sha256', self.csum, 1000)
+        self.assertEquals(nst.st_size, 1000)
+        self.assertEquals(self.xattrs, {(self.fn, 'sha256') : self.csum})
+
+    def testBad(self):
+        self.assertEquals(packages.verify_local_file(self.fn, 'sha256',
+                                                     'abcd', 1000), None)
+        self.assertEquals(packages.verify_local_file(self.fn, 'sha256',
+                                                     self.csum, 999), None)
+        self.assertEquals(packages.verify_local_file(self.fn + '.missing',
+                                                     'sha256', self.csum,
+                                                     1000), None)
+        self.assertEquals(self.xattrs, {})
+
+    def testXattr(self):
+        # The stored checksum is used, rather than reading the file.
+        self.xattrs[(self.fn, 'sha256')] = 'abcd'
+        self.assert_(packages.verify_local_file(self.fn, 'sha256', 'abcd',
+                                                1000))
+        # ...but not if the size is wrong.
+        self.assertEquals(packages.verify_local_file(self.fn, 'sha256',
+                                                     'abcd', 1001), None)
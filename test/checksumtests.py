@@ -0,0 +1,70 @@
+import unittest
+import tempfile
+import shutil
+import hashlib
+import bz2
+import settestpath
+
+from yum import misc
+
+class ChecksumsTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.data = ''.join([chr(num) for num in range(256)]) * 2**13 + 'xyz'
+        self.fn = self.tmpdir + '/data'
+        fo = open(self.fn, 'w')
+        fo.write(self.data)
+        fo.close()
+        self.xattrs = {}
+        self._orig = misc.xattr_set_chksum
+        def _set(fn, ctype, csum):
+            self.xattrs[(fn, ctype)] = csum
+        misc.xattr_set_chksum = _set
+
+    def tearDown(self):
+        misc.xattr_set_chksum = self._orig
+        shutil.rmtree(self.tmpdir)
+
+    def testSinglePass(self):
+        ret = misc.checksums(['sha256', 'sha1', 'md5'], self.fn)
+        self.assertEquals(ret, {'sha256' : hashlib.sha256(self.data).hexdigest(),
+                                'sha1' : hashlib.sha1(self.data).hexdigest(),
+                                'md5' : hashlib.md5(self.data).hexdigest()})
+        self.assertEquals(misc.checksum('sha256', self.fn), ret['sha256'])
+        self.assertEquals(misc.checksum('sha', self.fn), ret['sha1'])
+        self.assertEquals(misc.checksum('sha256', self.fn, CHUNK=1000),
+                          ret['sha256'])
+        fo = open(self.fn)
+        self.assertEquals(misc.checksums(['md5'], fo), {'md5' : ret['md5']})
+        fo.close()
+
+    def testDatasize(self):
+        ret = misc.checksums(['sha256', 'md5'], self.fn, datasize=100)
+        self.assert_(ret['sha256'].startswith('!100!'))
+        self.assert_(ret['md5'].startswith('!100!'))
+        ret = misc.checksums(['sha256'], self.fn, datasize=len(self.data))
+        self.assertEquals(ret['sha256'],
+                          hashlib.sha256(self.data).hexdigest())
+
+    def testMissing(self):
+        self.assertRaises(misc.MiscError, misc.checksums, ['sha256'],
+                          self.fn + '.missing')
+        self.assertRaises(misc.MiscError, misc.checksums, ['blah'], self.fn)
+
+    def testDecompress(self):
+        fo = open(self.fn + '.bz2', 'w')
+        fo.write(bz2.compress(self.data))
+        fo.close()
+        out = misc.decompress(self.fn + '.bz2', dest=self.fn + '.out',
+                              sumtypes=['sha256', 'blah'])
+        self.assertEquals(out, self.fn + '.out')
+        self.assertEquals(open(out).read(), self.data)
+        self.assertEquals(self.xattrs,
+                          {(out, 'sha256') :
+                           hashlib.sha256(self.data).hexdigest()})
+
+        # Nothing stored if we weren't asked for anything.
+        self.xattrs = {}
+        misc.decompress(self.fn + '.bz2', dest=self.fn + '.out2')
+        self.assertEquals(self.xattrs, {})
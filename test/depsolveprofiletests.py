@@ -0,0 +1,114 @@
+import unittest
+import json
+import settestpath
+
+from yum import misc
+from yum.depsolve import DepsolveProfile, Depsolve
+
+class FakeRpmDb:
+    def __init__(self):
+        self._header_loads = 0
+
+class FakeConf:
+    depsolve_loop_limit = 100
+
+class FakeTsInfo:
+    def __len__(self):
+        return 1
+
+    def resetResolved(self, hard=False):
+        pass
+
+class BrokenDepsolve(Depsolve):
+    """ Blows up in the named phase. """
+    def __init__(self, phase):
+        Depsolve.__init__(self)
+        self.conf = FakeConf()
+        self.tsInfo = FakeTsInfo()
+        self.phase = phase
+
+    def _resolveRequires(self, errors):
+        if self.phase == '_resolveRequires':
+            raise ValueError, "broken"
+        return False, True, True, False
+
+    def _checkFileRequires(self):
+        if self.phase == '_checkFileRequires':
+            raise ValueError, "broken"
+        return []
+
+    def _checkConflicts(self):
+        if self.phase == '_checkConflicts':
+            raise ValueError, "broken"
+        return []
+
+    def _checkObsoletes(self):
+        if self.phase == '_checkObsoletes':
+            raise ValueError, "broken"
+        return False
+
+class DepsolveProfileTests(unittest.TestCase):
+
+    def testPhases(self):
+        prof = DepsolveProfile()
+        for i in range(3):
+            prof.start('_resolveRequires')
+            prof.stop('_resolveRequires')
+        prof.start('_checkConflicts')
+        prof.stop('_checkConflicts')
+        data = prof.dump()
+        self.assertEquals(sorted(data['phases']),
+                          ['_checkConflicts', '_resolveRequires'])
+        self.assertEquals(data['phases']['_resolveRequires']['calls'], 3)
+        self.assert_(data['phases']['_checkConflicts']['time'] >= 0)
+        self.assertFalse('total' in data)
+
+    def testCounters(self):
+        rpmdb = FakeRpmDb()
+        rpmdb._header_loads = 10
+        cache = misc.LRUCache('test.depsolveprofile')
+        prof = DepsolveProfile(rpmdb)
+        prof.count('depsolve_loops')
+        prof.count('depsolve_loops')
+        prof.count('file_requires', 7)
+        cache.get('a')
+        cache['a'] = 1
+        cache.get('a')
+        cache.get('a')
+        rpmdb._header_loads += 5
+        prof.finish(rpmdb)
+        data = prof.dump()
+        self.assertEquals(data['counters'], {'depsolve_loops' : 2,
+                                             'file_requires' : 7,
+                                             'lookup_cache_hits' : 2,
+                                             'lookup_cache_misses' : 1,
+                                             'header_loads' : 5})
+        self.assert_(data['total'] >= 0)
+
+        # A new rpmdb object, so all its loads count.
+        prof = DepsolveProfile(rpmdb)
+        rpmdb = FakeRpmDb()
+        rpmdb._header_loads = 3
+        prof.finish(rpmdb)
+        self.assertEquals(prof.dump()['counters']['header_loads'], 3)
+
+    def testJSON(self):
+        prof = DepsolveProfile()
+        prof.start('_checkObsoletes')
+        prof.stop('_checkObsoletes')
+        prof.count('requires_processed', 4)
+        prof.finish()
+        self.assertEquals(json.loads(prof.json()), prof.dump())
+        self.assertEquals(prof.json().count('\n'), 0)
+
+    def testException(self):
+        phases = ['_resolveRequires', '_checkFileRequires', '_checkConflicts',
+                  '_checkObsoletes']
+        for num, phase in enumerate(phases):
+            ds = BrokenDepsolve(phase)
+            self.assertRaises(ValueError, ds.resolveDeps)
+            # The phase that raised is stopped, and counted, as normal.
+            self.assertEquals(ds._dsprof._beg, {})
+            data = ds._dsprof.dump()
+            self.assertEquals(sorted(data['phases']), sorted(phases[:num + 1]))
+            self.assertEquals(data['phases'][phase]['calls'], 1)
@@ -0,0 +1,82 @@
+import unittest
+import random
+import settestpath
+
+import rpm
+from yum import packages
+from rpmUtils import miscutils
+
+#  Chars. that are "interesting" to rpmvercmp(): digits, alphas, separators
+# and the ~ / ^ specials (which only count if the rpm we run against has them).
+_corpus_chars = '0001239abxyzAZ.._-+~^'
+_corpus_fixed = ['', '0', '00', '1', '01', '1.0', '1_0', '1.0a', '1.0.a',
+                 '1a', '1.a', 'a', 'A', 'a1', '1.0~rc1', '1.0~rc1~', '1.0^',
+                 '1.0^git1', '1.0^git1~x', '1.0~', '~', '^', '.', '2.6.32',
+                 '2.6.32.1', '10', '9', '1.01', '1.001', '1.1', 'el6', 'fc20',
+                 '12345678901234567890', '12345678901234567891']
+
+def _gen_corpus(num, seed=1234):
+    rnd = random.Random(seed)
+    ret = _corpus_fixed[:]
+    for i in range(num):
+        ret.append(''.join([rnd.choice(_corpus_chars)
+                            for i in range(rnd.randint(0, 8))]))
+    return ret
+
+def _rpm_vercmp(v1, v2):
+    return rpm.labelCompare(('0', v1, '0'), ('0', v2, '0'))
+
+class VercmpKeyTests(unittest.TestCase):
+
+    def testFixedPairs(self):
+        for v1 in _corpus_fixed:
+            for v2 in _corpus_fixed:
+                rc = cmp(miscutils.vercmpKey(v1), miscutils.vercmpKey(v2))
+                self.assertEquals(rc, _rpm_vercmp(v1, v2), (v1, v2))
+
+    def testGeneratedCorpus(self):
+        corpus = _gen_corpus(4000)
+        rnd = random.Random(4321)
+        for i in range(100000):
+            v1 = rnd.choice(corpus)
+            v2 = rnd.choice(corpus)
+            rc = cmp(miscutils.vercmpKey(v1), miscutils.vercmpKey(v2))
+            self.assertEquals(rc, _rpm_vercmp(v1, v2), (v1, v2))
+
+    def testSortedCorpus(self):
+        corpus = _gen_corpus(2000, seed=42)
+        keysorted = sorted(corpus, key=miscutils.vercmpKey)
+        for v1, v2 in zip(keysorted, keysorted[1:]):
+            self.assertTrue(_rpm_vercmp(v1, v2) <= 0, (v1, v2))
+
+class EVRKeyTests(unittest.TestCase):
+
+    def testEVRCorpus(self):
+        corpus = _gen_corpus(500, seed=99)
+        epochs = [None, '0', '1', '2', '10']
+        rnd = random.Random(99)
+        for i in range(20000):
+            evr1 = (rnd.choice(epochs), rnd.choice(corpus), rnd.choice(corpus))
+            evr2 = (rnd.choice(epochs), rnd.choice(corpus), rnd.choice(corpus))
+            self.assertEquals(miscutils.compareEVRKey(evr1, evr2),
+                              miscutils.compareEVR(evr1, evr2), (evr1, evr2))
+
+    def testNoneParts(self):
+        for evr1, evr2 in ((('0', '1', None), ('0', '1', None)),
+                           ((None, '1', '1'), ('0', '1', '1')),
+                           (('1', None, None), ('0', '2', '1')),
+                           (('0', '1', None), ('0', '1', '1'))):
+            self.assertEquals(miscutils.compareEVRKey(evr1, evr2),
+                              miscutils.compareEVR(evr1, evr2), (evr1, evr2))
+
+    def testPackageObject(self):
+        po1 = packages.YumNotFoundPackage(('foo', 'noarch', '0', '1.0', '1'))
+        po2 = packages.YumNotFoundPackage(('foo', 'noarch', '0', '1.0', '1.1'))
+        po3 = packages.YumNotFoundPackage(('foo', 'noarch', '1', '0.1', '1'))
+        self.assertTrue(po1.verLT(po2))
+        self.assertTrue(po2.verLT(po3))
+        self.assertTrue(po3.verGT(po1))
+        self.assertEquals(po1.evr_key, miscutils.evrKey('0', '1.0', '1'))
+        self.assertEquals(packages.comparePoEVR(po1, po2), -1)
+        evr = packages.PackageEVR('0', '1.0', '1.1')
+        self.assertEquals(packages.comparePoEVR(po2, evr), 0)
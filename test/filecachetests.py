@@ -0,0 +1,252 @@
+import unittest
+import tempfile
+import shutil
+import os
+import settestpath
+
+from yum import misc
+from yum.sqlutils import sqlite
+from yum.sqlitesack import YumSqlitePackageSack, YumAvailablePackageSqlite
+
+class FakeData:
+    def __init__(self, csum):
+        self.checksum = ('sha256', csum)
+
+class FakeRepoXML:
+    def __init__(self, csum):
+        self.csum = csum
+
+    def getData(self, mdtype):
+        return FakeData(self.csum)
+
+class FakeRepo:
+    def __init__(self, cachedir, csum):
+        self.id = 'fake'
+        self.cachedir = cachedir
+        self.prco_cache = True
+        self.repoXML = FakeRepoXML(csum)
+
+def _primary(csum, pkgs):
+    """ Make a primary MD with pkgKey => name pkgs. """
+    conn = sqlite.connect(':memory:')
+    conn.row_factory = sqlite.Row
+    cur = conn.cursor()
+    cur.execute("CREATE TABLE db_info (dbversion INTEGER, checksum TEXT)")
+    cur.execute("INSERT INTO db_info VALUES (10, ?)", (csum,))
+    cur.execute("""CREATE TABLE packages (pkgKey INTEGER PRIMARY KEY,
+                   pkgId TEXT, name TEXT, arch TEXT, epoch TEXT,
+                   version TEXT, release TEXT)""")
+    for pkgKey in sorted(pkgs):
+        cur.execute("INSERT INTO packages VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (pkgKey, '%s-%d' % (csum, pkgKey), pkgs[pkgKey],
+                     'noarch', '0', '1', '1'))
+    conn.commit()
+    return conn
+
+def _filelists(csum, files):
+    """ Make a filelists MD with pkgKey => [(dirname, filenames)] files. """
+    conn = sqlite.connect(':memory:')
+    conn.row_factory = sqlite.Row
+    cur = conn.cursor()
+    cur.execute("CREATE TABLE db_info (dbversion INTEGER, checksum TEXT)")
+    cur.execute("INSERT INTO db_info VALUES (10, ?)", (csum,))
+    cur.execute("""CREATE TABLE filelist (pkgKey INTEGER, dirname TEXT,
+                   filenames TEXT, filetypes TEXT)""")
+    for pkgKey in files:
+        for (dirname, filenames) in files[pkgKey]:
+            cur.execute("INSERT INTO filelist VALUES (?, ?, ?, ?)",
+                        (pkgKey, dirname, filenames,
+                         'f' * (filenames.count('/') + 1)))
+    conn.commit()
+    return conn
+
+class _SackTests(unittest.TestCase):
+    """ Sacks with real primary and filelists MD, only populate() (ie.
+        getting the filelists MD) is faked. self.data has the
+        (pkgKey => name, pkgKey => [(dirname, filenames)]) for each repo. """
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    cache_size = 0
+
+    def _sack(self):
+        sack = YumSqlitePackageSack(YumAvailablePackageSqlite,
+                                    cache_size=self.cache_size)
+        for repo in self.repos:
+            repo.sack = sack
+            sack.primarydb[repo] = _primary(repo.repoXML.csum,
+                                            self.data[repo][0])
+            sack.added[repo] = ['metadata']
+        def populate(repo, mdtype):
+            self.populated.append(repo.id)
+            sack.filelistsdb[repo] = _filelists(repo.repoXML.csum,
+                                                self.data[repo][1])
+            sack.added[repo].append(mdtype)
+        sack.populate = populate
+        return sack
+
+class FileCacheTests(_SackTests):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        os.mkdir(self.tmpdir + '/gen')
+        self.repo = FakeRepo(self.tmpdir, 'csum1')
+        self.repos = [self.repo]
+        self.data = {self.repo : ({1 : 'foo', 2 : 'foo-libs', 3 : 'foo-doc'},
+                                  {1 : [('/usr/bin', 'foo')],
+                                   2 : [('/usr/bin', 'foo'),
+                                        ('/usr/lib', 'libfoo.so')],
+                                   3 : [('/usr/share', 'foo')]})}
+        self.populated = []
+
+    def _search(self, sack, name):
+        return sorted([po.name for po in sack._search_files_pcache(name)])
+
+    def testSaved(self):
+        sack = self._sack()
+        self.assertEquals(self._search(sack, '/usr/bin/foo'),
+                          ['foo', 'foo-libs'])
+        self.assertEquals(self._search(sack, '/usr/share/foo/'), ['foo-doc'])
+        self.assertEquals(self._search(sack, '/usr/bin/bar'), [])
+        self.assertEquals(self.populated, ['fake'])
+        sack.close()
+        self.assertTrue(os.path.exists(self.tmpdir + '/gen/file-cache.sqlite'))
+
+        # A new run doesn't need the filelists for those paths, even the one
+        # that nothing has.
+        self.populated = []
+        sack = self._sack()
+        self.assertEquals(self._search(sack, '/usr/bin/foo'),
+                          ['foo', 'foo-libs'])
+        self.assertEquals(self._search(sack, '/usr/share/foo'), ['foo-doc'])
+        self.assertEquals(self._search(sack, '/usr/bin/bar'), [])
+        self.assertEquals(self.populated, [])
+
+        # ...but a new path does.
+        self.assertEquals(self._search(sack, '/usr/lib/libfoo.so'),
+                          ['foo-libs'])
+        self.assertEquals(self.populated, ['fake'])
+        sack.close()
+
+    def testRepodataChanged(self):
+        sack = self._sack()
+        self.assertEquals(self._search(sack, '/usr/bin/foo'),
+                          ['foo', 'foo-libs'])
+        sack.close()
+
+        self.repo.repoXML = FakeRepoXML('csum2')
+        self.data[self.repo] = ({4 : 'bar'}, {4 : [('/usr/bin', 'foo')]})
+        self.populated = []
+        sack = self._sack()
+        self.assertEquals(self._search(sack, '/usr/bin/foo'), ['bar'])
+        self.assertEquals(self.populated, ['fake'])
+        sack.close()
+
+    def testExcluded(self):
+        sack = self._sack()
+        sack.addPackageExcluder(None, None, 'exclude.name.eq', 'foo-libs')
+        self.assertEquals(self._search(sack, '/usr/bin/foo'), ['foo'])
+        sack.close()
+
+    def testDisabled(self):
+        self.repo.prco_cache = False
+        sack = self._sack()
+        self.assertEquals(self._search(sack, '/usr/bin/foo'),
+                          ['foo', 'foo-libs'])
+        sack.close()
+        self.assertFalse(os.path.exists(self.tmpdir +
+                                        '/gen/file-cache.sqlite'))
+
+    def testBounded(self):
+        self.cache_size = 3
+        sack = self._sack()
+        for name in ('/usr/bin/foo', '/usr/share/foo', '/usr/bin/bar'):
+            self._search(sack, name)
+        fcache = sack._file_pcache_load(self.repo)
+        self.assertEquals(fcache.size, 3)
+        self.assertEquals(list(fcache.iteritems()),
+                          [('/usr/share/foo', [3]), ('/usr/bin/bar', [])])
+        self.assertEquals(fcache.evictions, 1)
+        self.assertEquals(misc.cache_stats()['sqlite.file-pcache']['maxsize'],
+                          3)
+        self.assertEquals(self._search(sack, '/usr/bin/foo'),
+                          ['foo', 'foo-libs'])
+        sack.close()
+
+        #  Only what was left in memory is saved, and the saved lookups are
+        # bounded when they are loaded too.
+        self.cache_size = 1
+        sack = self._sack()
+        fcache = sack._file_pcache_load(self.repo)
+        self.assertEquals(list(fcache.iteritems()),
+                          [('/usr/bin/foo', [1, 2])])
+        sack.close()
+
+class OnDemandTests(_SackTests):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.repos = []
+        self.data = {}
+        for (num, ondemand) in ((1, True), (2, False)):
+            os.makedirs('%s/%d/gen' % (self.tmpdir, num))
+            repo = FakeRepo('%s/%d' % (self.tmpdir, num), 'csum1')
+            repo.id = 'repo%d' % num
+            repo.filelists_on_demand = ondemand
+            self.repos.append(repo)
+        self.data[self.repos[0]] = ({1 : 'foo'},
+                                    {1 : [('/usr/lib', 'foo')]})
+        self.data[self.repos[1]] = ({2 : 'foo', 3 : 'bar'},
+                                    {2 : [('/usr/lib', 'foo/fop')],
+                                     3 : [('/usr/lib', 'bar')]})
+        self.populated = []
+
+    def _search(self, sack, name):
+        return sorted([(po.repo.id, po.name) for po in sack.searchFiles(name)])
+
+    def testExact(self):
+        sack = self._sack()
+        self.assertEquals(self._search(sack, '/usr/lib/foo'),
+                          [('repo1', 'foo'), ('repo2', 'foo')])
+        self.assertEquals(sorted(self.populated), ['repo1', 'repo2'])
+        self.assertEquals(self._search(sack, '/usr/lib/bar'),
+                          [('repo2', 'bar')])
+        self.assertEquals(sorted(self.populated), ['repo1', 'repo2'])
+        sack.close()
+
+        # The on demand repo. remembers what it found.
+        self.populated = []
+        sack = self._sack()
+        self.assertEquals(self._search(sack, '/usr/lib/foo'),
+                          [('repo1', 'foo'), ('repo2', 'foo')])
+        self.assertEquals(self.populated, ['repo2'])
+        sack.close()
+
+    def testGlob(self):
+        sack = self._sack()
+        self.assertEquals(self._search(sack, '/usr/lib/f*'),
+                          [('repo1', 'foo'), ('repo2', 'foo')])
+        self.assertEquals(sorted(self.populated), ['repo1', 'repo2'])
+        sack.close()
+
+    def testGlobAfterExact(self):
+        for repo in self.repos:
+            repo.filelists_on_demand = True
+        sack = self._sack()
+        self.assertEquals(self._search(sack, '/usr/lib/foo'),
+                          [('repo1', 'foo'), ('repo2', 'foo')])
+        sack.close()
+
+        #  Only repo1's repodata changed, so the exact lookup only loads its
+        # filelists ... but the glob still needs repo2's.
+        self.repos[0].repoXML = FakeRepoXML('csum2')
+        self.populated = []
+        sack = self._sack()
+        self.assertEquals(self._search(sack, '/usr/lib/foo'),
+                          [('repo1', 'foo'), ('repo2', 'foo')])
+        self.assertEquals(self.populated, ['repo1'])
+        self.assertEquals(self._search(sack, '/usr/lib/f*'),
+                          [('repo1', 'foo'), ('repo2', 'foo')])
+        self.assertEquals(sorted(self.populated), ['repo1', 'repo2'])
+        sack.close()
@@ -0,0 +1,100 @@
+import unittest
+import tempfile
+import shutil
+import os
+import settestpath
+
+from yum.sqlutils import sqlite
+from yum.sqlitesack import _filelists_index, _filelists_index_search
+
+#  pkgKey => [(dirname, filenames)], in the same format as the filelist table
+# in filelists.sqlite
+_files = {1 : [('/usr/bin', 'foo'),
+               ('/usr/lib64', 'libfoo.so.1/libfoo.so.1.2'),
+               ('/usr/share/doc/foo', 'COPYING/README')],
+          2 : [('/usr/lib64', 'libfoo.so'),
+               ('/usr/include', 'foo.h'),
+               ('/usr/share/doc/foo-devel', 'COPYING')],
+          3 : [('/', 'bin'),
+               ('/usr/bin', 'bar/baz-foo'),
+               ('/usr/lib/bar', 'bar.so')]}
+
+class FakeRepo:
+    def __init__(self, cachedir):
+        self.cachedir = cachedir
+
+class FilelistsIndexTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        os.mkdir(self.tmpdir + '/gen')
+        self.repo = FakeRepo(self.tmpdir)
+        self.fconn = self._filelists('csum1', _files)
+        self.index = _filelists_index(self.repo, self.fconn)
+
+    def tearDown(self):
+        self.index.close()
+        self.fconn.close()
+        shutil.rmtree(self.tmpdir)
+
+    def _filelists(self, csum, files):
+        conn = sqlite.connect(':memory:')
+        cur = conn.cursor()
+        cur.execute("CREATE TABLE db_info (dbversion INTEGER, checksum TEXT)")
+        cur.execute("INSERT INTO db_info VALUES (10, ?)", (csum,))
+        cur.execute("""CREATE TABLE filelist (pkgKey INTEGER, dirname TEXT,
+                       filenames TEXT, filetypes TEXT)""")
+        for pkgKey in files:
+            for (dirname, filenames) in files[pkgKey]:
+                cur.execute("INSERT INTO filelist VALUES (?, ?, ?, ?)",
+                            (pkgKey, dirname, filenames,
+                             'f' * (filenames.count('/') + 1)))
+        conn.commit()
+        return conn
+
+    def _search(self, name, glob=True):
+        return sorted(_filelists_index_search(self.index, name, glob))
+
+    def testExact(self):
+        self.assertEquals(self._search('/usr/bin/foo'), [1])
+        self.assertEquals(self._search('/usr/lib64/libfoo.so.1.2'), [1])
+        self.assertEquals(self._search('/usr/bin/baz-foo'), [3])
+        self.assertEquals(self._search('/bin'), [3])
+        self.assertEquals(self._search('/usr/bin'), [])
+        self.assertEquals(self._search('/usr/bin/fo'), [])
+
+    def testStrict(self):
+        self.assertEquals(self._search('/usr/bin/*', glob=False), [])
+
+    def testDirnameGlob(self):
+        self.assertEquals(self._search('/usr/share/doc/*/COPYING'), [1, 2])
+        self.assertEquals(self._search('*/foo.h'), [2])
+        self.assertEquals(self._search('/usr/sbin/*/foo'), [])
+
+    def testBasenameGlob(self):
+        self.assertEquals(self._search('*/libfoo.so*'), [1, 2])
+        self.assertEquals(self._search('/usr/lib64/libfoo.so.?'), [1])
+        self.assertEquals(self._search('*bin/*foo'), [1, 3])
+        self.assertEquals(self._search('*/*.so'), [2, 3])
+        self.assertEquals(self._search('/usr/lib/*/*.so'), [3])
+        self.assertEquals(self._search('*/[Rr]EADME'), [1])
+        self.assertEquals(self._search('*/*o[.-]*'), [1, 2])
+        self.assertEquals(self._search('/usr/*/COPYING*'), [1, 2])
+
+    def testChecksum(self):
+        self.assertTrue(os.path.exists(self.tmpdir +
+                                       '/gen/filelists-index.sqlite'))
+
+        # Same checksum, so the filelists aren't looked at.
+        self.index.close()
+        self.index = _filelists_index(self.repo, self._filelists('csum1', {}))
+        self.assertEquals(self._search('/usr/bin/foo'), [1])
+
+        # New checksum, so it's rebuilt.
+        self.index.close()
+        self.index = _filelists_index(self.repo,
+                                      self._filelists('csum2',
+                                                      {4 : [('/usr/bin',
+                                                             'foo')]}))
+        self.assertEquals(self._search('/usr/bin/foo'), [4])
+        self.assertEquals(self._search('/usr/include/foo.h'), [])
@@ -0,0 +1,195 @@
+#! /usr/bin/python -tt
+
+# Benchmark writing the history for a large transaction: beg() with the
+# transaction members, the rpmdb/yumdb sync done by verifyTransaction() and
+# end(). Each run is done in a new process, with a new history DB. To compare
+# against another version of yum, point --baseline at a checkout of it, Eg.
+# git worktree add /tmp/yum-old HEAD~1
+# ./history-bench.py --baseline=/tmp/yum-old
+# ./history-bench.py --packages=3000 --wal -o res.json
+
+import os
+import sys
+import time
+import shutil
+import tempfile
+import subprocess
+from optparse import OptionParser, SUPPRESS_HELP
+
+_phases = ['beg', 'sync', 'end']
+
+class _BenchYumDB(dict):
+    """ Just enough of a yumdb for history. """
+    def __getattr__(self, attr):
+        try:
+            return self[attr]
+        except KeyError:
+            raise AttributeError, attr
+
+def gen_pkgs(num_pkgs):
+    """ Make num_pkgs installed looking pkgs, with the rpmdb and yumdb data
+        history saves for each. """
+    from testbase import FakePackage, FakeRepo
+    repo = FakeRepo('bench')
+    pkgs = []
+    for num in range(num_pkgs):
+        po = FakePackage('pkg%d' % num, '%d.%d' % (num % 10, num % 31),
+                         '%d.fc20' % (num % 40), '0', 'x86_64', repo=repo)
+        po.checksum_type = 'sha256'
+        po.pkgId = '%064x' % num
+        for attr in ('buildhost', 'license', 'packager', 'sourcerpm',
+                     'url', 'vendor'):
+            setattr(po, attr, '%s-%s' % (po.name, attr))
+        po.buildtime = 1400000000 + num
+        po.packagesize = 1024 * num
+        po.yumdb_info = _BenchYumDB(checksum_type='sha256',
+                                    checksum_data='%064x' % num,
+                                    from_repo='bench',
+                                    from_repo_revision='1400000000',
+                                    from_repo_timestamp='1400000000',
+                                    installed_by='0', reason='user',
+                                    releasever='20',
+                                    command_line='install pkg%d' % num)
+        pkgs.append(po)
+    return pkgs
+
+def child(tree, num_pkgs, wal):
+    """ Write the history for a transaction of num_pkgs installs, with yum
+        from tree (or this checkout), and print the results as JSON. """
+    import settestpath
+    if tree:
+        sys.path.insert(0, tree)
+    import yum
+    import yum.history
+    from yum.transactioninfo import TransactionMember
+    from yum.constants import TS_INSTALL
+
+    pkgs = gen_pkgs(num_pkgs)
+    txmbrs = []
+    for po in pkgs:
+        txmbr = TransactionMember(po)
+        txmbr.output_state = TS_INSTALL
+        txmbr.reason = 'user'
+        txmbrs.append(txmbr)
+
+    tmpdir = tempfile.mkdtemp(prefix='yum-history-bench-')
+    try:
+        kwargs = {}
+        if wal:
+            kwargs['wal'] = True
+        history = yum.history.YumHistory(root='/', db_path=tmpdir, **kwargs)
+
+        res = {}
+        beg = time.time()
+        history.beg('%d:bench' % num_pkgs, pkgs[:3], txmbrs,
+                    cmdline='install bench')
+        res['beg'] = time.time() - beg
+
+        beg = time.time()
+        if hasattr(history, 'commit'):
+            for po in pkgs:
+                history.sync_alldb(po, commit=False)
+            history.commit()
+        else:
+            for po in pkgs:
+                history.sync_alldb(po)
+        res['sync'] = time.time() - beg
+
+        beg = time.time()
+        history.end('%d:bench' % num_pkgs, 0)
+        history.close()
+        res['end'] = time.time() - beg
+
+        #  Make sure it's all there, this is done after close() so it's the
+        # same thing older sqlite/non-root users would see.
+        history = yum.history.YumHistory(root='/', db_path=tmpdir)
+        old = history.last()
+        assert len(old.trans_data) == num_pkgs
+        assert old.trans_data[0].yumdb_info.from_repo == 'bench'
+        history.close()
+    finally:
+        shutil.rmtree(tmpdir)
+
+    import json
+    res['version'] = yum.__version__
+    res['path'] = os.path.dirname(yum.__file__)
+    print json.dumps(res)
+
+def run(tree, num_pkgs, wal):
+    """ Run the benchmark in a new process, return the results. """
+    cmd = [sys.executable, os.path.abspath(__file__), '--child',
+           '--packages=%d' % num_pkgs]
+    if tree:
+        cmd.append('--baseline=' + tree)
+    if wal:
+        cmd.append('--wal')
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE,
+                            cwd=os.path.dirname(os.path.abspath(__file__)))
+    out = proc.communicate()[0]
+    if proc.returncode:
+        print >> sys.stderr, "Failed:", tree or 'current'
+        sys.exit(1)
+    import json
+    return json.loads(out.splitlines()[-1])
+
+def main():
+    parser = OptionParser(usage="%prog [options]")
+    parser.add_option("--packages", type="int", default=3000,
+                      help="number of packages in the transaction")
+    parser.add_option("--runs", type="int", default=3)
+    parser.add_option("--wal", action="store_true", default=False,
+                      help="also run with history_wal")
+    parser.add_option("--baseline",
+                      help="a yum checkout to compare against")
+    parser.add_option("-o", "--output", help="write the results as JSON")
+    parser.add_option("--child", action="store_true", default=False,
+                      help=SUPPRESS_HELP)
+    (opts, args) = parser.parse_args()
+
+    if opts.child:
+        child(opts.baseline, opts.packages, opts.wal)
+        return
+
+    trees = [('current', None, False)]
+    if opts.wal:
+        trees.append(('current-wal', None, True))
+    if opts.baseline:
+        trees.insert(0, ('baseline', opts.baseline, False))
+
+    results = {}
+    for (name, tree, wal) in trees:
+        #  Best of the runs, as this is mostly waiting for the disk.
+        best = None
+        for num in range(opts.runs):
+            res = run(tree, opts.packages, wal)
+            res['total'] = sum([res[phase] for phase in _phases])
+            if best is None or res['total'] < best['total']:
+                best = res
+        results[name] = best
+
+    print "Packages:", opts.packages, "Runs:", opts.runs
+    print "%-12s %9s %9s %9s %9s" % ("", "beg", "sync", "end", "total")
+    for (name, tree, wal) in trees:
+        res = results[name]
+        print "%-12s %8.3fs %8.3fs %8.3fs %8.3fs" % (name, res['beg'],
+                                                     res['sync'], res['end'],
+                                                     res['total'])
+    if opts.baseline:
+        old = results['baseline']['total']
+        for (name, tree, wal) in trees[1:]:
+            new = results[name]['total']
+            print "%-12s speedup: %.2fx" % (name, old / max(new, 0.000001))
+
+    if opts.output:
+        import json
+        data = {'python' : sys.version.split()[0],
+                'timestamp' : int(time.time()),
+                'packages' : opts.packages, 'runs' : opts.runs,
+                'results' : results}
+        fo = open(opts.output, 'w')
+        json.dump(data, fo, indent=2, sort_keys=True)
+        fo.write('\n')
+        fo.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+import unittest
+import tempfile
+import shutil
+import os
+import settestpath
+
+from testbase import FakePackage, FakeRepo
+import yum.history
+from yum.sqlutils import sqlite
+from yum.transactioninfo import TransactionMember
+from yum.constants import TS_INSTALL
+
+class FakeYumDB(dict):
+    def __getattr__(self, attr):
+        try:
+            return self[attr]
+        except KeyError:
+            raise AttributeError, attr
+
+class HistoryWriteTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        repo = FakeRepo('fake')
+        self.pkgs = []
+        for num in range(5):
+            po = FakePackage('foo%d' % num, '1', '1', '0', 'noarch', repo=repo)
+            po.checksum_type = 'sha256'
+            po.pkgId = '%064x' % num
+            po.license = 'GPL%d' % num
+            po.yumdb_info = FakeYumDB(from_repo='fake', reason='user')
+            self.pkgs.append(po)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def _write(self, history):
+        txmbrs = []
+        for po in self.pkgs:
+            txmbr = TransactionMember(po)
+            txmbr.output_state = TS_INSTALL
+            txmbrs.append(txmbr)
+        history.beg('5:abcd', self.pkgs[:1], txmbrs,
+                    skip_packages=self.pkgs[3:], cmdline='install foo')
+        for po in self.pkgs:
+            self.assertTrue(history.sync_alldb(po, commit=False))
+        history.commit()
+        history.end('5:ef01', 0)
+        history.close()
+
+    def _check(self):
+        history = yum.history.YumHistory(root='/', db_path=self.tmpdir)
+        old = history.last()
+        self.assertEquals(old.beg_rpmdbversion, '5:abcd')
+        self.assertEquals(old.end_rpmdbversion, '5:ef01')
+        self.assertEquals([hpkg.name for hpkg in old.trans_with], ['foo0'])
+        self.assertEquals(sorted([hpkg.name for hpkg in old.trans_skip]),
+                          ['foo3', 'foo4'])
+        self.assertEquals(len(old.trans_data), 5)
+        for hpkg in old.trans_data:
+            self.assertEquals(hpkg.state, 'Install')
+            self.assertEquals(hpkg.license, 'GPL' + hpkg.name[3:])
+            self.assertEquals(hpkg.yumdb_info.from_repo, 'fake')
+            self.assertEquals(hpkg.yumdb_info.reason, 'user')
+        history.close()
+
+    def testWrite(self):
+        self._write(yum.history.YumHistory(root='/', db_path=self.tmpdir))
+        self._check()
+
+    def testWAL(self):
+        history = yum.history.YumHistory(root='/', db_path=self.tmpdir,
+                                         wal=True)
+        cur = history._get_cursor()
+        cur.execute("PRAGMA journal_mode")
+        self.assertEquals(cur.fetchone()[0].lower(), 'wal')
+        self._write(history)
+
+        # It's back to a normal journal after close().
+        history = yum.history.YumHistory(root='/', db_path=self.tmpdir)
+        cur = history._get_cursor()
+        cur.execute("PRAGMA journal_mode")
+        self.assertEquals(cur.fetchone()[0].lower(), 'delete')
+        history.close()
+        self.assertFalse(os.path.exists(history._db_file + '-wal'))
+        self._check()
+
+    def _sync_failing(self, fail):
+        """ Sync. the pkgs. again with new yumdb data, where saving it for
+            foo2 fails with fail(). """
+        self._write(yum.history.YumHistory(root='/', db_path=self.tmpdir))
+        for po in self.pkgs:
+            po.yumdb_info = FakeYumDB(from_repo='updates', reason='dep')
+        history = yum.history.YumHistory(root='/', db_path=self.tmpdir)
+        save_yumdb = history._save_yumdb
+        def _save_yumdb(ipkg, pid=None):
+            if ipkg.name == 'foo2':
+                return fail()
+            return save_yumdb(ipkg, pid)
+        history._save_yumdb = _save_yumdb
+        for po in self.pkgs:
+            if po.name != 'foo2':
+                self.assertTrue(history.sync_alldb(po, commit=False))
+                continue
+            try:
+                self.assertFalse(history.sync_alldb(po, commit=False))
+            except sqlite.OperationalError:
+                pass
+        history.commit()
+        history.close()
+
+        #  The old data for foo2 is still there, everything else has the new
+        # data.
+        history = yum.history.YumHistory(root='/', db_path=self.tmpdir)
+        for hpkg in history.last().trans_data:
+            expected = ('updates', 'dep')
+            if hpkg.name == 'foo2':
+                expected = ('fake', 'user')
+            self.assertEquals((hpkg.yumdb_info.from_repo,
+                               hpkg.yumdb_info.reason), expected)
+            self.assertEquals(hpkg.license, 'GPL' + hpkg.name[3:])
+        history.close()
+
+    def testSyncFailed(self):
+        self._sync_failing(lambda: False)
+
+    def testSyncError(self):
+        def fail():
+            raise sqlite.OperationalError, "disk I/O error"
+        self._sync_failing(fail)
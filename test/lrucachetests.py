@@ -0,0 +1,106 @@
+import unittest
+import settestpath
+
+from yum import misc
+
+class LRUCacheTests(unittest.TestCase):
+
+    def testUnbounded(self):
+        cache = misc.LRUCache('test.unbounded')
+        for num in range(1000):
+            cache[num] = str(num)
+        self.assertEquals(len(cache), 1000)
+        self.assertEquals(cache.evictions, 0)
+        self.assertEquals(cache[0], '0')
+
+    def testEvictOldest(self):
+        cache = misc.LRUCache('test.evict', 3)
+        cache['a'] = 1
+        cache['b'] = 2
+        cache['c'] = 3
+        cache.get('a') # Now 'b' is the oldest
+        cache['d'] = 4
+        self.assertTrue('a' in cache)
+        self.assertFalse('b' in cache)
+        self.assertTrue('c' in cache)
+        self.assertTrue('d' in cache)
+        self.assertEquals(cache.evictions, 1)
+        self.assertEquals(cache.size, 3)
+
+    def testReplace(self):
+        cache = misc.LRUCache('test.replace', 2)
+        cache['a'] = 1
+        cache['b'] = 2
+        cache['a'] = 3 # Now 'b' is the oldest
+        cache['c'] = 4
+        self.assertEquals(cache.get('a'), 3)
+        self.assertEquals(cache.get('b'), None)
+        self.assertEquals(len(cache), 2)
+
+    def testSizeFunc(self):
+        cache = misc.LRUCache('test.sizefunc', 10, lambda val: len(val))
+        cache['a'] = [1] * 4
+        cache['b'] = [1] * 4
+        self.assertEquals(cache.size, 8)
+        cache['c'] = [1] * 4
+        self.assertFalse('a' in cache)
+        self.assertEquals(cache.size, 8)
+
+        # Too big for the cache on its own, but the newest is always kept.
+        cache['d'] = [1] * 20
+        self.assertEquals(len(cache), 1)
+        self.assertEquals(cache.size, 20)
+        self.assertEquals(cache.evictions, 3)
+
+    def testPop(self):
+        cache = misc.LRUCache('test.pop', 2)
+        cache['a'] = 1
+        cache['b'] = 2
+        self.assertEquals(cache.pop('a'), 1)
+        self.assertEquals(cache.pop('a', None), None)
+        self.assertRaises(KeyError, cache.pop, 'a')
+        del cache['b']
+        self.assertEquals(len(cache), 0)
+        self.assertEquals(cache.size, 0)
+        cache['c'] = 3
+        cache['d'] = 4
+        self.assertEquals(cache.evictions, 0)
+
+    def testIterItems(self):
+        cache = misc.LRUCache('test.iteritems', 3)
+        cache['a'] = 1
+        cache['b'] = 2
+        cache['c'] = 3
+        cache.get('a')
+        self.assertEquals(list(cache.iteritems()),
+                          [('b', 2), ('c', 3), ('a', 1)])
+        self.assertEquals(cache.hits, 1)
+
+    def testCounters(self):
+        cache = misc.LRUCache('test.counters', 1)
+        self.assertRaises(KeyError, cache.__getitem__, 'a')
+        cache['a'] = 1
+        cache['a']
+        cache.get('a')
+        cache.get('b')
+        'b' in cache # Doesn't count
+        cache['b'] = 2
+        cache.clear()
+        self.assertEquals(len(cache), 0)
+        self.assertEquals(cache.stats(), {'entries' : 0, 'size' : 0,
+                                          'maxsize' : 1, 'hits' : 2,
+                                          'misses' : 2, 'evictions' : 1})
+
+    def testCacheStats(self):
+        one = misc.LRUCache('test.stats')
+        two = misc.LRUCache('test.stats', 5)
+        one['a'] = 1
+        one.get('a')
+        two['a'] = 1
+        two['b'] = 2
+        two.get('c')
+        stats = misc.cache_stats()['test.stats']
+        self.assertEquals(stats['caches'], 2)
+        self.assertEquals(stats['entries'], 3)
+        self.assertEquals(stats['hits'], 1)
+        self.assertEquals(stats['misses'], 1)
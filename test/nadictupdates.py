@@ -0,0 +1,266 @@
+# The old (n, a) dict based doUpdates() and doObsoletes() from
+# rpmUtils.updates, which the sorted versions there replaced. They are kept
+# here so updatestests.py and updates-bench.py can check the new ones against
+# them.
+
+import rpmUtils
+import rpmUtils.miscutils
+import rpmUtils.arch
+import rpmUtils.updates
+
+class NADictUpdates(rpmUtils.updates.Updates):
+    """ rpmUtils.updates.Updates, but with the old doUpdates() and
+        doObsoletes(). """
+
+    def doObsoletes(self):
+        """figures out what things available obsolete things installed, returns
+           them in a dict attribute of the class."""
+
+        obsdict = {} # obseleting package -> [obsoleted package]
+        # this needs to keep arch in mind
+        # if foo.i386 obsoletes bar
+        # it needs to obsoletes bar.i386 preferentially, not bar.x86_64
+        # if there is only one bar and only one foo then obsolete it, but try to
+        # match the arch.
+        
+        # look through all the obsoleting packages look for multiple archs per name
+        # if you find it look for the packages they obsolete
+        # 
+        obs_arches = {}
+        for (n, a, e, v, r) in self.rawobsoletes:
+            if n not in obs_arches:
+                obs_arches[n] = []
+            obs_arches[n].append(a)
+
+        for pkgtup in self.rawobsoletes:
+            (name, arch, epoch, ver, rel) = pkgtup
+            for (obs_n, flag, (obs_e, obs_v, obs_r)) in self.rawobsoletes[(pkgtup)]:
+                if (obs_n, None) in self.installdict:
+                    for (rpm_a, rpm_e, rpm_v, rpm_r) in self.installdict[(obs_n, None)]:
+                        if flag in [None, 0] or \
+                                rpmUtils.miscutils.rangeCheck((obs_n, flag, (obs_e, obs_v, obs_r)),
+                                                              (obs_n, rpm_a, rpm_e, rpm_v, rpm_r)):
+                            # make sure the obsoleting pkg is not already installed
+                            willInstall = 1
+                            if (name, None) in self.installdict:
+                                for (ins_a, ins_e, ins_v, ins_r) in self.installdict[(name, None)]:
+                                    pkgver = (epoch, ver, rel)
+                                    installedver = (ins_e, ins_v, ins_r)
+                                    if self.returnNewest((pkgver, installedver)) == installedver:
+                                        willInstall = 0
+                                        break
+                            if rpm_a != arch and rpm_a in obs_arches[name]:
+                                willInstall = 0
+                            if willInstall:
+                                if pkgtup not in obsdict:
+                                    obsdict[pkgtup] = []
+                                obsdict[pkgtup].append((obs_n, rpm_a, rpm_e, rpm_v, rpm_r))
+        self.obsoletes = obsdict
+        self.makeObsoletedDict()
+
+    def doUpdates(self):
+        """check for key lists as populated then commit acts of evil to
+           determine what is updated and/or obsoleted, populate self.updatesdict
+           Note that this thins out self.availdict.
+        """
+        
+        
+        # best bet is to chew through the pkgs and throw out the new ones early
+        # then deal with the ones where there are a single pkg installed and a 
+        # single pkg available
+        # then deal with the multiples
+
+        # we should take the whole list as a 'newlist' and remove those entries
+        # which are clearly:
+        #   1. updates 
+        #   2. identical to the ones in ourdb
+        #   3. not in our archdict at all
+        
+        simpleupdate = []
+        complexupdate = []
+        
+        updatedict = {} # (old n, a, e, v, r) : [(new n, a, e, v, r)]
+                        # make the new ones a list b/c while we _shouldn't_
+                        # have multiple updaters, we might and well, it needs
+                        # to be solved one way or the other <sigh>
+        newpkgs = self.availdict
+        
+        archlist = self._archlist 
+        for (n, a) in newpkgs.keys():
+            if a not in archlist:
+                # high log here
+                del newpkgs[(n, a)]
+                continue
+
+        # remove the older stuff - if we're doing an update we only want the
+        # newest evrs                
+        for (n, a) in newpkgs:
+            (new_e,new_v,new_r) = self.returnNewest(newpkgs[(n, a)])
+            for (e, v, r) in newpkgs[(n, a)][:]:
+                if (new_e, new_v, new_r) != (e, v, r):
+                    newpkgs[(n, a)].remove((e, v, r))
+
+        for (n, a) in newpkgs:
+            # simple ones - look for exact matches or older stuff
+            if (n, a) in self.installdict:
+                for (rpm_e, rpm_v, rpm_r) in self.installdict[(n, a)]:
+                    try:
+                        (e, v, r) = self.returnNewest(newpkgs[(n,a)])
+                    except rpmUtils.RpmUtilsError:
+                        continue
+                    else:
+                        rc = rpmUtils.miscutils.compareEVRKey((e, v, r), (rpm_e, rpm_v, rpm_r))
+                        if rc <= 0:
+                            try:
+                                newpkgs[(n, a)].remove((e, v, r))
+                            except ValueError:
+                                pass
+
+        # Now we add the (n, None) entries back...
+        for na in newpkgs.keys():
+            all_arches = map(lambda x: (na[1], x[0], x[1], x[2]), newpkgs[na])
+            newpkgs.setdefault((na[0], None), []).extend(all_arches)
+
+        # get rid of all the empty dict entries:
+        for nakey in newpkgs.keys():
+            if len(newpkgs[nakey]) == 0:
+                del newpkgs[nakey]
+
+
+        # ok at this point our newpkgs list should be thinned, we should have only
+        # the newest e,v,r's and only archs we can actually use
+        for (n, a) in newpkgs:
+            if a is None: # the None archs are only for lookups
+                continue
+    
+            if (n, None) in self.installdict:
+                installarchs = []
+                availarchs = []
+                for (a, e, v ,r) in newpkgs[(n, None)]:
+                    availarchs.append(a)
+                for (a, e, v, r) in self.installdict[(n, None)]:
+                    installarchs.append(a)
+
+                if len(availarchs) > 1 or len(installarchs) > 1:
+                    self.debugprint('putting %s in complex update' % n)
+                    complexupdate.append(n)
+                else:
+                    #log(4, 'putting %s in simple update list' % name)
+                    self.debugprint('putting %s in simple update' % n)
+                    simpleupdate.append((n, a))
+
+        # we have our lists to work with now
+    
+        # simple cases
+        for (n, a) in simpleupdate:
+            # try to be as precise as possible
+            if n in self.exactarchlist:
+                if (n, a) in self.installdict:
+                    (rpm_e, rpm_v, rpm_r) = self.returnNewest(self.installdict[(n, a)])
+                    if (n, a) in newpkgs:
+                        (e, v, r) = self.returnNewest(newpkgs[(n, a)])
+                        rc = rpmUtils.miscutils.compareEVRKey((e, v, r), (rpm_e, rpm_v, rpm_r))
+                        if rc > 0:
+                            # this is definitely an update - put it in the dict
+                            if (n, a, rpm_e, rpm_v, rpm_r) not in updatedict:
+                                updatedict[(n, a, rpm_e, rpm_v, rpm_r)] = []
+                            updatedict[(n, a, rpm_e, rpm_v, rpm_r)].append((n, a, e, v, r))
+    
+            else:
+                # we could only have 1 arch in our rpmdb and 1 arch of pkg 
+                # available - so we shouldn't have to worry about the lists, here
+                # we just need to find the arch of the installed pkg so we can 
+                # check it's (e, v, r)
+                (rpm_a, rpm_e, rpm_v, rpm_r) = self.installdict[(n, None)][0]
+                if (n, None) in newpkgs:
+                    for (a, e, v, r) in newpkgs[(n, None)]:
+                        rc = rpmUtils.miscutils.compareEVRKey((e, v, r), (rpm_e, rpm_v, rpm_r))
+                        if rc > 0:
+                            # this is definitely an update - put it in the dict
+                            if (n, rpm_a, rpm_e, rpm_v, rpm_r) not in updatedict:
+                                updatedict[(n, rpm_a, rpm_e, rpm_v, rpm_r)] = []
+                            updatedict[(n, rpm_a, rpm_e, rpm_v, rpm_r)].append((n, a, e, v, r))
+
+
+        # complex cases
+
+        # we're multilib/biarch
+        # we need to check the name.arch in two different trees
+        # one for the multiarch itself and one for the compat arch
+        # ie: x86_64 and athlon(i686-i386) - we don't want to descend
+        # x86_64->i686 
+        # however, we do want to descend x86_64->noarch, sadly.
+        
+        archlists = self._complexArchLists()
+            
+        for n in complexupdate:
+            for thisarchlist in archlists:
+                # we need to get the highest version and the archs that have it
+                # of the installed pkgs            
+                tmplist = []
+                for (a, e, v, r) in self.installdict[(n, None)]:
+                    tmplist.append((n, a, e, v, r))
+
+                highestinstalledpkgs = self.returnHighestVerFromAllArchsByName(n,
+                                         thisarchlist, tmplist)
+                hipdict = self.makeNADict(highestinstalledpkgs, 0)
+                                         
+                
+                if n in self.exactarchlist:
+                    tmplist = []
+                    for (a, e, v, r) in newpkgs[(n, None)]:
+                        tmplist.append((n, a, e, v, r))
+                    highestavailablepkgs = self.returnHighestVerFromAllArchsByName(n,
+                                             thisarchlist, tmplist)
+
+                    hapdict = self.makeNADict(highestavailablepkgs, 0)
+
+                    for (n, a) in hipdict:
+                        if (n, a) in hapdict:
+                            self.debugprint('processing %s.%s' % (n, a))
+                            # we've got a match - get our versions and compare
+                            (rpm_e, rpm_v, rpm_r) = hipdict[(n, a)][0] # only ever going to be first one
+                            (e, v, r) = hapdict[(n, a)][0] # there can be only one
+                            rc = rpmUtils.miscutils.compareEVRKey((e, v, r), (rpm_e, rpm_v, rpm_r))
+                            if rc > 0:
+                                # this is definitely an update - put it in the dict
+                                if (n, a, rpm_e, rpm_v, rpm_r) not in updatedict:
+                                    updatedict[(n, a, rpm_e, rpm_v, rpm_r)] = []
+                                updatedict[(n, a, rpm_e, rpm_v, rpm_r)].append((n, a, e, v, r))
+                else:
+                    self.debugprint('processing %s' % n)
+                    # this is where we have to have an arch contest if there
+                    # is more than one arch updating with the highest ver
+                    instarchs = []
+                    for (n,a) in hipdict:
+                        instarchs.append(a)
+                    
+                    rpm_a = rpmUtils.arch.getBestArchFromList(instarchs, myarch=self.myarch)
+                    if rpm_a is None:
+                        continue
+
+                    tmplist = []
+                    for (a, e, v, r) in newpkgs[(n, None)]:
+                        tmplist.append((n, a, e, v, r))
+                    highestavailablepkgs = self.returnHighestVerFromAllArchsByName(n,
+                                             thisarchlist, tmplist)
+
+                    hapdict = self.makeNADict(highestavailablepkgs, 0)
+                    availarchs = []
+                    for (n,a) in hapdict:
+                        availarchs.append(a)
+                    a = rpmUtils.arch.getBestArchFromList(availarchs, myarch=self.myarch)
+                    if a is None:
+                        continue
+                        
+                    (rpm_e, rpm_v, rpm_r) = hipdict[(n, rpm_a)][0] # there can be just one
+                    (e, v, r) = hapdict[(n, a)][0] # just one, I'm sure, I swear!
+                    rc = rpmUtils.miscutils.compareEVRKey((e, v, r), (rpm_e, rpm_v, rpm_r))
+                    if rc > 0:
+                        # this is definitely an update - put it in the dict
+                        if (n, rpm_a, rpm_e, rpm_v, rpm_r) not in updatedict:
+                            updatedict[(n, rpm_a, rpm_e, rpm_v, rpm_r)] = []
+                        updatedict[(n, rpm_a, rpm_e, rpm_v, rpm_r)].append((n, a, e, v, r))
+                   
+        self.updatesdict = updatedict                    
+        self.makeUpdatingDict()
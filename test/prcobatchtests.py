@@ -0,0 +1,193 @@
+import unittest
+import tempfile
+import shutil
+import os
+import settestpath
+
+from yum.sqlutils import sqlite
+from yum.sqlitesack import YumSqlitePackageSack, YumAvailablePackageSqlite
+from yum.packageSack import MetaSack
+from yum.depsolve import Depsolve
+
+class FakeData:
+    def __init__(self, csum):
+        self.checksum = ('sha256', csum)
+
+class FakeRepoXML:
+    def __init__(self, csum):
+        self.csum = csum
+
+    def getData(self, mdtype):
+        return FakeData(self.csum)
+
+class FakeRepo:
+    def __init__(self, repoid, cachedir, prco_cache=True):
+        self.id = repoid
+        self.cachedir = cachedir
+        self.prco_cache = prco_cache
+        self.repoXML = FakeRepoXML(repoid + '-csum')
+
+def _primary(csum, pkgs):
+    """ Make a primary MD with pkgKey => (name, version, provides, requires)
+        pkgs, where the provides/requires are (name, flags, version). """
+    conn = sqlite.connect(':memory:')
+    conn.row_factory = sqlite.Row
+    cur = conn.cursor()
+    cur.execute("CREATE TABLE db_info (dbversion INTEGER, checksum TEXT)")
+    cur.execute("INSERT INTO db_info VALUES (10, ?)", (csum,))
+    cur.execute("""CREATE TABLE packages (pkgKey INTEGER PRIMARY KEY,
+                   pkgId TEXT, name TEXT, arch TEXT, epoch TEXT,
+                   version TEXT, release TEXT)""")
+    for prcotype in ('provides', 'requires'):
+        cur.execute("""CREATE TABLE %s (name TEXT, flags TEXT, epoch TEXT,
+                       version TEXT, release TEXT, pkgKey INTEGER)""" %
+                    prcotype)
+    for pkgKey in sorted(pkgs):
+        (name, version, provides, requires) = pkgs[pkgKey]
+        cur.execute("INSERT INTO packages VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (pkgKey, '%s-%d' % (csum, pkgKey), name,
+                     'noarch', '0', version, '1'))
+        provides = provides + [(name, 'EQ', version)]
+        for (prcotype, prcos) in (('provides', provides),
+                                  ('requires', requires)):
+            for (n, f, v) in prcos:
+                e = r = None
+                if v is not None:
+                    (e, r) = ('0', '1')
+                cur.execute("INSERT INTO %s VALUES (?, ?, ?, ?, ?, ?)" %
+                            prcotype, (n, f, e, v, r, pkgKey))
+    conn.commit()
+    return conn
+
+_repo_pkgs = {'one' : {1 : ('foo', '1.0', [('libfoo.so.1', None, None)],
+                            [('bar', 'GE', '2.0')]),
+                       2 : ('foo', '2.0', [('libfoo.so.1', None, None),
+                                           ('libfoo.so.2', None, None)],
+                            [('bar', 'GE', '3.0')]),
+                       3 : ('bar', '2.0', [], [('libfoo.so.1', None, None)])},
+              'two' : {1 : ('bar', '3.0', [], [('libfoo.so.2', None, None)]),
+                       2 : ('baz', '1.0', [('foo', 'EQ', '1.5')],
+                            [('bar', None, None)])}}
+
+_reqs = [('foo', None, (None, None, None)),
+         ('foo', 'GE', ('0', '1.5', None)),
+         ('foo', 'LT', ('0', '1.5', '1')),
+         ('foo', 'EQ', ('0', '2.0', '1')),
+         ('bar', 'GT', ('0', '2.0', None)),
+         ('bar', None, (None, None, None)),
+         ('libfoo.so.1', None, (None, None, None)),
+         ('libfoo.so.2', None, (None, None, None)),
+         ('libfoo.so.3', None, (None, None, None)),
+         ('baz', 'GE', (None, '1.0', None))]
+
+def _norm(result):
+    """ Turn a pkg => hits dict. into something we can compare across
+        sacks. """
+    ret = {}
+    for pkg, hits in result.iteritems():
+        ret[(pkg.repo.id, pkg.pkgtup)] = sorted(hits)
+    return ret
+
+class PrcoBatchTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.prco_cache = True
+        self.cache_size = 0
+        self.excludes = []
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def _sack(self, repoid):
+        cachedir = self.tmpdir + '/' + repoid
+        if not os.path.exists(cachedir):
+            os.makedirs(cachedir + '/gen')
+        repo = FakeRepo(repoid, cachedir, self.prco_cache)
+        sack = YumSqlitePackageSack(YumAvailablePackageSqlite,
+                                    cache_size=self.cache_size)
+        repo.sack = sack
+        sack.primarydb[repo] = _primary(repo.repoXML.csum, _repo_pkgs[repoid])
+        sack.added[repo] = ['metadata']
+        for (name, ver) in self.excludes:
+            sack.addPackageExcluder(repoid, None, 'exclude.nevr.eq',
+                                    '%s-0:%s-1' % (name, ver))
+        return sack
+
+    def _metasack(self):
+        sack = MetaSack()
+        for repoid in sorted(_repo_pkgs):
+            sack.addSack(repoid, self._sack(repoid))
+        return sack
+
+    def _check(self, mksack):
+        for (multi, single) in (('getProvidesMultiple', 'getProvides'),
+                                ('getRequiresMultiple', 'getRequires')):
+            sack = mksack()
+            batch = getattr(sack, multi)(_reqs)
+            self.assertEquals(sorted(batch), sorted(_reqs))
+
+            # A new sack, so nothing is cached in memory from the batch.
+            sack = mksack()
+            for req in _reqs:
+                self.assertEquals(_norm(batch[req]),
+                                  _norm(getattr(sack, single)(*req)))
+
+            # ...the same sack, after the batch.
+            sack = mksack()
+            getattr(sack, multi)(_reqs)
+            for req in _reqs:
+                self.assertEquals(_norm(batch[req]),
+                                  _norm(getattr(sack, single)(*req)))
+
+            # ...and after dropping the cached data, which saves the lookups.
+            sack.dropCachedData()
+            for req in _reqs:
+                self.assertEquals(_norm(batch[req]),
+                                  _norm(getattr(sack, single)(*req)))
+
+    def testSqlite(self):
+        self._check(lambda: self._sack('one'))
+        self.assertTrue(os.path.exists(self.tmpdir +
+                                       '/one/gen/prco-cache.sqlite'))
+        self.assertEquals(sorted(_norm(self._sack('one').getProvidesMultiple(
+                                 _reqs[1:2])[_reqs[1]])),
+                          [('one', ('foo', 'noarch', '0', '2.0', '1'))])
+
+    def testNoPrcoCache(self):
+        self.prco_cache = False
+        self._check(lambda: self._sack('one'))
+        self.assertFalse(os.path.exists(self.tmpdir +
+                                        '/one/gen/prco-cache.sqlite'))
+
+    def testSmallCache(self):
+        self.cache_size = 1
+        self._check(lambda: self._sack('one'))
+
+    def testExcludes(self):
+        self.excludes = [('foo', '2.0')]
+        self._check(lambda: self._sack('one'))
+
+    def testMetaSack(self):
+        self._check(self._metasack)
+        self.excludes = [('bar', '3.0')]
+        self._check(self._metasack)
+
+    def testPrefetchWhatProvides(self):
+        reqs = [('foo', None, None), ('foo', 'GE', '1.5'), ('foo', 'LT', '1.5'),
+                ('bar', 'GT', '2.0'), ('libfoo.so.1', None, None),
+                ('libfoo.so.3', None, None)]
+        for req in reqs:
+            ds = Depsolve()
+            ds.pkgSack = self._metasack()
+            single = ds.whatProvides(*req).returnPackages()
+
+            ds = Depsolve()
+            ds.pkgSack = self._metasack()
+            ds._prefetchWhatProvides(reqs)
+            self.assertTrue(req in ds._whatprovides_prefetch)
+            batch = ds.whatProvides(*req).returnPackages()
+            self.assertEquals(sorted([(po.repo.id, po.pkgtup)
+                                      for po in batch]),
+                              sorted([(po.repo.id, po.pkgtup)
+                                      for po in single]))
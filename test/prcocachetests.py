@@ -0,0 +1,168 @@
+import unittest
+import tempfile
+import shutil
+import os
+import settestpath
+
+from yum import Errors
+from yum.sqlutils import sqlite
+from yum.sqlitesack import YumSqlitePackageSack, YumAvailablePackageSqlite
+from prcobatchtests import FakeRepo, FakeRepoXML, _primary, _repo_pkgs, _norm
+
+class NoDataRepoXML:
+    def getData(self, mdtype):
+        raise Errors.RepoMDError, "no %s" % mdtype
+
+_reqs = [('foo', None, (None, None, None)),
+         ('foo', 'GE', ('0', '1.5', None)),
+         ('libfoo.so.1', None, (None, None, None)),
+         ('libfoo.so.3', None, (None, None, None))]
+
+class PrcoCacheTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        os.mkdir(self.tmpdir + '/gen')
+        self.fname = self.tmpdir + '/gen/prco-cache.sqlite'
+        self.repo = FakeRepo('one', self.tmpdir)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def _sack(self):
+        sack = YumSqlitePackageSack(YumAvailablePackageSqlite)
+        self.repo.sack = sack
+        sack.primarydb[self.repo] = _primary(self.repo.repoXML.csum,
+                                             _repo_pkgs['one'])
+        sack.added[self.repo] = ['metadata']
+        return sack
+
+    def _lookup(self, sack, reqs=_reqs):
+        ret = {}
+        for req in reqs:
+            ret[req] = _norm(sack.getProvides(*req))
+        return ret
+
+    def _saved(self, reqs=_reqs):
+        """ The saved lookups that a new sack finds, for reqs. """
+        sack = self._sack()
+        pcache = sack._prco_pcache_load(self.repo)
+        ret = {}
+        for req in reqs:
+            tmp = pcache.get(('provides', req))
+            if tmp is not None:
+                ret[('provides', req)] = tmp
+        sack.close()
+        return ret
+
+    def _rows(self):
+        """ The number of (reqs, hits) rows in the saved DB. """
+        conn = sqlite.connect(self.fname)
+        ret = (conn.execute("SELECT COUNT(*) FROM reqs").fetchone()[0],
+               conn.execute("SELECT COUNT(*) FROM hits").fetchone()[0])
+        conn.close()
+        return ret
+
+    def testChecksum(self):
+        sack = self._sack()
+        self.assertEquals(sack._prco_pcache_checksum(self.repo),
+                          'primary_db:sha256:one-csum')
+        self.repo._xml2sqlite_local = True
+        self.assertEquals(sack._prco_pcache_checksum(self.repo),
+                          'primary:sha256:one-csum')
+        self.repo.repoXML = NoDataRepoXML()
+        self.assertEquals(sack._prco_pcache_checksum(self.repo), None)
+        self.repo.repoXML = FakeRepoXML('one-csum')
+        self.repo.prco_cache = False
+        self.assertEquals(sack._prco_pcache_checksum(self.repo), None)
+        sack.close()
+
+    def testRoundTrip(self):
+        sack = self._sack()
+        data = self._lookup(sack)
+        mem = dict(sack._prco_pcache_load(self.repo).mem.iteritems())
+        sack.close()
+        self.assertTrue(os.path.exists(self.fname))
+
+        self.assertEquals(sorted(self._saved().items()), sorted(mem.items()))
+        self.assertEquals(self._saved()[('provides', _reqs[1])],
+                          {2 : [('foo', 'EQ', ('0', '2.0', '1'))]})
+        self.assertEquals(self._saved()[('provides', _reqs[3])], {})
+
+        # The loaded lookups give the same results, without any SQL.
+        sack = self._sack()
+        sack.primarydb[self.repo].execute("DELETE FROM provides")
+        self.assertEquals(self._lookup(sack), data)
+        sack.close()
+
+    def testIncremental(self):
+        sack = self._sack()
+        self._lookup(sack, _reqs[:2])
+        sack.close()
+        self.assertEquals(self._rows(), (2, 3))
+
+        #  A new lookup is added to what was saved, and the old ones are only
+        # read as they are used.
+        sack = self._sack()
+        pcache = sack._prco_pcache_load(self.repo)
+        self._lookup(sack, _reqs[1:3])
+        self.assertEquals(sorted([key for key, tmp in pcache.mem.iteritems()]),
+                          [('provides', req) for req in sorted(_reqs[1:3])])
+        self.assertEquals(pcache.dirty.keys(), [('provides', _reqs[2])])
+        sack.close()
+        self.assertEquals(self._rows(), (3, 5))
+        self.assertEquals(sorted(self._saved()),
+                          [('provides', req) for req in sorted(_reqs[:3])])
+
+        # ...and doing one again replaces it.
+        sack = self._sack()
+        sack._prco_pcache_load(self.repo).set(('provides', _reqs[0]), {})
+        sack.close()
+        self.assertEquals(self._rows(), (3, 3))
+        self.assertEquals(self._saved(_reqs[:1]), {('provides', _reqs[0]) : {}})
+
+    def testRepodataChanged(self):
+        sack = self._sack()
+        self._lookup(sack)
+        sack.close()
+        self.assertNotEquals(self._saved(), {})
+
+        self.repo.repoXML = FakeRepoXML('two-csum')
+        self.assertEquals(self._saved(), {})
+
+        # ...and the new lookups replace the old ones.
+        sack = self._sack()
+        self._lookup(sack, _reqs[:1])
+        sack.close()
+        self.assertEquals(sorted(self._saved()), [('provides', _reqs[0])])
+
+    def testDisabled(self):
+        self.repo.prco_cache = False
+        sack = self._sack()
+        self._lookup(sack)
+        sack.close()
+        self.assertFalse(os.path.exists(self.fname))
+
+    def testNotStrings(self):
+        ok = ('foo', 'GE', ('0', '1.5', None))
+        self.assertTrue(YumSqlitePackageSack._prco_pcache_ok(ok))
+        self.assertTrue(YumSqlitePackageSack._prco_pcache_ok(
+            ('foo', None, (None, None, None))))
+        for req in (('foo', 'GE', (0, '1.5', None)),
+                    ('foo', 'GE', ('0', 1.5, None)),
+                    ('foo', 'GE', ('0', '1.5', 1)),
+                    ('foo', 12, ('0', '1.5', None))):
+            self.assertFalse(YumSqlitePackageSack._prco_pcache_ok(req))
+
+        #  They are looked up as usual, but not saved as they wouldn't compare
+        # the same way when loaded back in.
+        bad = ('foo', 'GE', (0, '1.5', None))
+        sack = self._sack()
+        self._lookup(sack, [bad])
+        sack.close()
+        self.assertFalse(os.path.exists(self.fname))
+
+        sack = self._sack()
+        self._lookup(sack, [bad, ok])
+        sack.close()
+        self.assertEquals(sorted(self._saved()), [('provides', ok)])
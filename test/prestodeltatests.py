@@ -0,0 +1,321 @@
+import unittest
+import tempfile
+import shutil
+import os
+import threading
+import StringIO
+import settestpath
+
+from yum import drpm
+from yum.drpm import _prestodelta_index, DeltaInfo
+from yum.Errors import MiscError
+from yum.misc import checksum
+
+_xml = """<?xml version="1.0" encoding="UTF-8"?>
+<prestodelta>
+  <newpackage name="foo" epoch="0" version="1.1" release="1" arch="x86_64">
+    <delta oldepoch="0" oldversion="1.0" oldrelease="1">
+      <filename>drpms/foo-1.0-1_1.1-1.x86_64.drpm</filename>
+      <sequence>foo-1.0-1-abcd</sequence>
+      <size>1234</size>
+      <checksum type="sha256">aaaa</checksum>
+    </delta>
+    <delta oldepoch="0" oldversion="1.0" oldrelease="0.9">
+      <filename>drpms/foo-1.0-0.9_1.1-1.x86_64.drpm</filename>
+      <sequence>foo-1.0-0.9-abcd</sequence>
+      <size>2345</size>
+      <checksum type="sha256">bbbb</checksum>
+    </delta>
+  </newpackage>
+  <newpackage name="bar" epoch="1" version="2" release="3" arch="noarch">
+    <delta oldepoch="1" oldversion="2" oldrelease="2">
+      <filename>drpms/bar-2-2_2-3.noarch.drpm</filename>
+      <sequence>bar-2-2-abcd</sequence>
+      <size>99</size>
+      <checksum type="sha256">cccc</checksum>
+    </delta>
+  </newpackage>
+</prestodelta>
+"""
+
+class FakeRepo:
+    def __init__(self, cachedir):
+        self.cachedir = cachedir
+        self.pkgdir = cachedir
+        self.cache = False
+        self.callback = None
+
+class PrestoDeltaIndexTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        os.mkdir(self.tmpdir + '/gen')
+        self.repo = FakeRepo(self.tmpdir)
+        self.xml = self.tmpdir + '/prestodelta.xml'
+        open(self.xml, 'w').write(_xml)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def _lookup(self, conn, name, arch, epoch, ver, rel):
+        cur = conn.cursor()
+        cur.execute("""SELECT oldversion, oldrelease, size, checksum
+                       FROM deltas WHERE name = ? AND arch = ? AND
+                       version = ? AND release = ? AND epoch = ?
+                       ORDER BY rowid""", (name, arch, ver, rel, epoch))
+        return [tuple(row) for row in cur]
+
+    def testLookup(self):
+        conn = _prestodelta_index(self.repo, self.xml, 'csum1')
+        self.assertEquals(self._lookup(conn, 'foo', 'x86_64', '0', '1.1', '1'),
+                          [('1.0', '1', 1234, 'aaaa'),
+                           ('1.0', '0.9', 2345, 'bbbb')])
+        self.assertEquals(self._lookup(conn, 'bar', 'noarch', '1', '2', '3'),
+                          [('2', '2', 99, 'cccc')])
+        self.assertEquals(self._lookup(conn, 'bar', 'noarch', '0', '2', '3'),
+                          [])
+        conn.close()
+        self.assertTrue(os.path.exists(self.tmpdir +
+                                       '/gen/prestodelta.sqlite'))
+
+    def testChecksum(self):
+        _prestodelta_index(self.repo, self.xml, 'csum1').close()
+
+        # Same checksum, so the XML isn't even looked at.
+        os.unlink(self.xml)
+        conn = _prestodelta_index(self.repo, self.xml, 'csum1')
+        self.assertEquals(len(self._lookup(conn, 'bar', 'noarch',
+                                           '1', '2', '3')), 1)
+        conn.close()
+
+        # New checksum, so it's regenerated.
+        open(self.xml, 'w').write(_xml.replace('"bar"', '"baz"'))
+        conn = _prestodelta_index(self.repo, self.xml, 'csum2')
+        self.assertEquals(self._lookup(conn, 'bar', 'noarch',
+                                       '1', '2', '3'), [])
+        self.assertEquals(len(self._lookup(conn, 'baz', 'noarch',
+                                           '1', '2', '3')), 1)
+        conn.close()
+
+    def testBadXML(self):
+        _prestodelta_index(self.repo, self.xml, 'csum1').close()
+
+        #  A failed rebuild doesn't leave the .tmp file around, and the old
+        # index is still there.
+        open(self.xml, 'w').write(_xml[:len(_xml) / 2])
+        self.assertRaises(SyntaxError, _prestodelta_index,
+                          self.repo, self.xml, 'csum2')
+        self.assertFalse(os.path.exists(self.tmpdir +
+                                        '/gen/prestodelta.sqlite.tmp'))
+        conn = _prestodelta_index(self.repo, self.xml, 'csum1')
+        self.assertEquals(len(self._lookup(conn, 'bar', 'noarch',
+                                           '1', '2', '3')), 1)
+        conn.close()
+
+#  Stands in for applydeltarpm, it logs the drpms it's run on and writes the
+# new rpm ... unless the drpm is called fail*.
+_applydelta = """#! /bin/sh
+for arg; do drpm="$rpm"; rpm="$arg"; done
+echo `basename "$drpm"` >> "%s"
+case `basename "$drpm"` in fail*) exit 1;; esac
+echo rpm > "$rpm"
+"""
+
+class FakeLogger:
+    def info(self, *args):
+        pass
+    debug = warn = info
+
+class FakeConf:
+    def __init__(self, deltarpm):
+        self.deltarpm = deltarpm
+
+class FakeYum:
+    def __init__(self, deltarpm):
+        self.verbose_logger = FakeLogger()
+        self.conf = FakeConf(deltarpm)
+
+_rpm_csum = checksum('sha256', StringIO.StringIO('rpm\n'))
+
+class FakeRPM:
+    """ Like YumAvailablePackageSqlite, the checksum and size can only be
+        looked up in the main thread. """
+    def __init__(self, localpath, ok):
+        self.localpath = localpath
+        self.ok = ok
+        self.verified = None
+
+    def __str__(self):
+        return os.path.basename(self.localpath)
+
+    def _main_thread(self):
+        name = threading.currentThread().getName()
+        if name != 'MainThread':
+            raise ValueError, "pkg data used in %s" % name
+
+    def returnIdSum(self):
+        self._main_thread()
+        if not self.ok:
+            return ('sha256', 'bad')
+        return ('sha256', _rpm_csum)
+
+    def _get_size(self):
+        self._main_thread()
+        return len('rpm\n')
+    size = packagesize = property(_get_size)
+
+    def _verifiedLocalPkg(self, nst):
+        self.verified = nst
+
+class FakeDelta:
+    def __init__(self, repo, name, ok=True):
+        self.repo = repo
+        self.arch = 'noarch'
+        self.oldrpm = None
+        self.size = 10
+        self.localpath = '%s/%s.drpm' % (repo.pkgdir, name)
+        self.rpm = FakeRPM('%s/%s.rpm' % (repo.pkgdir, name), ok)
+        open(self.localpath, 'w').write('drpm')
+
+class DeltaRebuildTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.repo = FakeRepo(self.tmpdir)
+        self.log = self.tmpdir + '/applydelta.log'
+        self.orig_applydelta = drpm.APPLYDELTA
+        drpm.APPLYDELTA = self.tmpdir + '/applydeltarpm'
+        open(drpm.APPLYDELTA, 'w').write(_applydelta % self.log)
+        os.chmod(drpm.APPLYDELTA, 0755)
+        self.orig_verify = drpm.verify_local_file
+        self.errors = {}
+
+    def tearDown(self):
+        drpm.APPLYDELTA = self.orig_applydelta
+        drpm.verify_local_file = self.orig_verify
+        shutil.rmtree(self.tmpdir)
+
+    def _adderror(self, po, msg):
+        self.errors[po] = msg
+
+    def _info(self, deltarpm=1):
+        return DeltaInfo(FakeYum(deltarpm), [], self._adderror)
+
+    def _rebuilt(self):
+        return [line.strip()[:-len('.drpm')] for line in open(self.log)]
+
+    def _check_stopped(self, info):
+        self.assertEquals(info._threads, [])
+        self.assertEquals(info.jobs, set())
+        self.assertEquals(info._future_jobs, [])
+
+    def testOrder(self):
+        info = self._info()
+        names = ['pkg%d' % num for num in range(8)]
+        pkgs = [FakeDelta(self.repo, name) for name in names]
+        for po in pkgs:
+            info.rebuild(po)
+        info.dequeue_all()
+        info.wait()
+        self._check_stopped(info)
+        self.assertEquals(self.errors, {})
+        # One rebuild worker, so they are done in the order they were given.
+        self.assertEquals(self._rebuilt(), names)
+        for po in pkgs:
+            self.assertTrue(os.path.exists(po.rpm.localpath))
+            self.assertFalse(os.path.exists(po.localpath))
+            self.assertNotEquals(po.rpm.verified, None)
+
+    def testWorkers(self):
+        info = self._info(deltarpm=4)
+        pkgs = [FakeDelta(self.repo, 'pkg%d' % num) for num in range(20)]
+        for po in pkgs:
+            info.rebuild(po)
+        info.dequeue_all()
+        threads = info._threads[:]
+        self.assertEquals(len(threads), 4 + info._verify_limit)
+        info.wait()
+        self._check_stopped(info)
+        for thread in threads:
+            self.assertFalse(thread.isAlive())
+        self.assertEquals(self.errors, {})
+        self.assertEquals(sorted(self._rebuilt()),
+                          sorted(['pkg%d' % num for num in range(20)]))
+
+        # The workers are started again for more rebuilds.
+        po = FakeDelta(self.repo, 'more')
+        info.rebuild(po)
+        info.dequeue_all()
+        self.assertEquals(len(info._threads), len(threads))
+        info.wait()
+        self._check_stopped(info)
+        self.assertTrue(os.path.exists(po.rpm.localpath))
+
+    def testErrors(self):
+        info = self._info()
+        good = FakeDelta(self.repo, 'good')
+        failed = FakeDelta(self.repo, 'failed')
+        badsum = FakeDelta(self.repo, 'badsum', ok=False)
+        for po in (good, failed, badsum):
+            info.rebuild(po)
+        info.dequeue_all()
+        info.wait()
+        self._check_stopped(info)
+        self.assertEquals(self.errors,
+                          {failed : 'Delta RPM rebuild failed',
+                           badsum : 'Checksum of the delta-rebuilt RPM failed'})
+        self.assertTrue(os.path.exists(good.rpm.localpath))
+        self.assertFalse(os.path.exists(failed.rpm.localpath))
+        self.assertNotEquals(good.rpm.verified, None)
+        self.assertEquals(badsum.rpm.verified, None)
+
+    def testWorkerException(self):
+        # Anything unexpected in the workers still gets back to wait().
+        def broken_verify(*args):
+            raise ValueError, "bad rpm"
+        drpm.verify_local_file = broken_verify
+        info = self._info()
+        broken = FakeDelta(self.repo, 'broken')
+        info.rebuild(broken)
+        info.dequeue_all()
+        self.assertRaises(MiscError, info.wait)
+        self.assertEquals(info.jobs, set())
+        info.wait()
+        self._check_stopped(info)
+        drpm.verify_local_file = self.orig_verify
+
+        # The exec fails in the child, so that's just a failed rebuild.
+        drpm.APPLYDELTA = self.tmpdir + '/missing'
+        nospawn = FakeDelta(self.repo, 'nospawn')
+        info.rebuild(nospawn)
+        info.dequeue_all()
+        info.wait()
+        self._check_stopped(info)
+        self.assertEquals(self.errors, {nospawn : 'Delta RPM rebuild failed'})
+
+    def testStats(self):
+        info = self._info(deltarpm=2)
+        pkgs = [FakeDelta(self.repo, 'pkg%d' % num) for num in range(4)]
+        for po in pkgs:
+            info.downloading(po)
+        for po in pkgs:
+            info.rebuild(po)
+        #  A drpm we already had isn't downloaded, so it's only in the rebuild
+        # and verify stats.
+        info.rebuild(FakeDelta(self.repo, 'local'))
+        info.dequeue_all()
+        info.wait()
+        self._check_stopped(info)
+        self.assertEquals(self.errors, {})
+
+        stats = info._stats
+        self.assertEquals(stats['download'].num, 4)
+        self.assertEquals(stats['download'].size, 4 * 10)
+        self.assertEquals(stats['download'].depth_max, 3)
+        self.assertEquals(stats['rebuild'].num, 5)
+        self.assertEquals(stats['verify'].num, 5)
+        self.assertEquals(stats['verify'].size, 5 * len('rpm\n'))
+        lines = info._stats_str().split('\n')
+        self.assertEquals(len(lines), 4)
+        self.assertTrue(lines[1].strip().startswith('download: 4 pkgs'))
+        self.assertFalse('workers' in lines[1])
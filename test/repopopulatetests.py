@@ -0,0 +1,141 @@
+import unittest
+import threading
+import time
+import settestpath
+
+from yum import Errors
+from yum.repos import RepoStorage, Repository
+
+class FakeConf:
+    def __init__(self, workers):
+        self.populate_workers = workers
+
+class FakeYum:
+    def __init__(self, workers):
+        self.conf = FakeConf(workers)
+
+class FakeSack:
+    """ Just records what's done to it, populate() adds the mdtype. """
+    def __init__(self, log):
+        self.log = log
+        self.prepared = []
+        self.added = []
+
+    def _populate_prepare(self, repo, mdtype):
+        self.prepared.append((threading.currentThread().getName(), mdtype))
+        time.sleep(0.01)
+        if repo.fail_prepare is not None:
+            raise repo.fail_prepare
+
+    def populate(self, repo, mdtype, callback, cacheonly):
+        self.log.append(repo.id)
+        if repo.fail_populate is not None:
+            raise repo.fail_populate
+        self.added.append(mdtype)
+
+    def setCompatArchs(self, compatarchs):
+        pass
+
+class FakeRepo(Repository):
+    def __init__(self, repoid, log):
+        Repository.__init__(self, repoid)
+        self.enable()
+        self.cache = 1
+        self.skip_if_unavailable = False
+        self.sack = FakeSack(log)
+        self.fail_prepare = None
+        self.fail_populate = None
+        self.no_repomd = False
+
+    def getPackageSack(self):
+        return self.sack
+
+    def _get_repoXML(self):
+        if self.no_repomd:
+            raise Errors.RepoError, "no repomd.xml for %s" % self.id
+        return None
+    repoXML = property(_get_repoXML)
+
+class PopulateTests(unittest.TestCase):
+
+    def _storage(self, workers, setup=None):
+        self.log = []
+        self.yum = FakeYum(workers) # RepoStorage only keeps a weakref
+        storage = RepoStorage(self.yum)
+        storage._setup = True
+        repos = []
+        for num in range(6):
+            repo = FakeRepo('repo%d' % num, self.log)
+            storage.add(repo)
+            repos.append(repo)
+        if setup is not None:
+            setup(repos)
+        return storage, repos
+
+    def _populate(self, workers, setup=None):
+        """ Populate with workers threads, return the populate() order and
+            what got into the MetaSack. """
+        storage, repos = self._storage(workers, setup)
+        storage.populateSack(which=repos)
+        sacks = {}
+        for repoid, sack in storage.pkgSack.sacks.iteritems():
+            sacks[repoid] = sack.added
+        return self.log, sacks, repos
+
+    def testSameAsSerial(self):
+        serial = self._populate(1)
+        threaded = self._populate(4)
+        self.assertEquals(threaded[:2], serial[:2])
+        self.assertEquals(serial[0], ['repo%d' % num for num in range(6)])
+        self.assertEquals(sorted(serial[1]), serial[0])
+
+        # Only the threaded one prepares, once per repo. in the worker threads.
+        for repo in serial[2]:
+            self.assertEquals(repo.sack.prepared, [])
+        names = set()
+        for repo in threaded[2]:
+            self.assertEquals(len(repo.sack.prepared), 1)
+            (name, mdtype) = repo.sack.prepared[0]
+            self.assertEquals(mdtype, 'metadata')
+            self.assertTrue(name.startswith('populate-'))
+            names.add(name)
+        self.assertTrue(len(names) > 1)
+        self.assertTrue(len(names) <= 4)
+
+    def testPrepareErrors(self):
+        def setup(repos):
+            repos[1].fail_prepare = ValueError("bad XML")
+            repos[2].fail_prepare = Errors.RepoError("bad DB")
+            repos[3].no_repomd = True
+        serial = self._populate(1, setup)
+        threaded = self._populate(4, setup)
+        self.assertEquals(threaded[:2], serial[:2])
+        self.assertEquals(sorted(threaded[1]), ['repo%d' % num
+                                                for num in range(6)])
+        self.assertEquals(threaded[2][3].sack.prepared, [])
+
+    def testPopulateErrors(self):
+        def setup(repos):
+            for repo in repos[1:3]:
+                repo.fail_prepare = Errors.RepoError("bad DB")
+                repo.fail_populate = Errors.RepoError("bad DB")
+            repos[1].skip_if_unavailable = True
+        def fail(repos):
+            setup(repos)
+            repos[2].skip_if_unavailable = True
+
+        # One is skipped, the other one isn't so it's an error.
+        for workers in (1, 4):
+            storage, repos = self._storage(workers, setup)
+            self.assertRaises(Errors.RepoError, storage.populateSack,
+                              which=repos)
+            self.assertFalse(repos[1].isEnabled())
+            self.assertTrue(repos[2].isEnabled())
+
+        serial = self._populate(1, fail)
+        threaded = self._populate(4, fail)
+        self.assertEquals(threaded[:2], serial[:2])
+        self.assertEquals(sorted(threaded[1]), ['repo0', 'repo3', 'repo4',
+                                                'repo5'])
+        self.assertFalse(threaded[2][1].isEnabled())
+        self.assertFalse(threaded[2][2].isEnabled())
@@ -0,0 +1,73 @@
+import os
+import unittest
+import tempfile
+import shutil
+import settestpath
+
+from testbase import FakePackage, FakeRepo
+from yum.rpmsack import RPMDBPackageSack, RPMDBProblemDependency
+from yum.rpmsack import RPMDBProblemDuplicate
+
+class RPMDBCheckTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.rpmdb = RPMDBPackageSack(root='/', persistdir=self.tmpdir)
+        repo = FakeRepo('installed')
+        self.pkgs = [FakePackage('pkg%02d' % num, repo=repo)
+                     for num in range(20)]
+        pkgtups = dict([(pkg.pkgtup, pkg) for pkg in self.pkgs])
+        self.rpmdb.searchPkgTuple = lambda pkgtup: [pkgtups[pkgtup]]
+        self.pid = os.getpid()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def _check(self, pkgs):
+        problems = []
+        for pkg in pkgs:
+            num = self.pkgs.index(pkg)
+            if num % 3 == 0:
+                problems.append(RPMDBProblemDependency(pkg, "requires",
+                                                       missing='foo'))
+            if num % 4 == 0:
+                prev = self.pkgs[num - 1]
+                problems.append(RPMDBProblemDependency(pkg, "conflicts",
+                                                       found='bar',
+                                                       conflicts={prev : []}))
+                problems.append(RPMDBProblemDuplicate(pkg, duplicate=prev))
+        return problems
+
+    def _result(self, problems):
+        ret = []
+        for prob in problems:
+            data = sorted(prob.__dict__.items())
+            ret.append((prob.__class__, str(prob), data))
+        return ret
+
+    def testForked(self):
+        serial = self._check(self.pkgs)
+        self.assertEquals(self.rpmdb._check_forked(self._check, self.pkgs),
+                          serial)
+        for workers in (2, 3, 7, 20, 40):
+            problems = self.rpmdb._check_forked(self._check, self.pkgs,
+                                                workers)
+            self.assertEquals(self._result(problems), self._result(serial))
+            # We get the same pkgs back, not copies.
+            for (prob, sprob) in zip(problems, serial):
+                self.assert_(prob.pkg is sprob.pkg)
+                if prob.problem == 'duplicate':
+                    self.assert_(prob.duplicate is sprob.duplicate)
+                if prob.problem == 'conflicts':
+                    self.assert_(prob.conflicts.keys()[0] is
+                                 sprob.conflicts.keys()[0])
+        self.assertEquals(self.rpmdb._check_forked(self._check, [], 4), [])
+
+    def testChildFailed(self):
+        def _check(pkgs):
+            if os.getpid() != self.pid and pkgs[0] == self.pkgs[0]:
+                raise ValueError
+            return self._check(pkgs)
+        problems = self.rpmdb._check_forked(_check, self.pkgs, 4)
+        self.assertEquals(self._result(problems),
+                          self._result(self._check(self.pkgs)))
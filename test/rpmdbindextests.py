@@ -0,0 +1,70 @@
+import unittest
+import tempfile
+import shutil
+import settestpath
+
+from yum.rpmsack import RPMDBPrcoIndex
+
+_pkgs = [(11, ('foo', 'noarch', '0', '1.0', '1'),
+          [('foo', 'EQ', ('0', '1.0', '1')), ('libfoo.so.1', None,
+                                               (None, None, None))],
+          [('bar', 'GE', ('0', '2', None)), ('/bin/sh', None,
+                                             (None, None, None))],
+          ['/usr/bin/foo', '/usr/share/foo', '/usr/share/foo/data']),
+         (12, ('bar', 'x86_64', '1', '2.1', '3'),
+          [('bar', 'EQ', ('1', '2.1', '3')), ('libfoo.so.1', None,
+                                              (None, None, None))],
+          [],
+          ['/usr/bin/bar', '/usr/share/foo']),
+         (15, ('empty', 'noarch', '0', '1', '1'), [], [], [])]
+
+class RPMDBPrcoIndexTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.fname = self.tmpdir + '/prco-index'
+        RPMDBPrcoIndex.write(self.fname, '3:abcd', _pkgs)
+        self.index = RPMDBPrcoIndex.load(self.fname, '3:abcd')
+
+    def tearDown(self):
+        if self.index is not None:
+            self.index.close()
+        shutil.rmtree(self.tmpdir)
+
+    def testLoad(self):
+        self.assertNotEquals(self.index, None)
+        self.assertEquals(RPMDBPrcoIndex.load(self.fname, '4:abcd'), None)
+        self.assertEquals(RPMDBPrcoIndex.load(self.fname + 'x', '3:abcd'),
+                          None)
+
+    def testTruncated(self):
+        data = open(self.fname).read()
+        open(self.fname, 'w').write(data[:-3])
+        self.assertEquals(RPMDBPrcoIndex.load(self.fname, '3:abcd'), None)
+
+    def testPkgs(self):
+        self.assertEquals(len(self.index), 3)
+        for num, pkg in enumerate(_pkgs):
+            self.assertEquals(self.index.pkg(num), (pkg[0], pkg[1]))
+
+    def testProvides(self):
+        self.assertEquals(self.index.prcos('provides', 'foo'),
+                          [(0, ('foo', 'EQ', ('0', '1.0', '1')))])
+        self.assertEquals(self.index.prcos('provides', u'libfoo.so.1'),
+                          [(0, ('libfoo.so.1', None, (None, None, None))),
+                           (1, ('libfoo.so.1', None, (None, None, None)))])
+        self.assertEquals(self.index.prcos('provides', 'baz'), [])
+        # Exists as a string, but not a provide.
+        self.assertEquals(self.index.prcos('provides', 'noarch'), [])
+
+    def testRequires(self):
+        self.assertEquals(self.index.prcos('requires', 'bar'),
+                          [(0, ('bar', 'GE', ('0', '2', None)))])
+        self.assertEquals(self.index.prcos('requires', 'foo'), [])
+
+    def testFiles(self):
+        self.assertEquals(self.index.files('/usr/bin/foo'), [0])
+        self.assertEquals(sorted(self.index.files('/usr/share/foo')), [0, 1])
+        self.assertEquals(self.index.files('/usr/share/foo/data'), [0])
+        self.assertEquals(self.index.files('/usr/bin/baz'), [])
+        self.assertEquals(self.index.files('/usr/data'), [])
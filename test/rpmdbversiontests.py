@@ -0,0 +1,129 @@
+import os
+import time
+import unittest
+import tempfile
+import shutil
+import settestpath
+
+from testbase import FakePackage, FakeRepo
+from yum.rpmsack import RPMDBPackageSack
+
+class FakeYumDB(dict):
+    """ Remembers what was looked up, so we can tell if the cache was used. """
+    def __init__(self, lookups, *args, **kwargs):
+        dict.__init__(self, *args, **kwargs)
+        self.lookups = lookups
+
+    def get(self, attr, default=None):
+        self.lookups.append(attr)
+        return dict.get(self, attr, default)
+
+def _versions(ret):
+    """ The simpleVersion() results as strings, so we can compare them. """
+    main, irepos = ret
+    repos = {}
+    for repoid in irepos:
+        repos[repoid] = dict([(rev, str(ver))
+                              for (rev, ver) in irepos[repoid].iteritems()])
+    return str(main), repos
+
+class YumDBVersionTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        os.mkdir(self.tmpdir + '/rpm')
+        open(self.tmpdir + '/rpm/Packages', 'w').close()
+        os.mkdir(self.tmpdir + '/rpmdb-indexes')
+        self.fname = self.tmpdir + '/rpmdb-indexes/pkgtups-yumdb'
+        repo = FakeRepo('installed')
+        self.yumdb = {'foo' : {'checksum_type' : 'sha256',
+                               'checksum_data' : 'abcd',
+                               'from_repo' : 'base',
+                               'from_repo_revision' : '1400000000'},
+                      'bar' : {'checksum_type' : 'sha256',
+                               'checksum_data' : 'ef01',
+                               'from_repo' : 'updates'},
+                      'baz' : {}}
+        self.pkgs = [FakePackage(name, repo=repo) for name in self.yumdb]
+        self.lookups = []
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def _rpmdb(self, cache=True):
+        rpmdb = RPMDBPackageSack(root='/', persistdir=self.tmpdir)
+        rpmdb._rpmdbpath = self.tmpdir + '/rpm'
+        rpmdb._cached_rpmdb_mtime = os.path.getmtime(rpmdb._rpmdbpath +
+                                                     '/Packages')
+        if not cache:
+            rpmdb.__cache_rpmdb__ = False
+        for pkg in self.pkgs:
+            pkg.yumdb_info = FakeYumDB(self.lookups, self.yumdb[pkg.name])
+        rpmdb.returnPackages = lambda: self.pkgs
+        return rpmdb
+
+    def testRoundTrip(self):
+        data = {('foo', 'noarch', '0', '1.0', '1') : ('sha256', 'abcd',
+                                                      'base', '1400000000'),
+                ('bar', 'x86_64', '1', '2.0', '3') : ('sha256', 'ef01',
+                                                      'updates', None),
+                ('baz', 'noarch', '0', '1.0', '1') : (None, None, None, None),
+                ('empty', 'noarch', '0', '1.0', '1') : ('', '', '', '')}
+        rpmdb = self._rpmdb()
+        rpmdb._put_cached_simpleVersion_main('4:abcd')
+        rpmdb._write_yumdb_version_data('4:abcd', data)
+        self.assertEquals(self._rpmdb()._read_yumdb_version_data(), data)
+
+        # Anything with a newline isn't written.
+        os.unlink(self.fname)
+        data[('baz', 'noarch', '0', '1.0', '1')] = ('sha256', 'a\nb',
+                                                    None, None)
+        rpmdb._write_yumdb_version_data('4:abcd', data)
+        self.assertFalse(os.path.exists(self.fname))
+
+    def testSimpleVersion(self):
+        nocache = _versions(self._rpmdb(cache=False).simpleVersion())
+        self.assertEquals(sorted(nocache[1]['@base']), [None, '1400000000'])
+        self.assertEquals(sorted(nocache[1]), ['@base', '@updates',
+                                               'installed'])
+        self.assertFalse(os.path.exists(self.fname))
+
+        self.assertEquals(_versions(self._rpmdb().simpleVersion()), nocache)
+        self.assertTrue(os.path.exists(self.fname))
+
+        # Now everything comes from pkgtups-yumdb, and not the yumdb.
+        self.lookups[:] = []
+        self.assertEquals(_versions(self._rpmdb().simpleVersion()), nocache)
+        self.assertEquals(self.lookups, [])
+
+        # ...and main_only doesn't need either.
+        main = self._rpmdb().simpleVersion(main_only=True)[0]
+        self.assertEquals(str(main), nocache[0])
+        self.assertEquals(self.lookups, [])
+
+    def testStale(self):
+        rpmdb = self._rpmdb()
+        main = str(rpmdb.simpleVersion()[0])
+        self.assertTrue(os.path.exists(self.fname))
+
+        #  Data for another rpmdb version, which would give a different
+        # from_repo for foo, is ignored.
+        stale = {}
+        for pkg in self.pkgs:
+            stale[pkg.pkgtup] = ('sha256', 'abcd', 'stale', None)
+        rpmdb._write_yumdb_version_data('4:stale', stale)
+        self.assertEquals(self._rpmdb()._read_yumdb_version_data(), None)
+        ret = _versions(self._rpmdb().simpleVersion())
+        self.assertEquals(ret[0], main)
+        self.assertFalse('@stale' in ret[1])
+
+        #  So is the data for the current version, if the rpmdb changed after
+        # the version was saved.
+        rpmdb = self._rpmdb()
+        rpmdb._write_yumdb_version_data(main, stale)
+        self.assertEquals(self._rpmdb()._read_yumdb_version_data(), stale)
+        future = time.time() + 10
+        os.utime(self.tmpdir + '/rpm/Packages', (future, future))
+        self.assertEquals(self._rpmdb()._read_yumdb_version_data(), None)
+        ret = _versions(self._rpmdb().simpleVersion())
+        self.assertFalse('@stale' in ret[1])
@@ -0,0 +1,135 @@
+import unittest
+import tempfile
+import shutil
+import random
+import os
+import settestpath
+
+from yum.sqlutils import sqlite, sql_esc
+from yum.sqlitesack import YumSqlitePackageSack, YumAvailablePackageSqlite
+from yum.sqlitesack import _search_index, _search_index_lookup
+
+_pkgs = [(1, 'yum', 'RPM package installer/updater/manager',
+          'Yum is a utility that can check for and automatically download and'
+          ' install updated RPM packages.', 'http://yum.baseurl.org/'),
+         (2, 'yum-utils', 'Utilities based around the yum package manager',
+          'yum-utils is a collection of utilities and examples for the yum'
+          ' package manager. 100% of them are written in Python_2.',
+          'http://yum.baseurl.org/download/yum-utils/'),
+         (5, 'python-urlgrabber', 'A high-level cross-protocol url-grabber',
+          u'A high-level cross-protocol url-grabber for python supporting'
+          u' HTTP, FTP and file locations. \xc9t\xe9.', None),
+         (9, 'zsh', 'Powerful interactive shell', '', '')]
+
+class FakeRepo:
+    def __init__(self, cachedir):
+        self.cachedir = cachedir
+        self.search_index = True
+
+class SearchIndexTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        os.mkdir(self.tmpdir + '/gen')
+        self.repo = FakeRepo(self.tmpdir)
+        self.pconn = self._primary('csum1', _pkgs)
+        self.sack = YumSqlitePackageSack(YumAvailablePackageSqlite)
+
+    def tearDown(self):
+        for conn in self.sack._search_index.values():
+            conn.close()
+        self.pconn.close()
+        shutil.rmtree(self.tmpdir)
+
+    def _primary(self, csum, pkgs):
+        conn = sqlite.connect(':memory:')
+        cur = conn.cursor()
+        cur.execute("CREATE TABLE db_info (dbversion INTEGER, checksum TEXT)")
+        cur.execute("INSERT INTO db_info VALUES (10, ?)", (csum,))
+        cur.execute("""CREATE TABLE packages (pkgKey INTEGER PRIMARY KEY,
+                       name TEXT, summary TEXT, description TEXT, url TEXT)""")
+        cur.executemany("INSERT INTO packages VALUES (?, ?, ?, ?, ?)", pkgs)
+        conn.commit()
+        return conn
+
+    def _like(self, fields, searchstring):
+        """ What the LIKE search, without the index, finds. """
+        (searchstring, esc) = sql_esc(searchstring.replace("'", "''"))
+        like = " or ".join(["%s like '%%%s%%'%s" % (f, searchstring, esc)
+                            for f in fields])
+        cur = self.pconn.cursor()
+        cur.execute("SELECT pkgKey FROM packages WHERE " + like)
+        return sorted([x[0] for x in cur])
+
+    def _check(self, fields, searchstring):
+        ret = self.sack._search_index_pkgKeys(self.repo, self.pconn, fields,
+                                              searchstring)
+        self.assertEquals(sorted(ret), self._like(fields, searchstring))
+        return sorted(ret)
+
+    def testLookup(self):
+        conn = _search_index(self.repo, self.pconn)
+        self.assertEquals(_search_index_lookup(conn, 'yum'), set([1, 2]))
+        self.assertEquals(_search_index_lookup(conn, 'MANAGER'), set([1, 2]))
+        self.assertEquals(_search_index_lookup(conn, 'grab'), set([5]))
+        self.assertEquals(_search_index_lookup(conn, 'xyzzy'), set())
+        self.assertEquals(_search_index_lookup(conn, 'yu'), None)
+        conn.close()
+
+    def testMatches(self):
+        fields = ['name', 'summary', 'description', 'url']
+        self.assertEquals(self._check(fields, 'yum'), [1, 2])
+        self.assertEquals(self._check(['name'], 'yum'), [1, 2])
+        self.assertEquals(self._check(['url'], 'yum'), [1, 2])
+        self.assertEquals(self._check(['name', 'summary'], 'shell'), [9])
+        self.assertEquals(self._check(fields, 'Python'), [2, 5])
+        self.assertEquals(self._check(fields, '100%'), [2])
+        self.assertEquals(self._check(fields, 'n_2'), [2])
+        self.assertEquals(self._check(fields, "it's"), [])
+        # LIKE only ignores the case of ASCII characters.
+        self.assertEquals(self._check(fields, u'\xc9t\xe9'), [5])
+        self.assertEquals(self._check(fields, u'\xe9t\xe9'), [])
+        self.assertEquals(self._check(fields, u'\xc9T\xe9'), [5])
+
+    def testNotIndexed(self):
+        self.assertEquals(self.sack._search_index_pkgKeys(self.repo,
+                                                          self.pconn,
+                                                          ['name'], 'yu'),
+                          None)
+        self.assertEquals(self.sack._search_index_pkgKeys(self.repo,
+                                                          self.pconn,
+                                                          ['rpm_group'],
+                                                          'yum'),
+                          None)
+        self.repo.search_index = False
+        self.assertEquals(self.sack._search_index_pkgKeys(self.repo,
+                                                          self.pconn,
+                                                          ['name'], 'yum'),
+                          None)
+
+    def testRandom(self):
+        fields = ['name', 'summary', 'description', 'url']
+        rnd = random.Random(1234)
+        text = ' '.join([x[3] for x in _pkgs])
+        for i in range(200):
+            beg = rnd.randint(0, len(text) - 8)
+            searchstring = text[beg:beg + rnd.randint(3, 8)]
+            if rnd.randint(0, 1):
+                searchstring = searchstring.upper()
+            self._check(fields, searchstring)
+
+    def testChecksum(self):
+        _search_index(self.repo, self.pconn).close()
+        self.assertTrue(os.path.exists(self.tmpdir +
+                                       '/gen/search-index.sqlite'))
+
+        # Same checksum, so the primary isn't looked at.
+        conn = _search_index(self.repo, self._primary('csum1', []))
+        self.assertEquals(_search_index_lookup(conn, 'zsh'), set([9]))
+        conn.close()
+
+        # New checksum, so it's rebuilt.
+        conn = _search_index(self.repo, self._primary('csum2', _pkgs[:1]))
+        self.assertEquals(_search_index_lookup(conn, 'zsh'), set())
+        self.assertEquals(_search_index_lookup(conn, 'yum'), set([1]))
+        conn.close()
@@ -462,6 +462,30 @@ class SkipBrokenTests(DepsolveTests):
         self.assertEquals('ok', *self.resolveCode(skip=True))
         self.assertResult([a1,b1,c1,d1,e2,f2])
 
+    def testUpdateSkippedOldReqRemoved(self):
+        """ 
+        c2 drops libfoo.so.1, which is fine while a1 is being updated.
+        a2 gets skipped, so the installed a1 still needs libfoo.so.1 and
+        c2 needs to be skipped too.
+        """
+        a1 = self.instPackage('a', '1', arch='x86_64')
+        a1.addRequires("libfoo.so.1()(64bit)")
+        a2 = self.repoPackage('a', '2', arch='x86_64')
+        a2.addRequires("not-there")
+
+        c1 = self.instPackage('c', '1', arch='x86_64')
+        c1.addProvides("libfoo.so.1()(64bit)")
+        c2 = self.repoPackage('c', '2', arch='x86_64')
+
+        e1 = self.instPackage('e', '1', arch='x86_64')
+        e2 = self.repoPackage('e', '2', arch='x86_64')
+
+        self.tsInfo.addUpdate(a2, oldpo=a1)
+        self.tsInfo.addUpdate(c2, oldpo=c1)
+        self.tsInfo.addUpdate(e2, oldpo=e1)
+        self.assertEquals('ok', *self.resolveCode(skip=True))
+        self.assertResult([a1,c1,e2])
+
     def testBumpedSoName2(self):
         """ 
         https://bugzilla.redhat.com/show_bug.cgi?id=468785
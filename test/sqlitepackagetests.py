@@ -0,0 +1,83 @@
+import unittest
+import settestpath
+
+from yum.sqlitesack import YumAvailablePackageSqlite
+
+class FakeSack:
+    pass
+
+class FakeRepo:
+    def __init__(self):
+        self.id = 'fake'
+        self.sack = FakeSack()
+
+class FakeCursor:
+    def __init__(self, rows):
+        self.rows = rows
+
+    def __iter__(self):
+        return iter(self.rows)
+
+def _row(pkgKey, name, epoch='1', version='2.0', release='3'):
+    return {'pkgKey' : pkgKey, 'pkgId' : 'csum%d' % pkgKey, 'name' : name,
+            'arch' : 'x86_64', 'epoch' : epoch, 'version' : version,
+            'release' : release}
+
+class SqlitePackageTests(unittest.TestCase):
+
+    def setUp(self):
+        self.repo = FakeRepo()
+        self.queries = []
+
+    def _pkg(self, row, prcos={}):
+        po = YumAvailablePackageSqlite(self.repo, row)
+        def _sql_MD(MD, sql, *args):
+            self.queries.append(sql.split()[-5])
+            return FakeCursor(prcos.get(sql.split()[-5], []))
+        po._sql_MD = _sql_MD
+        return po
+
+    def testNEVRA(self):
+        po = self._pkg(_row(1, 'foo'))
+        self.assertEquals(po.pkgtup, ('foo', 'x86_64', '1', '2.0', '3'))
+        self.assertEquals((po.name, po.arch, po.epoch, po.ver, po.rel),
+                          po.pkgtup)
+        self.assertEquals(po.id, 'csum1')
+        self.assertEquals(po.repoid, 'fake')
+        self.assert_(po.sack is self.repo.sack)
+        self.assertEquals(po.state, None)
+
+        po = self._pkg(_row(2, 'bar', epoch=None))
+        self.assertEquals(po.epoch, '0')
+
+    def testShared(self):
+        po1 = self._pkg(_row(1, 'foo'))
+        po2 = self._pkg(_row(1, 'foo'))
+        self.assert_(po1.pkgtup is po2.pkgtup)
+        self.assertEquals(sorted(po1.__dict__),
+                          ['_sql_MD', 'pkgId', 'pkgKey', 'pkgtup', 'repo'])
+
+    def testPrco(self):
+        req = {'name' : 'bar', 'flags' : 'GE',
+               'epoch' : '0', 'version' : '1', 'release' : None}
+        prcos = {'requires' : [req], 'provides' : []}
+        po1 = self._pkg(_row(1, 'foo'), prcos)
+        po2 = self._pkg(_row(2, 'foo2'), prcos)
+        # Not loaded, but looks empty.
+        self.assertEquals(po1.prco['requires'], ())
+        self.assertEquals(po1.returnPrco('requires'),
+                          (('bar', 'GE', ('0', '1', None)),))
+        self.assertEquals(po1.returnPrco('provides'), ())
+        self.assertEquals(po1.returnPrco('requires'),
+                          (('bar', 'GE', ('0', '1', None)),))
+        self.assertEquals(self.queries, ['requires', 'provides'])
+        self.assert_(po1.returnPrco('requires')[0] is
+                     po2.returnPrco('requires')[0])
+
+        # The other pkg. hasn't loaded anything from the first.
+        po3 = self._pkg(_row(3, 'foo3'), prcos)
+        self.assertEquals(po3.prco['requires'], ())
+        self.assertFalse(po3.checkPrco('requires', ('baz', None,
+                                                    (None, None, None))))
+        self.assert_(po3.checkPrco('requires', ('bar', 'GE',
+                                                ('0', '1', None))))
@@ -66,6 +66,7 @@ class FakeConf(object):
         self.reposdir = '/tmp/XXXX'
         self.diskspacecheck = True
         self.depsolve_loop_limit = 10
+        self.depsolve_profile = False
         self.override_install_langs = ''
         self.requires_policy = "weak"
 
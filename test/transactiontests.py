@@ -138,7 +138,104 @@ class TransactionDataTests(unittest.TestCase):
         self.assertEqual(len(res),2) # foo-1.0, bar-2.0
         res = self.tsInfo.getMembersWithState(output_states=[TS_UPDATED])
         self.assertEqual(len(res),1) # bar-1.0
-    
+
+    def testgetMembersWithStateChanged(self):
+        ''' test getMembersWithState after the members change state'''
+        txmbr1 = self.tsInfo.addInstall(self.foo1)
+        txmbr2 = self.tsInfo.addUpdate(self.foogui2,self.foogui1)
+        self.assertEqual(self.tsInfo.getMembersWithState(None, [TS_INSTALL]),
+                         [txmbr1])
+        txmbr2.output_state = TS_INSTALL
+        res = self.tsInfo.getMembersWithState(None, [TS_INSTALL])
+        self.assertEqual(sorted(res), sorted([txmbr1, txmbr2]))
+        self.assertEqual(self.tsInfo.getMembersWithState(None, [TS_UPDATE]),
+                         [])
+        self.assertEqual(self.tsInfo.getMembersWithState(self.foogui2.pkgtup,
+                                                         [TS_INSTALL]),
+                         [txmbr2])
+        self.tsInfo.remove(self.foo1.pkgtup)
+        self.assertEqual(self.tsInfo.getMembersWithState(None, [TS_INSTALL]),
+                         [txmbr2])
+        # Not in the transaction anymore, so not indexed.
+        txmbr1.output_state = TS_UPDATE
+        self.assertEqual(self.tsInfo.getMembersWithState(None, [TS_UPDATE]),
+                         [])
+
+    def testResetChangedResolved(self):
+        ''' test resetChangedResolved only marks members with changed providers'''
+        inst = FakePackage('baz', '1', '0', '0', 'noarch',
+                           repo=FakeRepo('installed'))
+        txmbr1 = self.tsInfo.addInstall(self.foo1)
+        txmbr2 = self.tsInfo.addInstall(self.bar1)
+        txmbr3 = self.tsInfo.addInstall(self.foogui1)
+        self.tsInfo.markAsResolved(txmbr1, [self.bar1])
+        self.tsInfo.markAsResolved(txmbr2, [inst])
+        self.tsInfo.markAsResolved(txmbr3, [self.bar1, inst])
+        self.assertEqual(self.tsInfo.getUnresolvedMembers(), [])
+        self.assertEqual(self.tsInfo.resetChangedResolved(), 0)
+
+        # Without providers it always gets rechecked.
+        self.tsInfo.markAsResolved(txmbr3)
+        self.assertEqual(self.tsInfo.resetChangedResolved(), 1)
+        self.assertEqual(self.tsInfo.getUnresolvedMembers(), [txmbr3])
+        self.tsInfo.markAsResolved(txmbr3, [self.bar1, inst])
+
+        # Removing the installed provider affects bar and foogui.
+        txmbr4 = self.tsInfo.addErase(inst)
+        self.tsInfo.markAsResolved(txmbr4, [])
+        self.assertEqual(self.tsInfo.resetChangedResolved(), 2)
+        self.assertEqual(self.tsInfo.getUnresolvedMembers(),
+                         sorted([txmbr2, txmbr3]))
+        self.tsInfo.remove(inst.pkgtup)
+        self.tsInfo.markAsResolved(txmbr2, [inst])
+        self.tsInfo.markAsResolved(txmbr3, [self.bar1, inst])
+
+        #  Removing the available provider affects foo and foogui, the removed
+        # members don't need their reverse check anymore.
+        self.tsInfo.remove(self.bar1.pkgtup)
+        self.assertEqual(self.tsInfo.resetChangedResolved(), 2)
+        self.assertEqual(self.tsInfo.getUnresolvedMembers(),
+                         sorted([txmbr1, txmbr3]))
+
+    def testResetChangedResolvedUpdateDropped(self):
+        ''' test resetChangedResolved rechecks removals when an update is dropped'''
+        repo = FakeRepo('installed')
+        inst_foo = FakePackage('foo', '1', '0', '0', 'noarch', repo=repo)
+        inst_bar = FakePackage('bar', '1', '0', '0', 'noarch', repo=repo)
+        inst_baz = FakePackage('baz', '1', '0', '0', 'noarch', repo=repo)
+        #  bar-1 => bar-2 drops something foo-1 requires, but it was checked
+        # while foo-1 was being updated so only bar-2 is recorded for it.
+        self.tsInfo.addUpdate(self.bar2, inst_bar)
+        for txmbr in (self.tsInfo.getMembers(self.bar2.pkgtup) +
+                      self.tsInfo.getMembers(inst_bar.pkgtup)):
+            self.tsInfo.markAsResolved(txmbr, [self.bar2])
+        self.tsInfo.addUpdate(self.foo2, inst_foo)
+        for txmbr in (self.tsInfo.getMembers(self.foo2.pkgtup) +
+                      self.tsInfo.getMembers(inst_foo.pkgtup)):
+            self.tsInfo.markAsResolved(txmbr, [self.foo2])
+        txmbr = self.tsInfo.addErase(inst_baz)
+        self.tsInfo.markAsResolved(txmbr, [])
+        self.assertEqual(self.tsInfo.resetChangedResolved(), 0)
+
+        #  Skipping the foo update leaves foo-1 installed, so all the
+        # removals have to be checked against it again.
+        self.tsInfo.remove(self.foo2.pkgtup)
+        self.tsInfo.remove(inst_foo.pkgtup)
+        self.assertEqual(self.tsInfo.resetChangedResolved(), 2)
+        unresolved = self.tsInfo.getUnresolvedMembers()
+        self.assertEqual(sorted([txmbr.po for txmbr in unresolved]),
+                         sorted([inst_bar, inst_baz]))
+        for txmbr in unresolved:
+            self.tsInfo.markAsResolved(txmbr, [])
+        self.assertEqual(self.tsInfo.resetChangedResolved(), 0)
+
+        # ...a hard reset covers it as well.
+        self.tsInfo.remove(inst_baz.pkgtup)
+        self.tsInfo.resetResolved(hard=True)
+        for txmbr in self.tsInfo.getUnresolvedMembers():
+            self.tsInfo.markAsResolved(txmbr, [])
+        self.assertEqual(self.tsInfo.resetChangedResolved(), 0)
+
     def assertResult(self, txmbrs):
         """Check if self.tsInfo contains the given txmbr.
         """
@@ -0,0 +1,90 @@
+#! /usr/bin/python -tt
+
+# Benchmark the sorted rpmUtils.updates.Updates engine against the old (n, a)
+# dict based one, on a synthetic repo. Do either:
+# ./updates-bench.py
+# ./updates-bench.py <available pkgs> <installed pkgs> [arch]
+
+import sys
+import time
+import random
+
+import rpmUtils.arch
+import rpmUtils.updates
+from nadictupdates import NADictUpdates
+
+_arches = {'x86_64' : ['x86_64', 'x86_64', 'x86_64', 'noarch', 'i686'],
+           'i686'   : ['i686', 'i686', 'noarch', 'i386']}
+
+def gen_repo(num_avail, num_inst, arch, seed=1234):
+    """ Generate a repo. with num_avail pkgs, as a few versions of each name,
+        and an rpmdb with num_inst pkgs of the same names. """
+    rnd = random.Random(seed)
+    avail = []
+    inst = []
+    num = 0
+    while len(avail) < num_avail:
+        name = 'pkg%d-%s' % (num, rnd.choice(['lib', 'devel', 'tools', '']))
+        num += 1
+        arches = set(rnd.sample(_arches[arch], rnd.randint(1, 2)))
+        ver = '%d.%d' % (rnd.randint(0, 9), rnd.randint(0, 30))
+        rels = sorted(rnd.sample(range(1, 40), rnd.randint(1, 4)))
+        for a in arches:
+            for rel in rels:
+                avail.append((name, a, '0', ver, '%d.fc20' % rel))
+            if len(inst) < num_inst:
+                inst.append((name, a, '0', ver, '%d.fc20' % rnd.choice(rels)))
+    obsoletes = {}
+    for pkgtup in rnd.sample(avail, len(avail) / 100):
+        name = rnd.choice(inst)[0]
+        obsoletes[pkgtup] = [(name, 'LT', ('0', '5', None))]
+    return avail[:num_avail], inst, obsoletes
+
+def run(inst, avail, obsoletes, arch, cls):
+    up = cls(inst[:], avail[:])
+    up.rawobsoletes = obsoletes
+    up.myarch = arch
+    up._is_multilib = rpmUtils.arch.isMultiLibArch(arch)
+    up._archlist = rpmUtils.arch.getArchList(arch)
+    up._multilib_compat_arches = rpmUtils.arch.getMultiArchInfo(arch)
+    beg = time.time()
+    up.doUpdates()
+    mid = time.time()
+    up.doObsoletes()
+    end = time.time()
+    return up, mid - beg, end - mid
+
+def main():
+    num_avail = 60000
+    num_inst = 2000
+    arch = 'x86_64'
+    if len(sys.argv) > 2:
+        num_avail = int(sys.argv[1])
+        num_inst = int(sys.argv[2])
+    if len(sys.argv) > 3:
+        arch = sys.argv[3]
+
+    avail, inst, obsoletes = gen_repo(num_avail, num_inst, arch)
+    print "Available:", len(avail), "Installed:", len(inst),
+    print "Obsoletes:", len(obsoletes), "Arch:", arch
+
+    # Clear the vercmp key cache between runs, so neither gets a warm cache.
+    rpmUtils.miscutils._vercmp_key_cache.clear()
+    old, old_up, old_obs = run(inst, avail, obsoletes, arch, NADictUpdates)
+    rpmUtils.miscutils._vercmp_key_cache.clear()
+    new, new_up, new_obs = run(inst, avail, obsoletes, arch,
+                               rpmUtils.updates.Updates)
+
+    print "%-10s %10s %10s %10s" % ("", "updates", "obsoletes", "total")
+    print "%-10s %9.3fs %9.3fs %9.3fs" % ("old", old_up, old_obs,
+                                           old_up + old_obs)
+    print "%-10s %9.3fs %9.3fs %9.3fs" % ("sorted", new_up, new_obs,
+                                           new_up + new_obs)
+    print "Updates:", len(new.updatesdict), "Obsoletes:", len(new.obsoletes)
+    if (new.updatesdict != old.updatesdict or
+        new.obsoletes != old.obsoletes):
+        print "** Results differ!"
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
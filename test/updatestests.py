@@ -0,0 +1,114 @@
+import unittest
+import random
+import settestpath
+
+import rpmUtils.arch
+import rpmUtils.updates
+from nadictupdates import NADictUpdates
+
+_names = ['foo', 'bar', 'baz', 'glibc', 'kernel', 'do', 'quux', 'zed']
+_arches = ['noarch', 'i386', 'i686', 'athlon', 'x86_64', 'ppc', 'ppc64',
+           'sparcv9', 'sparc64', 'src']
+_vers = ['1', '1.0', '1.1', '2', '2.0a', '10']
+_rels = ['1', '1.fc20', '2', '3', '10']
+
+def _gen_pkgs(rnd, num):
+    ret = []
+    for i in range(num):
+        ret.append((rnd.choice(_names), rnd.choice(_arches),
+                    rnd.choice(['0', '0', '1']), rnd.choice(_vers),
+                    rnd.choice(_rels)))
+    return ret
+
+def _gen_obsoletes(rnd, avail, num):
+    ret = {}
+    for pkgtup in rnd.sample(avail, min(num, len(avail))):
+        obs = []
+        for i in range(rnd.randint(1, 3)):
+            name = rnd.choice(_names)
+            if rnd.randint(0, 2):
+                obs.append((name, None, (None, None, None)))
+            else:
+                obs.append((name, rnd.choice(['LT', 'LE', 'EQ', 'GE', 'GT']),
+                            ('0', rnd.choice(_vers), None)))
+        ret[pkgtup] = obs
+    return ret
+
+def _sorted_values(dict_):
+    return dict([(key, sorted(val)) for (key, val) in dict_.iteritems()])
+
+def _updates(inst, avail, obsoletes, arch, cls=rpmUtils.updates.Updates):
+    up = cls(inst[:], avail[:])
+    up.rawobsoletes = obsoletes
+    up.myarch = arch
+    up._is_multilib = rpmUtils.arch.isMultiLibArch(arch)
+    up._archlist = rpmUtils.arch.getArchList(arch)
+    up._multilib_compat_arches = rpmUtils.arch.getMultiArchInfo(arch)
+    return up
+
+class UpdatesEngineTests(unittest.TestCase):
+    """ Check that the sorted doUpdates()/doObsoletes() give exactly the same
+        results as the old (n, a) dict based implementations. """
+
+    def _check(self, inst, avail, obsoletes, arch):
+        old = _updates(inst, avail, obsoletes, arch, NADictUpdates)
+        old.doUpdates()
+        old.doObsoletes()
+        new = _updates(inst, avail, obsoletes, arch)
+        new.doUpdates()
+        new.doObsoletes()
+        self.assertEquals(new.updatesdict, old.updatesdict)
+        #  The lists in the reverse dicts. are built by walking the dicts.
+        # above, so their order is just dict. order.
+        self.assertEquals(_sorted_values(new.updating_dict),
+                          _sorted_values(old.updating_dict))
+        self.assertEquals(new.obsoletes, old.obsoletes)
+        self.assertEquals(_sorted_values(new.obsoleted_dict),
+                          _sorted_values(old.obsoleted_dict))
+        self.assertEquals(_sorted_values(new.obsoleting_dict),
+                          _sorted_values(old.obsoleting_dict))
+        return new
+
+    def testSimple(self):
+        inst = [('foo', 'i386', '0', '1', '1'),
+                ('glibc', 'i386', '0', '1', '1'),
+                ('bar', 'noarch', '0', '2', '1')]
+        avail = [('foo', 'i386', '0', '1', '3'),
+                 ('foo', 'i386', '0', '1', '2'),
+                 ('glibc', 'i686', '0', '1', '2'),
+                 ('bar', 'noarch', '0', '2', '1'),
+                 ('quux', 'noarch', '0', '1', '3')]
+        obsoletes = {('quux', 'noarch', '0', '1', '3'):
+                     [('bar', None, (None, None, None))]}
+        up = self._check(inst, avail, obsoletes, 'i686')
+        self.assertEquals(up.updatesdict,
+                          {('foo', 'i386', '0', '1', '1'):
+                           [('foo', 'i386', '0', '1', '3')]})
+        self.assertEquals(up.obsoleted_dict,
+                          {('bar', 'noarch', '0', '2', '1'):
+                           [('quux', 'noarch', '0', '1', '3')]})
+
+    def testMultilib(self):
+        inst = [('baz', 'i686', '0', '2', '3'),
+                ('baz', 'x86_64', '0', '1', '4'),
+                ('kernel', 'x86_64', '0', '1', '1'),
+                ('kernel', 'x86_64', '0', '1', '2')]
+        avail = [('baz', 'noarch', '0', '2', '4'),
+                 ('baz', 'i686', '0', '2', '4'),
+                 ('baz', 'x86_64', '0', '1', '5'),
+                 ('baz', 'ppc', '0', '1', '5'),
+                 ('kernel', 'x86_64', '0', '1', '3'),
+                 ('kernel', 'i686', '0', '1', '4')]
+        up = self._check(inst, avail, {}, 'x86_64')
+        up.condenseUpdates()
+        self.assertEquals(up.updatesdict[('kernel', 'x86_64', '0', '1', '2')],
+                          [('kernel', 'x86_64', '0', '1', '3')])
+
+    def testRandom(self):
+        rnd = random.Random(1234)
+        for arch in ('x86_64', 'i686', 'ppc64', 'sparc64v', 'noarch'):
+            for i in range(40):
+                inst = _gen_pkgs(rnd, rnd.randint(0, 20))
+                avail = _gen_pkgs(rnd, rnd.randint(0, 40))
+                obsoletes = _gen_obsoletes(rnd, avail, rnd.randint(0, 5))
+                self._check(inst, avail, obsoletes, arch)
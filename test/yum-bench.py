@@ -0,0 +1,406 @@
+#! /usr/bin/python -tt
+
+# Benchmark sack setup, update calculation, depsolving, searching and
+# returnPackages on a synthetic repo. The repo. is written as a real
+# repodata/ directory (repomd.xml + {primary,filelists}.sqlite.bz2) and used via
+# a file://
+# baseurl, the installed pkgs are a testbase.FakeRpmDb. Do either:
+# ./yum-bench.py
+# ./yum-bench.py --packages=20000 --installed=2000 --density=4 -o res.json
+# ./yum-bench.py --installed=1000 --distro-sync
+# ./yum-bench.py --broken=50
+#
+# The -o output is JSON, so results can be kept and compared between runs.
+
+import os
+import sys
+import time
+import random
+import shutil
+import tempfile
+import bz2
+from optparse import OptionParser
+
+from testbase import FakePackage, FakeRpmDb, FakeRepo
+from cli import YumBaseCli
+
+import yum
+from yum import misc
+from yum.constants import TS_REMOVE_STATES
+from yum.sqlutils import sqlite
+
+_arches = ['x86_64', 'x86_64', 'x86_64', 'noarch', 'i686']
+_words = ['library', 'tools', 'utilities', 'python', 'daemon', 'server',
+          'client', 'devel', 'plugin', 'shell', 'network', 'graphics']
+
+def gen_repo(num_pkgs, num_inst, density, seed=1234, broken=0):
+    """ Generate the data for a repo. with num_pkgs pkgs, each with on
+        average density requires on the provides (names, sonames and files) of
+        other pkgs. Returns the available pkgs. as dicts, and (pkg, release)
+        for the num_inst that are installed (an older release of each).
+        The updates for broken of the installed pkgs. require something that
+        doesn't exist, for skip-broken. """
+    rnd = random.Random(seed)
+    avail = []
+    provides = []
+    while len(avail) < num_pkgs:
+        num = len(avail)
+        name = 'pkg%d-%s' % (num, rnd.choice(['lib', 'devel', 'tools', 'x']))
+        arch = rnd.choice(_arches)
+        ver = '%d.%d' % (rnd.randint(0, 9), rnd.randint(0, 30))
+        rel = '%d.fc20' % rnd.randint(2, 40)
+        pkg = {'name' : name, 'arch' : arch, 'epoch' : '0',
+               'version' : ver, 'release' : rel,
+               'summary' : '%s %s' % (name, ' '.join(rnd.sample(_words, 3))),
+               'description' : ' '.join(rnd.sample(_words * 4, 20)),
+               'url' : 'http://example.com/%s/' % name,
+               'provides' : [(name, 'EQ', ('0', ver, rel))],
+               'requires' : [], 'conflicts' : [], 'obsoletes' : [],
+               'files' : [('/usr/bin/%s' % name, 'file'),
+                          ('/usr/share/doc/%s' % name, 'dir'),
+                          ('/usr/share/doc/%s/README' % name, 'file')]}
+        if rnd.randint(0, 1):
+            soname = 'lib%s.so.1()(64bit)' % name
+            pkg['provides'].append((soname, None, (None, None, None)))
+            pkg['files'].append(('/usr/lib64/lib%s.so.1' % name, 'file'))
+            provides.append(soname)
+        if rnd.randint(0, 4) == 0:
+            provides.append('/usr/bin/%s' % name)
+        provides.append(name)
+
+        #  Only require things provided by pkgs. already generated, so
+        # everything is resolvable.
+        if len(provides) > 1:
+            nreqs = min(len(provides) - 1, rnd.randint(0, density * 2))
+            for req in rnd.sample(provides[:-1], nreqs):
+                pkg['requires'].append((req, None, (None, None, None)))
+        if rnd.randint(0, 99) == 0:
+            pkg['obsoletes'].append(('old-%s' % name, 'LT',
+                                     ('0', ver, None)))
+        if rnd.randint(0, 199) == 0:
+            pkg['conflicts'].append((rnd.choice(provides), 'LT',
+                                     ('0', '1.0', None)))
+        avail.append(pkg)
+
+    inst = []
+    for pkg in rnd.sample(avail, min(num_inst, len(avail))):
+        rel = int(pkg['release'].split('.')[0]) - 1
+        inst.append((pkg, '%d.fc20' % rel))
+
+    for (num, (pkg, rel)) in enumerate(inst[:broken]):
+        bpkg = pkg.copy()
+        bpkg['requires'] = pkg['requires'] + [('bench-missing-%d' % num, None,
+                                               (None, None, None))]
+        avail[avail.index(pkg)] = bpkg
+    return avail, inst
+
+_primary_schema = [
+ """CREATE TABLE db_info (dbversion INTEGER, checksum TEXT)""",
+ """CREATE TABLE packages (pkgKey INTEGER PRIMARY KEY, pkgId TEXT, name TEXT,
+    arch TEXT, version TEXT, epoch TEXT, release TEXT, summary TEXT,
+    description TEXT, url TEXT, time_file INTEGER, time_build INTEGER,
+    rpm_license TEXT, rpm_vendor TEXT, rpm_group TEXT, rpm_buildhost TEXT,
+    rpm_sourcerpm TEXT, rpm_header_start INTEGER, rpm_header_end INTEGER,
+    rpm_packager TEXT, size_package INTEGER, size_installed INTEGER,
+    size_archive INTEGER, location_href TEXT, location_base TEXT,
+    checksum_type TEXT)""",
+ """CREATE TABLE files (name TEXT, type TEXT, pkgKey INTEGER)""",
+ """CREATE TABLE requires (name TEXT, flags TEXT, epoch TEXT, version TEXT,
+    release TEXT, pkgKey INTEGER, pre BOOLEAN DEFAULT FALSE)""",
+ """CREATE TABLE provides (name TEXT, flags TEXT, epoch TEXT, version TEXT,
+    release TEXT, pkgKey INTEGER)""",
+ """CREATE TABLE conflicts (name TEXT, flags TEXT, epoch TEXT, version TEXT,
+    release TEXT, pkgKey INTEGER)""",
+ """CREATE TABLE obsoletes (name TEXT, flags TEXT, epoch TEXT, version TEXT,
+    release TEXT, pkgKey INTEGER)""",
+ """CREATE INDEX packagename ON packages (name)""",
+ """CREATE INDEX packageId ON packages (pkgId)""",
+ """CREATE INDEX filenames ON files (name)""",
+ """CREATE INDEX pkgfiles ON files (pkgKey)""",
+ """CREATE INDEX pkgrequires ON requires (pkgKey)""",
+ """CREATE INDEX requiresname ON requires (name)""",
+ """CREATE INDEX pkgprovides ON provides (pkgKey)""",
+ """CREATE INDEX providesname ON provides (name)""",
+ """CREATE INDEX pkgconflicts ON conflicts (pkgKey)""",
+ """CREATE INDEX pkgobsoletes ON obsoletes (pkgKey)""",
+]
+
+def _pkgId(pkg):
+    pkgId = misc.Checksums(['sha256'])
+    pkgId.update('%(name)s-%(epoch)s:%(version)s-%(release)s.%(arch)s' % pkg)
+    return pkgId.hexdigest()
+
+def _db_checksum(pkgIds):
+    csum = misc.Checksums(['sha256'])
+    csum.update(str(len(pkgIds)))
+    for pkgId in pkgIds:
+        csum.update(pkgId)
+    return csum.hexdigest()
+
+def write_primary(fn, avail):
+    """ Write the pkgs. as a createrepo style primary.sqlite. """
+    conn = sqlite.connect(fn)
+    cur = conn.cursor()
+    for sql in _primary_schema:
+        cur.execute(sql)
+    pkgs = []
+    prcos = {'requires' : [], 'provides' : [],
+             'conflicts' : [], 'obsoletes' : []}
+    files = []
+    for pkgKey, pkg in enumerate(avail):
+        nevra = '%(name)s-%(version)s-%(release)s.%(arch)s' % pkg
+        pkgs.append((pkgKey, _pkgId(pkg), pkg['name'], pkg['arch'],
+                     pkg['version'], pkg['epoch'], pkg['release'],
+                     pkg['summary'], pkg['description'], pkg['url'],
+                     1400000000, 1400000000, 'GPLv2+', 'Bench', 'System',
+                     'bench.example.com', '%s.src.rpm' % nevra, 0, 0,
+                     'Bench', 1024, 4096, 4096,
+                     'Packages/%s.rpm' % nevra, None, 'sha256'))
+        for prcotype in prcos:
+            for (name, flags, (e, v, r)) in pkg[prcotype]:
+                prcos[prcotype].append((name, flags, e, v, r, pkgKey))
+        for (name, ftype) in pkg['files']:
+            files.append((name, ftype, pkgKey))
+    cur.executemany("INSERT INTO packages VALUES (%s)" % ",".join("?" * 26),
+                    pkgs)
+    for prcotype in prcos:
+        cur.executemany("INSERT INTO %s (name, flags, epoch, version, release,"
+                        " pkgKey) VALUES (?, ?, ?, ?, ?, ?)" % prcotype,
+                        prcos[prcotype])
+    cur.executemany("INSERT INTO files VALUES (?, ?, ?)", files)
+    cur.execute("INSERT INTO db_info VALUES (10, ?)",
+                (_db_checksum([pkg[1] for pkg in pkgs]),))
+    conn.commit()
+    conn.close()
+
+_filelists_schema = [
+ """CREATE TABLE db_info (dbversion INTEGER, checksum TEXT)""",
+ """CREATE TABLE packages (pkgKey INTEGER PRIMARY KEY, pkgId TEXT)""",
+ """CREATE TABLE filelist (pkgKey INTEGER, dirname TEXT, filenames TEXT,
+    filetypes TEXT)""",
+ """CREATE INDEX keyfile ON filelist (pkgKey)""",
+ """CREATE INDEX pkgId ON packages (pkgId)""",
+ """CREATE INDEX dirnames ON filelist (dirname)""",
+]
+
+def write_filelists(fn, avail):
+    """ Write the pkgs. as a createrepo style filelists.sqlite, needed when
+        pkgs. are removed from the transaction (Eg. by skip-broken). """
+    conn = sqlite.connect(fn)
+    cur = conn.cursor()
+    for sql in _filelists_schema:
+        cur.execute(sql)
+    pkgs = []
+    files = []
+    for pkgKey, pkg in enumerate(avail):
+        pkgs.append((pkgKey, _pkgId(pkg)))
+        dirs = {}
+        for (name, ftype) in pkg['files']:
+            (dirname, basename) = name.rsplit('/', 1)
+            dirs.setdefault(dirname, []).append((basename, ftype[0]))
+        for dirname in sorted(dirs):
+            files.append((pkgKey, dirname,
+                          '/'.join([fname for (fname, ftype) in dirs[dirname]]),
+                          ''.join([ftype for (fname, ftype) in dirs[dirname]])))
+    cur.executemany("INSERT INTO packages VALUES (?, ?)", pkgs)
+    cur.executemany("INSERT INTO filelist VALUES (?, ?, ?, ?)", files)
+    cur.execute("INSERT INTO db_info VALUES (10, ?)",
+                (_db_checksum([pkg[1] for pkg in pkgs]),))
+    conn.commit()
+    conn.close()
+
+_repomd = """<?xml version="1.0" encoding="UTF-8"?>
+<repomd xmlns="http://linux.duke.edu/metadata/repo">
+  <revision>%(timestamp)d</revision>
+%(data)s</repomd>
+"""
+
+_repomd_data = """  <data type="%(mdtype)s_db">
+    <checksum type="sha256">%(checksum)s</checksum>
+    <open-checksum type="sha256">%(openchecksum)s</open-checksum>
+    <location href="repodata/%(mdtype)s.sqlite.bz2"/>
+    <timestamp>%(timestamp)d</timestamp>
+    <database_version>10</database_version>
+    <size>%(size)d</size>
+    <open-size>%(opensize)d</open-size>
+  </data>
+"""
+
+def write_repo(repodir, avail):
+    """ Write repodata/ for the pkgs. into repodir. """
+    os.makedirs(repodir + '/repodata')
+    timestamp = int(time.time())
+    data = []
+    for (mdtype, func) in (('primary', write_primary),
+                           ('filelists', write_filelists)):
+        db_fn = '%s/%s.sqlite' % (repodir, mdtype)
+        func(db_fn, avail)
+        dbdata = open(db_fn).read()
+        os.unlink(db_fn)
+        bz_fn = '%s/repodata/%s.sqlite.bz2' % (repodir, mdtype)
+        fo = open(bz_fn, 'w')
+        fo.write(bz2.compress(dbdata))
+        fo.close()
+        opencsum = misc.Checksums(['sha256'])
+        opencsum.update(dbdata)
+        data.append(_repomd_data % {'mdtype' : mdtype,
+                                    'timestamp' : timestamp,
+                                    'checksum' : misc.checksum('sha256',
+                                                               bz_fn),
+                                    'openchecksum' : opencsum.hexdigest(),
+                                    'size' : os.path.getsize(bz_fn),
+                                    'opensize' : len(dbdata)})
+    fo = open(repodir + '/repodata/repomd.xml', 'w')
+    fo.write(_repomd % {'timestamp' : timestamp, 'data' : ''.join(data)})
+    fo.close()
+
+def gen_rpmdb(inst):
+    """ A FakeRpmDb with an older release of each of the inst pkgs. """
+    rpmdb = FakeRpmDb()
+    repo = FakeRepo('installed')
+    for (pkg, rel) in inst:
+        po = FakePackage(pkg['name'], pkg['version'], rel, pkg['epoch'],
+                         pkg['arch'], repo=repo)
+        for (name, flags, evr) in pkg['provides'][1:]:
+            po.addProvides(name, flags, evr)
+        for (name, flags, evr) in pkg['requires']:
+            po.addRequires(name, flags, evr)
+        for (name, ftype) in pkg['files']:
+            po.addFile(name, ftype)
+        po.repoid = 'installed'
+        rpmdb.addPackage(po)
+    return rpmdb
+
+class Timer:
+    def __init__(self):
+        self.times = {}
+        self.order = []
+
+    def __call__(self, phase, func, *args, **kwargs):
+        beg = time.time()
+        ret = func(*args, **kwargs)
+        if phase not in self.times:
+            self.order.append(phase)
+            self.times[phase] = []
+        self.times[phase].append(time.time() - beg)
+        return ret
+
+def run(tmpdir, repodir, rpmdb, searches, patterns, timer, distro_sync=False,
+        skip_broken=False):
+    """ One full pass, with a new YumBase (but the same cachedir, so only the
+        first pass has to decompress the repodata). Depsolve an update of
+        everything, or a distro-sync. """
+    yb = YumBaseCli()
+    yb.preconf.fn = '/dev/null'
+    yb.preconf.init_plugins = False
+    yb.preconf.debuglevel = 0
+    yb.preconf.errorlevel = 0
+    yb.preconf.arch = 'x86_64'
+    yb.preconf.releasever = '20'
+    yb.conf.cachedir = tmpdir + '/cache'
+    yb.conf.persistdir = tmpdir + '/persist'
+    yb.conf.reposdir = []
+    yb.conf.history_record = False
+    yb.add_enable_repo('bench', ['file://' + repodir], gpgcheck=False)
+    yb.rpmdb = rpmdb
+
+    timer('doSackSetup', yb.doSackSetup)
+    timer('returnPackages', yb.pkgSack.returnPackages)
+    timer('returnPackages(patterns)', yb.pkgSack.returnPackages,
+          patterns=patterns)
+    # The installed pkgs. aren't a real rpmdb, so only search the repo.
+    timer('searchGenerator', lambda: list(yb.searchGenerator(
+                ['name', 'summary', 'description', 'url'], searches,
+                searchrpmdb=False)))
+    timer('doUpdateSetup', yb.doUpdateSetup)
+    if distro_sync:
+        yb.distroSyncPkgs([])
+    else:
+        yb.update()
+    (rescode, restring) = timer('resolveDeps', yb.resolveDeps)
+    if skip_broken:
+        yb.conf.skip_broken = True
+        (rescode, restring) = timer('_doSkipBroken', yb._doSkipBroken,
+                                    rescode, restring)
+    # What the depsolver does in its loops, Eg. _checkRemove() per requirer.
+    timer('getMembersWithState', lambda: [yb.tsInfo.getMembersWithState(
+                None, TS_REMOVE_STATES) for txmbr in yb.tsInfo])
+    ret = {'updates' : len(yb.up.getUpdatesList()),
+           'transaction' : len(yb.tsInfo),
+           'skipped' : len(yb.skipped_packages),
+           'resolved' : rescode == 2}
+    yb.close()
+    return ret
+
+def main():
+    parser = OptionParser(usage="%prog [options]")
+    parser.add_option("--packages", type="int", default=20000,
+                      help="number of available packages")
+    parser.add_option("--installed", type="int", default=1500,
+                      help="number of installed packages")
+    parser.add_option("--density", type="int", default=3,
+                      help="average requires per package")
+    parser.add_option("--runs", type="int", default=3,
+                      help="number of passes, the first has a cold cache")
+    parser.add_option("--seed", type="int", default=1234)
+    parser.add_option("--distro-sync", action="store_true", default=False,
+                      help="depsolve a distro-sync, instead of an update")
+    parser.add_option("--broken", type="int", default=0,
+                      help="number of updates with missing requires, which "
+                           "skip-broken has to remove")
+    parser.add_option("-o", "--output", help="write the results as JSON")
+    (opts, args) = parser.parse_args()
+
+    avail, inst = gen_repo(opts.packages, opts.installed, opts.density,
+                           opts.seed, opts.broken)
+    tmpdir = tempfile.mkdtemp(prefix='yum-bench-')
+    try:
+        repodir = tmpdir + '/repo'
+        beg = time.time()
+        write_repo(repodir, avail)
+        gen_time = time.time() - beg
+        rpmdb = gen_rpmdb(inst)
+        searches = ['python', 'pkg1']
+        patterns = ['pkg1*', 'pkg2?-lib', 'pkg%d-*' % (len(avail) / 2)]
+
+        print "Available:", len(avail), "Installed:", len(inst),
+        print "Density:", opts.density, "Repo write: %.3fs" % gen_time
+        timer = Timer()
+        result = None
+        for num in range(opts.runs):
+            result = run(tmpdir, repodir, rpmdb, searches, patterns, timer,
+                         opts.distro_sync, opts.broken > 0)
+    finally:
+        shutil.rmtree(tmpdir)
+
+    print "%-26s %10s %10s %10s" % ("", "cold", "best", "mean")
+    for phase in timer.order:
+        times = timer.times[phase]
+        print "%-26s %9.3fs %9.3fs %9.3fs" % (phase, times[0], min(times),
+                                              sum(times) / len(times))
+    print "Updates:", result['updates'], "Transaction:", result['transaction'],
+    print "Skipped:", result['skipped']
+    if not result['resolved']:
+        print "** Depsolve failed!"
+
+    if opts.output:
+        import json
+        data = {'version' : yum.__version__,
+                'python' : sys.version.split()[0],
+                'timestamp' : int(time.time()),
+                'packages' : len(avail), 'installed' : len(inst),
+                'density' : opts.density, 'seed' : opts.seed,
+                'runs' : opts.runs, 'distro_sync' : opts.distro_sync,
+                'broken' : opts.broken,
+                'results' : result,
+                'phases' : timer.times}
+        fo = open(opts.output, 'w')
+        json.dump(data, fo, indent=2, sort_keys=True)
+        fo.write('\n')
+        fo.close()
+
+    if not result['resolved']:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
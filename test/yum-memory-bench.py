@@ -0,0 +1,180 @@
+#! /usr/bin/python -tt
+
+# Measure the memory used by "yum list available" and "yum check-update" on
+# the same synthetic repo. as yum-bench.py. Each command is run in a new
+# process, so the RSS growth is just for that command. To compare against
+# another version of yum, point --baseline at a checkout of it, Eg.
+# git worktree add /tmp/yum-old HEAD~1
+# ./yum-memory-bench.py --baseline=/tmp/yum-old
+# ./yum-memory-bench.py --packages=40000 --installed=2000 -o res.json
+
+import os
+import sys
+import time
+import shutil
+import tempfile
+import cPickle
+import resource
+import gc
+import subprocess
+from optparse import OptionParser, SUPPRESS_HELP
+
+_commands = ['list available', 'check-update']
+_bench_fn = os.path.dirname(os.path.abspath(__file__)) + '/yum-bench.py'
+
+def _rss():
+    """ RSS of this process, in KB. The peak RSS isn't any good here, as
+        Linux carries it over from the parent when we fork. """
+    if os.path.exists('/proc/self/statm'):
+        pages = int(open('/proc/self/statm').read().split()[1])
+        return pages * resource.getpagesize() / 1024
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+def child(tree, tmpdir, command):
+    """ Run a single command against the repo. in tmpdir, with yum from tree
+        (or this checkout), and print the results as JSON. """
+    import settestpath
+    if tree:
+        sys.path.insert(0, tree)
+    import imp
+    bench = imp.load_source('yum_bench', _bench_fn)
+    import yum
+
+    #  Don't generate the repo. here, or the memory for it gets reused by the
+    # packages and we don't see them.
+    inst = cPickle.load(open(tmpdir + '/installed.pickle'))
+    rpmdb = bench.gen_rpmdb(inst)
+    del inst
+
+    yb = yum.YumBase()
+    yb.preconf.fn = '/dev/null'
+    yb.preconf.init_plugins = False
+    yb.preconf.debuglevel = 0
+    yb.preconf.errorlevel = 0
+    yb.preconf.arch = 'x86_64'
+    yb.preconf.releasever = '20'
+    yb.conf.cachedir = tmpdir + '/cache'
+    yb.conf.persistdir = tmpdir + '/persist'
+    yb.conf.reposdir = []
+    yb.conf.history_record = False
+    yb.add_enable_repo('bench', ['file://' + tmpdir + '/repo'], gpgcheck=False)
+    yb.rpmdb = rpmdb
+
+    gc.collect()
+    beg_rss = _rss()
+    beg = time.time()
+    lines = []
+    if command == 'list available':
+        ypl = yb.doPackageLists('available')
+        pkgs = ypl.available
+    else:
+        ypl = yb.doPackageLists('updates')
+        pkgs = ypl.updates
+        ypl = yb.doPackageLists('obsoletes')
+        pkgs.extend(ypl.obsoletes)
+    for po in pkgs:
+        lines.append('%s.%s %s %s' % (po.name, po.arch, po.printVer(),
+                                      po.ui_from_repo))
+    end = time.time()
+    gc.collect()
+    end_rss = _rss()
+
+    import json
+    print json.dumps({'version' : yum.__version__,
+                      'path' : os.path.dirname(yum.__file__),
+                      'packages' : len(pkgs),
+                      'time' : end - beg,
+                      'rss' : end_rss - beg_rss})
+
+def run(tree, tmpdir, command):
+    """ Run the command in a new process, return the results. """
+    cmd = [sys.executable, os.path.abspath(__file__),
+           '--child=' + command, '--tmpdir=' + tmpdir]
+    if tree:
+        cmd.append('--baseline=' + tree)
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE,
+                            cwd=os.path.dirname(os.path.abspath(__file__)))
+    out = proc.communicate()[0]
+    if proc.returncode:
+        print >> sys.stderr, "Failed:", command, tree or ''
+        sys.exit(1)
+    import json
+    return json.loads(out.splitlines()[-1])
+
+def main():
+    parser = OptionParser(usage="%prog [options]")
+    parser.add_option("--packages", type="int", default=20000,
+                      help="number of available packages")
+    parser.add_option("--installed", type="int", default=1500,
+                      help="number of installed packages")
+    parser.add_option("--density", type="int", default=3,
+                      help="average requires per package")
+    parser.add_option("--seed", type="int", default=1234)
+    parser.add_option("--baseline",
+                      help="a yum checkout to compare against")
+    parser.add_option("-o", "--output", help="write the results as JSON")
+    parser.add_option("--child", help=SUPPRESS_HELP)
+    parser.add_option("--tmpdir", help=SUPPRESS_HELP)
+    (opts, args) = parser.parse_args()
+
+    if opts.child:
+        child(opts.baseline, opts.tmpdir, opts.child)
+        return
+
+    import settestpath
+    import imp
+    bench = imp.load_source('yum_bench', _bench_fn)
+
+    avail, inst = bench.gen_repo(opts.packages, opts.installed, opts.density,
+                                 opts.seed)
+    trees = [('current', None)]
+    if opts.baseline:
+        trees.insert(0, ('baseline', opts.baseline))
+    results = {}
+    tmpdir = tempfile.mkdtemp(prefix='yum-memory-bench-')
+    try:
+        bench.write_repo(tmpdir + '/repo', avail)
+        cPickle.dump(inst, open(tmpdir + '/installed.pickle', 'w'))
+        for (name, tree) in trees:
+            # Get the repodata into the cache, so it's the same for everyone.
+            run(tree, tmpdir, 'list available')
+            results[name] = {}
+            for command in _commands:
+                results[name][command] = run(tree, tmpdir, command)
+    finally:
+        shutil.rmtree(tmpdir)
+
+    print "Available:", len(avail), "Installed:", len(inst),
+    print "Density:", opts.density
+    print "%-10s %-16s %8s %12s %10s %9s" % ("", "command", "pkgs", "RSS",
+                                            "per pkg", "time")
+    for (name, tree) in trees:
+        for command in _commands:
+            res = results[name][command]
+            per_pkg = (res['rss'] * 1024) / max(res['packages'], 1)
+            print "%-10s %-16s %8d %10dKB %9dB %8.3fs" % (name, command,
+                                                        res['packages'],
+                                                        res['rss'], per_pkg,
+                                                        res['time'])
+    if opts.baseline:
+        for command in _commands:
+            old = results['baseline'][command]['rss']
+            new = results['current'][command]['rss']
+            print "%-16s RSS change: %+.1f%%" % (command,
+                                                 (new - old) * 100.0 /
+                                                 max(old, 1))
+
+    if opts.output:
+        import json
+        data = {'python' : sys.version.split()[0],
+                'timestamp' : int(time.time()),
+                'packages' : len(avail), 'installed' : len(inst),
+                'density' : opts.density, 'seed' : opts.seed,
+                'results' : results}
+        fo = open(opts.output, 'w')
+        json.dump(data, fo, indent=2, sort_keys=True)
+        fo.write('\n')
+        fo.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+import unittest
+import tempfile
+import shutil
+import os
+import settestpath
+
+from yum import rpmsack
+
+_pkgtup1 = ('foo', 'noarch', '0', '1.0', '1')
+_pkgtup2 = ('bar', 'x86_64', '1', '2.0', '3')
+
+class SqliteYumDBTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.db_path = self.tmpdir + '/yumdb'
+        self.version_path = self.tmpdir + '/version'
+
+        # Some data in the old dirs. layout, for the migration.
+        ydb = rpmsack.RPMDBAdditionalData(db_path=self.db_path,
+                                          version_path=self.version_path)
+        pkg = ydb.get_package(pkgtup=_pkgtup1, pkgid='abcd')
+        pkg.from_repo = 'base'
+        pkg.reason = 'user'
+        pkg = ydb.get_package(pkgtup=_pkgtup2, pkgid='ef01')
+        pkg.from_repo = 'updates'
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def _yumdb(self):
+        return rpmsack.RPMDBAdditionalDataSqlite(db_path=self.db_path,
+                                                 version_path=self.version_path)
+
+    def testMigrate(self):
+        ydb = self._yumdb()
+        self.assertTrue(os.path.exists(self.db_path + '/yumdb.sqlite'))
+        pkg = ydb.get_package(pkgtup=_pkgtup1, pkgid='abcd')
+        self.assertEquals(pkg.from_repo, 'base')
+        self.assertEquals(pkg.reason, 'user')
+        self.assertEquals(sorted(pkg), ['from_repo', 'reason'])
+        self.assertFalse('installed_by' in pkg)
+        self.assertEquals(pkg.get('installed_by', 'x'), 'x')
+
+    def testWrite(self):
+        ydb = self._yumdb()
+        pkg = ydb.get_package(pkgtup=_pkgtup2, pkgid='ef01')
+        self.assertEquals(pkg.from_repo, 'updates')
+        pkg.from_repo = 'updates-testing'
+        pkg.installed_by = 4
+        del pkg.from_repo
+        self.assertFalse('from_repo' in pkg)
+
+        # Nothing is written until it's committed.
+        pkg = self._yumdb().get_package(pkgtup=_pkgtup2, pkgid='ef01')
+        self.assertEquals(pkg.from_repo, 'updates')
+        self.assertFalse('installed_by' in pkg)
+        ydb.commit()
+
+        # New object, so it isn't cached.
+        pkg = self._yumdb().get_package(pkgtup=_pkgtup2, pkgid='ef01')
+        self.assertEquals(pkg.installed_by, '4')
+        self.assertFalse('from_repo' in pkg)
+        pkg.clean()
+        self.assertEquals(list(pkg), [])
+
+    def testVersionCacheBreakers(self):
+        data_path = self.tmpdir + '/pkgtups-yumdb'
+        for ydb in (self._yumdb(),
+                    rpmsack.RPMDBAdditionalData(db_path=self.db_path,
+                                                version_path=self.version_path)):
+            pkg = ydb.get_package(pkgtup=_pkgtup1, pkgid='abcd')
+            open(self.version_path, 'w').close()
+            open(data_path, 'w').close()
+            pkg.reason = 'dep'
+            self.assertTrue(os.path.exists(self.version_path))
+            self.assertTrue(os.path.exists(data_path))
+            pkg.from_repo = 'updates'
+            self.assertTrue(os.path.exists(self.version_path))
+            self.assertFalse(os.path.exists(data_path))
+            open(data_path, 'w').close()
+            del pkg.from_repo_revision
+            self.assertFalse(os.path.exists(data_path))
+            open(data_path, 'w').close()
+            pkg.checksum_type = 'sha256'
+            self.assertFalse(os.path.exists(self.version_path))
+            self.assertFalse(os.path.exists(data_path))
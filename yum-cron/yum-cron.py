@@ -2,11 +2,14 @@
 import os
 import sys
 import gzip
+import json
+import time
 from socket import gethostname
 
 import yum
 import yum.Errors
 from yum.config import BaseConfig, Option, IntOption, ListOption, BoolOption
+from yum.config import SecondsOption
 from yum.parser import ConfigPreProcessor
 from ConfigParser import ConfigParser, ParsingError
 from yum.constants import *
@@ -15,6 +18,7 @@ from yum.i18n import to_str, to_utf8, to_unicode, utf8_width, utf8_width_fill, u
 from yum import  _, P_
 import yum.updateinfo
 import smtplib
+import urlgrabber.grabber
 from random import random
 from time import sleep
 from yum.misc import setup_locale
@@ -273,6 +277,11 @@ class YumCronConfig(BaseConfig):
     update_cmd = Option("default")
     apply_updates = BoolOption(False)
     download_updates = BoolOption(False)
+    prefetch_metadata = BoolOption(False)
+    prefetch_ahead = SecondsOption(60 * 90)
+    prefetch_jitter = SecondsOption(60 * 30)
+    prefetch_workers = IntOption(4, range_min=1)
+    prefetch_mdtypes = ListOption(['primary', 'updateinfo'])
     yum_config_file = Option("/etc/yum.conf")
     group_list = ListOption([])
     group_package_types = ListOption(['mandatory', 'default'])
@@ -409,6 +418,101 @@ class YumCronBase(yum.YumBase, YumOutput):
         self.pkgSack # honor skip_if_unavailable
         self.upinfo
 
+    def _prefetchDue(self, repo, now):
+        """Return True if the metadata for *repo* will expire within
+        prefetch_ahead seconds, plus some random jitter, of *now*.
+        """
+        if repo.metadata_expire == -1:
+            return False
+        ahead = self.opts.prefetch_ahead
+        ahead += random() * self.opts.prefetch_jitter
+        if not os.path.exists(repo.metadata_cookie):
+            return True
+        cookie = os.stat(repo.metadata_cookie).st_mtime
+        return cookie + repo.metadata_expire - ahead <= now
+
+    def _prefetchRecord(self, freshness, repo, expire, now):
+        """Record how fresh the metadata for *repo*, which expires after
+        *expire* seconds, is in *freshness*.  Noting if it was refreshed
+        since *now*.
+        """
+        data = {'checked' : int(now), 'refreshed' : None, 'expires' : None,
+                'error' : None}
+        if not repo.isEnabled():
+            data['error'] = 'disabled, metadata could not be downloaded'
+        elif os.path.exists(repo.metadata_cookie):
+            cookie = int(os.stat(repo.metadata_cookie).st_mtime)
+            if cookie >= int(now):
+                data['refreshed'] = cookie
+            if expire != -1:
+                data['expires'] = cookie + expire
+        freshness[repo.id] = data
+
+    def _prefetchSave(self, freshness):
+        """Merge *freshness* into the saved prefetch-freshness.json."""
+        fname = self.conf.persistdir + '/prefetch-freshness.json'
+        data = {}
+        try:
+            data = json.load(open(fname))
+        except (IOError, ValueError):
+            pass
+        data.update(freshness)
+        try:
+            fo = open(fname + '.tmp', 'w')
+            json.dump(data, fo, indent=1, sort_keys=True)
+            fo.close()
+            os.rename(fname + '.tmp', fname)
+        except (IOError, OSError), e:
+            self.logger.warn("Failed to save metadata freshness: %s", e)
+
+    def prefetchMetadata(self):
+        """Refresh the metadata for any repositories that will expire
+        soon, so that interactive commands find a current cache.  The
+        repositories are refreshed in parallel, at most prefetch_workers
+        at a time, and the freshness of each is saved to
+        prefetch-freshness.json in the persistdir.
+        """
+        now = time.time()
+        enabled = []
+        due = []
+        for repo in self.repos.sort():
+            if not repo.isEnabled():
+                continue
+            enabled.append((repo, repo.metadata_expire))
+            repo.skip_if_unavailable = True
+            if self._prefetchDue(repo, now):
+                repo.metadata_expire = 0
+                due.append(repo)
+
+        #  Set up the repos. as usual (plugin hooks, gpg callbacks, etc.), but
+        # the due ones are downloaded below, prefetch_workers at a time.
+        self.repos.doSetup(retrieve=False)
+
+        mdtypes = self.opts.prefetch_mdtypes
+        freshness = {}
+        workers = self.opts.prefetch_workers
+        async = hasattr(urlgrabber.grabber, 'parallel_wait')
+        due = [repo for repo in due if repo.isEnabled()]
+        while due:
+            repos, due = due[:workers], due[workers:]
+            if async:
+                self.repos.retrieveAllMD([repo for repo in repos
+                                          if repo._async], mdtypes)
+            for repo in repos:
+                if async and repo._async:
+                    continue
+                # retrieveAllMD() skips these, so download them one by one.
+                try:
+                    if repo._commonLoadRepoXML(repo):
+                        repo._commonRetrieveDataMD(mdtypes)
+                except yum.Errors.RepoError, e:
+                    self.logger.warn("%s", e)
+                    self.repos.disableRepo(repo.id)
+
+        for (repo, expire) in enabled:
+            self._prefetchRecord(freshness, repo, expire, now)
+        self._prefetchSave(freshness)
+
     def refreshUpdates(self):
         """Check whether updates are available.
 
@@ -599,7 +703,10 @@ class YumCronBase(yum.YumBase, YumOutput):
         self.run_with_package_names.add("yum-cron")
 
         # Update the metadata
-        self.populateUpdateMetadata()
+        if self.opts.prefetch_metadata:
+            self.prefetchMetadata()
+        else:
+            self.populateUpdateMetadata()
 
         # Exit if we don't need to check for updates
         if not (self.opts.update_messages or self.opts.download_updates or self.opts.apply_updates):
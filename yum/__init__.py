@@ -89,7 +89,7 @@ warnings.simplefilter("ignore", Errors.YumFutureDeprecationWarning)
 
 from packages import parsePackages, comparePoEVR
 from packages import YumAvailablePackage, YumLocalPackage, YumInstalledPackage
-from packages import YumUrlPackage, YumNotFoundPackage
+from packages import YumUrlPackage, YumNotFoundPackage, verify_local_file
 from constants import *
 from yum.rpmtrans import RPMTransaction,SimpleCliCallBack
 from yum.i18n import to_unicode, to_str, exception2msg
@@ -668,7 +668,10 @@ class YumBase(depsolve.Depsolve):
                                     _('Reading Local RPMDB'))
             self._rpmdb = rpmsack.RPMDBPackageSack(root=self.conf.installroot,
                                                    releasever=self.conf.yumvar['releasever'],
-                                                   persistdir=self.conf.persistdir)
+                                                   persistdir=self.conf.persistdir,
+                                                   use_index=self.conf.rpmdb_index,
+                                                   yumdb_backend=self.conf.yumdb_backend,
+                                                   cache_size=self.conf.lookup_cache_size)
             self.verbose_logger.debug('rpmdb time: %0.3f' % (time.time() - rpmdb_st))
         return self._rpmdb
 
@@ -1067,7 +1070,8 @@ class YumBase(depsolve.Depsolve):
             pdb_path = self.conf.persistdir + "/history"
             self._history = yum.history.YumHistory(root=self.conf.installroot,
                                                    db_path=pdb_path,
-                                                   releasever=self.conf.yumvar['releasever'])
+                                                   releasever=self.conf.yumvar['releasever'],
+                                                   wal=self.conf.history_wal)
         return self._history
     
     def _getFSsnap(self):
@@ -1210,6 +1214,7 @@ class YumBase(depsolve.Depsolve):
         
         self.plugins.run('preresolve')
         ds_st = time.time()
+        self._dsprof = depsolve.DepsolveProfile(self.rpmdb)
 
         (rescode, restring) = self.resolveDeps()
         self._limit_installonly_pkgs()
@@ -1368,6 +1373,10 @@ much more problems).
         if rescode == 2:
             self.save_ts(auto=True)
         self.verbose_logger.debug('Depsolve time: %0.3f' % (time.time() - ds_st))
+        self._dsprof.finish(self.rpmdb)
+        if self._depsolve_profile_enabled():
+            self.verbose_logger.log(logginglevels.INFO_2,
+                                    'Depsolve profile: %s', self._dsprof.json())
         return rescode, restring
 
     def _doSkipBroken(self,rescode, restring, clear_skipped=True):
@@ -1450,8 +1459,8 @@ much more problems).
                 if looping > 2:
                     break # Bail out
                 else:
-                    self.verbose_logger.debug('SKIPBROKEN: resetting already resolved packages (no packages to skip)' )
-                    self.tsInfo.resetResolved(hard=True)
+                    num = self.tsInfo.resetChangedResolved()
+                    self.verbose_logger.debug('SKIPBROKEN: resetting %d already resolved packages (no packages to skip)', num)
             rescode, restring = self.resolveDeps(True, skipping_broken=True)
             endTs = set(self.tsInfo)
              # Check if tsInfo has changes since we started to skip packages
@@ -1463,8 +1472,8 @@ much more problems).
                 if looping > 2:
                     break # Bail out
                 else:
-                    self.verbose_logger.debug('SKIPBROKEN: resetting already resolved packages (transaction not changed)' )
-                    self.tsInfo.resetResolved(hard=True)
+                    num = self.tsInfo.resetChangedResolved()
+                    self.verbose_logger.debug('SKIPBROKEN: resetting %d already resolved packages (transaction not changed)', num)
             else: 
                 # Reset the looping counter, because it is only a loop if the same transaction is
                 # unchanged two times in row, not if it has been unchanged in a early stage.
@@ -1681,12 +1690,16 @@ much more problems).
 
         ignore_pkgtups = set((pkg.pkgtup for pkg in ignore_pkgs))
 
+        workers = self.conf.check_workers
+        if workers < 0:
+            workers *= -misc.num_cpus_online()
+
         rc = 0
         probs = []
         if chkcmd.intersection(set(('all', 'dependencies'))):
             prob2ui = {'requires' : _('missing requires'),
                        'conflicts' : _('installed conflict')}
-            for prob in self.rpmdb.check_dependencies():
+            for prob in self.rpmdb.check_dependencies(workers=workers):
                 if prob.pkg.pkgtup in ignore_pkgtups:
                     continue
                 if prob.problem == 'conflicts':
@@ -1701,7 +1714,7 @@ much more problems).
 
         if chkcmd.intersection(set(('all', 'duplicates'))):
             iopkgs = set(self.conf.installonlypkgs)
-            for prob in self.rpmdb.check_duplicates(iopkgs):
+            for prob in self.rpmdb.check_duplicates(iopkgs, workers=workers):
                 if prob.pkg.pkgtup in ignore_pkgtups:
                     continue
                 if prob.duplicate.pkgtup in ignore_pkgtups:
@@ -1709,7 +1722,7 @@ much more problems).
                 probs.append(prob)
 
         if chkcmd.intersection(set(('all', 'obsoleted'))):
-            for prob in self.rpmdb.check_obsoleted():
+            for prob in self.rpmdb.check_obsoleted(workers=workers):
                 if prob.pkg.pkgtup in ignore_pkgtups:
                     continue
                 if prob.obsoleter.pkgtup in ignore_pkgtups:
@@ -1717,7 +1730,7 @@ much more problems).
                 probs.append(prob)
 
         if chkcmd.intersection(set(('all', 'provides'))):
-            for prob in self.rpmdb.check_provides():
+            for prob in self.rpmdb.check_provides(workers=workers):
                 if prob.pkg.pkgtup in ignore_pkgtups:
                     continue
                 probs.append(prob)
@@ -2059,7 +2072,10 @@ much more problems).
                     po.yumdb_info.installed_by = str(loginuid)
 
                 if self.conf.history_record:
-                    self.history.sync_alldb(po)
+                    self.history.sync_alldb(po, commit=False)
+
+        if self.conf.history_record:
+            self.history.commit()
 
         # Remove old ones after installing new ones, so we can copy values.
         for txmbr in self.tsInfo:
@@ -2466,6 +2482,36 @@ much more problems).
                 po.basepath # prefetch now; fails when repos are closed
             return False
 
+        #  Checksumming big pkgs. takes a while, so do it in a pool of threads.
+        # The pool only touches the files, everything else (rpm headers,
+        # sqlite, renames, callbacks) stays in this thread.
+        workers = self.conf.checksum_workers
+        if workers < 0:
+            workers *= -misc.num_cpus_online()
+        verify_pool = misc.WorkerPool(lambda job: verify_local_file(*job[1:]),
+                                      workers, 'checksum')
+        def checksum_job(po, filename):
+            (csum_type, csum) = po.returnIdSum()
+            return (po, filename, csum_type, csum, po.packagesize)
+
+        if workers > 1:
+            #  Checksum all the local copies we already have, so verify_local()
+            # just finds the results.
+            seen = set()
+            for po in pkglist:
+                if not hasattr(po, '_verifiedLocalPkg'):
+                    continue
+                if hasattr(po, 'pkgtype') and po.pkgtype == 'local':
+                    continue
+                local = po.localPkg()
+                if local in seen or not os.path.exists(local):
+                    continue
+                seen.add(local)
+                verify_pool.put(checksum_job(po, local))
+            for (job, nst, e) in verify_pool.wait():
+                if nst is not None:
+                    job[0]._verifiedLocalPkg(nst)
+
         pkgs = []
         for po in pkglist:
             if hasattr(po, 'pkgtype') and po.pkgtype == 'local':
@@ -2518,6 +2564,7 @@ much more problems).
         beg_download = time.time()
         all_remote_pkgs = remote_pkgs
         all_remote_size = remote_size
+        in_pool = workers > 1
         while True:
             remote_pkgs.sort(mediasort)
             #  This is kind of a hack and does nothing in non-Fedora versions,
@@ -2529,35 +2576,60 @@ much more problems).
             local_size = [0]
             done_repos = set()
             async = hasattr(urlgrabber.grabber, 'parallel_wait')
+            redownload = []
+
+            def downloaded(po, filename):
+                if po.localpath.endswith('.tmp'):
+                    rpmfile = po.localpath.rsplit('.', 2)[0]
+                    os.rename(po.localpath, rpmfile)
+                    po.localpath = rpmfile
+                local_size[0] += po.size
+                if hasattr(urlgrabber.progress, 'text_meter_total_size'):
+                    urlgrabber.progress.text_meter_total_size(remote_size,
+                                                              local_size[0])
+                if isinstance(po, DeltaPackage):
+                    presto.rebuild(po)
+                    return
+                else:
+                    presto.dequeue_max()
+
+                if po.repoid not in done_repos:
+                    done_repos.add(po.repoid)
+                    #  Check a single package per. repo. ... to give a hint to
+                    # the user on big downloads.
+                    result, errmsg = self.sigCheckPkg(po)
+                    if result != 0:
+                        self.verbose_logger.warn("%s", errmsg)
+                po.localpath = filename
+                if po in errors:
+                    del errors[po]
+
+            def verified(results):
+                """ Finish the downloads that the pool has checksummed. """
+                for (job, nst, e) in results:
+                    (po, filename) = job[:2]
+                    po.localpath = filename
+                    if nst is not None:
+                        po._verifiedLocalPkg(nst)
+                    if self.verifyPkg(filename, po, False):
+                        downloaded(po, filename)
+                    else:
+                        redownload.append(po)
+
             for po in remote_pkgs:
                 i += 1
 
-                def checkfunc(obj, po=po):
-                    self.verifyPkg(obj, po, 1)
-                    if po.localpath.endswith('.tmp'):
-                        rpmfile = po.localpath.rsplit('.', 2)[0]
-                        os.rename(po.localpath, rpmfile)
-                        po.localpath = rpmfile
-                    local_size[0] += po.size
-                    if hasattr(urlgrabber.progress, 'text_meter_total_size'):
-                        urlgrabber.progress.text_meter_total_size(remote_size,
-                                                                  local_size[0])
-                    if isinstance(po, DeltaPackage):
-                        presto.rebuild(po)
+                def checkfunc(obj, po=po,
+                              in_pool=(in_pool and async and po.repo._async and
+                                       not isinstance(po, DeltaPackage))):
+                    if in_pool:
+                        #  Don't hold up the other downloads while this one is
+                        # checksummed, verified() finishes it later.
+                        verify_pool.put(checksum_job(po, obj.filename))
+                        verified(verify_pool.done())
                         return
-                    else:
-                        presto.dequeue_max()
-
-                    if po.repoid not in done_repos:
-                        done_repos.add(po.repoid)
-                        #  Check a single package per. repo. ... to give a hint to
-                        # the user on big downloads.
-                        result, errmsg = self.sigCheckPkg(po)
-                        if result != 0:
-                            self.verbose_logger.warn("%s", errmsg)
-                    po.localpath = obj.filename
-                    if po in errors:
-                        del errors[po]
+                    self.verifyPkg(obj, po, 1)
+                    downloaded(po, obj.filename)
 
                 text = os.path.basename(po.relativepath)
                 kwargs = {}
@@ -2566,6 +2638,8 @@ much more problems).
                     kwargs['async'] = True
                 elif not (i == 1 and not local_size[0] and remote_size == po.size):
                     text = '(%s/%s): %s' % (i, len(remote_pkgs), text)
+                if isinstance(po, DeltaPackage):
+                    presto.downloading(po)
                 try:
                     po.repo.getPackage(po,
                                        checkfunc=checkfunc,
@@ -2585,6 +2659,7 @@ much more problems).
                         elif isinstance(po, DeltaPackage) and po.rpm.localpath.endswith('.tmp'):
                             misc.unlink_f(po.rpm.localpath)
                     raise
+            verified(verify_pool.wait())
             presto.dequeue_all()
             presto.wait()
 
@@ -2596,19 +2671,29 @@ much more problems).
                 if not isinstance(po, DeltaPackage):
                     fatal = True
                     break
-            if not errors or fatal:
+            if fatal or not (errors or redownload):
                 break
 
-            # there were drpm related errors *only*
-            remote_pkgs = []
+            #  Download the pkgs. that failed in the pool again, checking them
+            # as they finish this time so urlgrabber can try other mirrors.
+            remote_pkgs = redownload
             remote_size = 0
+            for po in redownload:
+                remote_size += po.size
+            in_pool = False
+            if not errors:
+                continue
+
+            # there were drpm related errors *only*
+            retry_size = 0
             for po in errors:
                 po = po.rpm
                 remote_pkgs.append(po)
-                remote_size += po.size
+                retry_size += po.size
+            remote_size += retry_size
             # callback_total needs the total pkg count
-            all_remote_pkgs.extend(remote_pkgs)
-            all_remote_size += remote_size
+            all_remote_pkgs.extend([po.rpm for po in errors])
+            all_remote_size += retry_size
             errors.clear()
             self.verbose_logger.warn(_('Some delta RPMs failed to download or rebuild. Retrying..'))
         if callback_total and not errors:
@@ -6754,6 +6839,17 @@ much more problems).
             myrepos += repo.dump()
             myrepos += '\n'
         self.history.write_addon_data('config-repos', myrepos)
+        if self._depsolve_profile_enabled():
+            self.history.write_addon_data('depsolve-profile',
+                                          self._dsprof.json() + '\n')
+
+    def _depsolve_profile_enabled(self):
+        """ Do we output/save the depsolve profile, from the config. or the
+            YUM_DEPSOLVE_PROFILE env. var. """
+        env = os.environ.get('YUM_DEPSOLVE_PROFILE')
+        if env:
+            return env != '0'
+        return self.conf.depsolve_profile
         
     def verify_plugins_cb(self, verify_package):
         """Callback to call a plugin hook for pkg.verify().
@@ -814,6 +814,9 @@ class YumConf(StartupConf):
     deltarpm = IntOption(2, range_min=-16, range_max=128)
     deltarpm_percentage = IntOption(75, range_min=0, range_max=100)
     deltarpm_metadata_percentage = IntOption(100, range_min=0)
+    populate_workers = IntOption(1, range_min=-16, range_max=128)
+    checksum_workers = IntOption(-1, range_min=-16, range_max=128)
+    check_workers = IntOption(1, range_min=-16, range_max=128)
 
     http_caching = SelectionOption('all', ('none', 'packages', 'all'))
     metadata_expire = SecondsOption(60 * 60 * 6) # Time in seconds (6h).
@@ -832,6 +835,10 @@ class YumConf(StartupConf):
     # similar but better :).
     mdpolicy = ListOption(['group:small'])
     mddownloadpolicy = SelectionOption('sqlite', ('sqlite', 'xml'))
+    prco_cache = BoolOption(True)
+    lookup_cache_size = IntOption(100000, range_min=0)
+    search_index = BoolOption(False)
+    filelists_on_demand = BoolOption(False)
     #  ('instant', 'group:all', 'group:main', 'group:small', 'group:primary'))
     multilib_policy = SelectionOption(__main_multilib_policy_default__,
                                       ('best', 'all'))
@@ -879,6 +886,7 @@ class YumConf(StartupConf):
 
     history_record = BoolOption(True)
     history_record_packages = ListOption(['yum', 'rpm'])
+    history_wal = BoolOption(False)
 
     rpmverbosity = Option('info')
 
@@ -902,6 +910,8 @@ class YumConf(StartupConf):
                                              'default' :'single-user-commands'})
 
     recheck_installed_requires = BoolOption(False)
+    rpmdb_index = BoolOption(False)
+    yumdb_backend = SelectionOption('dirs', ('dirs', 'sqlite'))
 
     fssnap_automatic_pre  = BoolOption(False)
     fssnap_automatic_post = BoolOption(False)
@@ -913,6 +923,7 @@ class YumConf(StartupConf):
     fssnap_abort_on_errors = SelectionOption('any', ('broken-setup', 'snapshot-failure', 'any', 'none'))
 
     depsolve_loop_limit = PositiveIntOption(100, names_of_0=["<forever>"])
+    depsolve_profile = BoolOption(False)
 
     autocheck_running_kernel = BoolOption(True)
 
@@ -1012,6 +1023,10 @@ class RepoConf(BaseConfig):
     #       checksumming of the repomd.xml.
     mdpolicy = Inherit(YumConf.mdpolicy)
     mddownloadpolicy = Inherit(YumConf.mddownloadpolicy)
+    prco_cache = Inherit(YumConf.prco_cache)
+    lookup_cache_size = Inherit(YumConf.lookup_cache_size)
+    search_index = Inherit(YumConf.search_index)
+    filelists_on_demand = Inherit(YumConf.filelists_on_demand)
     cost = IntOption(1000)
     
     sslcacert = Inherit(YumConf.sslcacert)
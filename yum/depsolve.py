@@ -21,6 +21,7 @@ Dependency resolution module for yum.
 import os.path
 import types
 import logging
+import time
 
 import rpmUtils.transaction
 import rpmUtils.miscutils
@@ -103,6 +104,72 @@ class _wrap_ayum_update:
     def __call__(self, *args, **kwargs):
         return self.ayum.update(*args, **kwargs)
 
+class DepsolveProfile:
+    """ Time spent in each phase of resolveDeps(), and counters of the work
+        done, so we can see where depsolving is slow. """
+
+    def __init__(self, rpmdb=None):
+        self.times = {}
+        self.calls = {}
+        self.counters = {}
+        self._beg = {}
+        self._total_beg = time.time()
+        self._total = None
+        self._cache_beg = self._cache_totals()
+        self._rpmdb = rpmdb
+        self._hdrs_beg = getattr(rpmdb, '_header_loads', 0)
+
+    @staticmethod
+    def _cache_totals():
+        hits = misses = 0
+        for stats in misc.cache_stats().itervalues():
+            hits += stats['hits']
+            misses += stats['misses']
+        return hits, misses
+
+    def start(self, phase):
+        """ Start timing a call to phase. """
+        self._beg[phase] = time.time()
+
+    def stop(self, phase):
+        """ Stop timing a call to phase. """
+        self.times[phase] = (self.times.get(phase, 0.0) +
+                             time.time() - self._beg.pop(phase))
+        self.calls[phase] = self.calls.get(phase, 0) + 1
+
+    def count(self, name, num=1):
+        """ Add num to the counter name. """
+        self.counters[name] = self.counters.get(name, 0) + num
+
+    def finish(self, rpmdb=None):
+        """ Stop the total timer, and work out the lookup cache (LRUCache)
+            hit/miss and rpm header load counts since we were created. """
+        self._total = time.time() - self._total_beg
+        hits, misses = self._cache_totals()
+        self.counters['lookup_cache_hits'] = hits - self._cache_beg[0]
+        self.counters['lookup_cache_misses'] = misses - self._cache_beg[1]
+        if rpmdb is not None:
+            hdrs = getattr(rpmdb, '_header_loads', 0)
+            if rpmdb is self._rpmdb:
+                hdrs -= self._hdrs_beg
+            self.counters['header_loads'] = hdrs
+
+    def dump(self):
+        """ Return the data as a dict. """
+        phases = {}
+        for phase in self.times:
+            phases[phase] = {'time' : round(self.times[phase], 6),
+                             'calls' : self.calls[phase]}
+        ret = {'phases' : phases, 'counters' : self.counters.copy()}
+        if self._total is not None:
+            ret['total'] = round(self._total, 6)
+        return ret
+
+    def json(self):
+        """ Return the data as a line of JSON. """
+        import json
+        return json.dumps(self.dump(), sort_keys=True)
+
 class Depsolve(object):
     """A class for resolving dependencies."""
 
@@ -121,6 +188,11 @@ class Depsolve(object):
         self.installedFileRequires = None
         self.installedUnresolvedFileRequires = None
         self._missing_requires = False
+        self._whatprovides_prefetch = {}
+        #  Set of pkgs that satisfied the deps of the txmbr being checked,
+        # see _resolveRequires().
+        self._resolved_providers = None
+        self._dsprof = DepsolveProfile()
 
     def doTsSetup(self):
         """Sets up the transaction set before it is used."""
@@ -229,8 +301,33 @@ class Depsolve(object):
         """
         self.verbose_logger.log(logginglevels.DEBUG_1, _('Searching pkgSack for dep: %s'),
             name)
+        if (name, flags, version) in self._whatprovides_prefetch:
+            pkgs = self._whatprovides_prefetch[(name, flags, version)]
+            return ListPackageSack(pkgs)
         defSack = ListPackageSack(self.pkgSack.searchProvides((name, flags, version)))
         return defSack
+
+    def _prefetchWhatProvides(self, reqs):
+        """ Lookup the providers for a list of requirements, from
+            _prco_req2req(), in the pkgSack all at once. So that whatProvides()
+            doesn't need to search for each one. File requires and globs
+            aren't done, as searchProvides() does more for those. """
+        todo = {}
+        for req in reqs:
+            if req in self._whatprovides_prefetch or req in todo:
+                continue
+            if misc.re_filename(req[0]) or misc.re_glob(req[0]):
+                continue
+            try:
+                todo[req] = misc.string_to_prco_tuple(req)
+            except Errors.MiscError:
+                continue
+        if not todo:
+            return
+
+        provs = self.pkgSack.getProvidesMultiple(todo.values())
+        for req in todo:
+            self._whatprovides_prefetch[req] = provs[todo[req]].keys()
         
     def allowedMultipleInstalls(self, po):
         """Return whether the given package object can be installed
@@ -338,6 +435,7 @@ class Depsolve(object):
            of (CheckDeps, missingdep, conflicts, errors) the last item is an array
            of error messages"""
         
+        self._dsprof.count('requires_processed')
         errormsgs = []
 
         needname, flags, needversion = requirement
@@ -783,6 +881,7 @@ class Depsolve(object):
     def _processConflict(self, po, conflict, conflicting_po):
         """processes a Conflict dep from the resolveDeps() method"""
 
+        self._dsprof.count('conflicts_processed')
         CheckDeps = True
         errormsgs = []
 
@@ -896,11 +995,14 @@ class Depsolve(object):
 
         if self.dsCallback: self.dsCallback.start()
 
+        prof = self._dsprof
+        prof.count('resolve_calls')
         depsolve_loop_count = 0
         while True:
             if depsolve_loop_count == (self.conf.depsolve_loop_limit or -1):
                 return (1, [_("Depsolving loop limit reached.")] + unique(errors))
             depsolve_loop_count += 1
+            prof.count('depsolve_loops')
 
             CheckDeps = True
 
@@ -908,7 +1010,11 @@ class Depsolve(object):
             while CheckDeps:
                 self.cheaterlookup = {}
                 if self.dsCallback: self.dsCallback.tscheck()
-                CheckDeps, checkinstalls, checkremoves, missing = self._resolveRequires(errors)
+                prof.start('_resolveRequires')
+                try:
+                    CheckDeps, checkinstalls, checkremoves, missing = self._resolveRequires(errors)
+                finally:
+                    prof.stop('_resolveRequires')
                 CheckInstalls |= checkinstalls
                 CheckRemoves |= checkremoves
 
@@ -917,10 +1023,14 @@ class Depsolve(object):
             self._working_po = None # reset the working po
             if CheckRemoves:
                 CheckRemoves = False
-                for po, dep in self._checkFileRequires():
-                    (checkdep, missing, errormsgs) = self._processReq(po, dep)
-                    CheckDeps |= checkdep
-                    errors += errormsgs
+                prof.start('_checkFileRequires')
+                try:
+                    for po, dep in self._checkFileRequires():
+                        (checkdep, missing, errormsgs) = self._processReq(po, dep)
+                        CheckDeps |= checkdep
+                        errors += errormsgs
+                finally:
+                    prof.stop('_checkFileRequires')
 
                 if CheckDeps:
                     if self.dsCallback: self.dsCallback.restartLoop()
@@ -931,18 +1041,26 @@ class Depsolve(object):
             self._working_po = None # reset the working po
             if CheckInstalls:
                 CheckInstalls = False
-                for conflict in self._checkConflicts():
-                    (checkdep, errormsgs) = self._processConflict(*conflict)
-                    CheckDeps |= checkdep
-                    errors += errormsgs
-                    if checkdep:
-                        break # The next conflict might be the same pkg
+                prof.start('_checkConflicts')
+                try:
+                    for conflict in self._checkConflicts():
+                        (checkdep, errormsgs) = self._processConflict(*conflict)
+                        CheckDeps |= checkdep
+                        errors += errormsgs
+                        if checkdep:
+                            break # The next conflict might be the same pkg
+                finally:
+                    prof.stop('_checkConflicts')
 
                 if True: # Always have to check obsoletes...
-                    if self._checkObsoletes():
-                        CheckDeps = True
-                        CheckRemoves = True
-                        self._last_req = None
+                    prof.start('_checkObsoletes')
+                    try:
+                        if self._checkObsoletes():
+                            CheckDeps = True
+                            CheckRemoves = True
+                            self._last_req = None
+                    finally:
+                        prof.stop('_checkObsoletes')
 
                 if CheckDeps:
                     if self.dsCallback: self.dsCallback.restartLoop()
@@ -1023,12 +1141,22 @@ class Depsolve(object):
             else:
                 self._working_po = txmbr.po
            
+            self._resolved_providers = set()
             if (txmbr.output_state in TS_INSTALL_STATES) == (txmbr.po.state != None):
                 thisneeds = self._checkInstall(txmbr)
                 CheckInstalls = True
             else:
                 thisneeds = self._checkRemove(txmbr)
                 CheckRemoves = True
+            providers = self._resolved_providers
+            self._resolved_providers = None
+
+            #  Most of the time we'll need to look for providers of all
+            # the unresolved requires, so get them in one go.
+            if not txmbr.downgraded_by:
+                self._prefetchWhatProvides([thisneed[1]
+                                            for thisneed in thisneeds
+                                            if thisneed[0].repo.id != "installed"])
 
             missing_in_pkg = False
             for thisneed in thisneeds:
@@ -1050,8 +1178,14 @@ class Depsolve(object):
                 errors += errormsgs
                 missing_in_pkg |= missing
 
+            self._whatprovides_prefetch = {}
+
             if not missing_in_pkg:
-                self.tsInfo.markAsResolved(txmbr)
+                #  If we had to add pkgs. to get here we don't know exactly
+                # what it needs, so it'll always be rechecked.
+                if thisneeds:
+                    providers = None
+                self.tsInfo.markAsResolved(txmbr, providers)
 
             any_missing |= missing_in_pkg
 
@@ -1115,15 +1249,23 @@ class Depsolve(object):
                 oldreqs.extend(oldpo.returnPrco('strong_requires'))
         oldreqs = set(oldreqs)
 
-        ret = []
-        def _deal_with_req(txmbr, req, weakdep):
+        # Lookup all the requires we need to check together.
+        reqs = set()
+        for req in list(txmbr_reqs) + txmbr_wreqs:
             if req[0].startswith('rpmlib('):
-                return
+                continue
             if req in oldreqs:
+                continue
+            reqs.add(req)
+        allprovs = self.tsInfo.getProvidesMultiple(list(reqs))
+
+        ret = []
+        def _deal_with_req(txmbr, req, weakdep):
+            if req not in allprovs:
                 return
             
             self.verbose_logger.log(logginglevels.DEBUG_2, _("looking for %s as a requirement of %s"), req, txmbr)
-            provs = self.tsInfo.getProvides(*req)
+            provs = allprovs[req]
             #  The self provides should mostly be caught before here now, but
             # at least config() crack still turns up, it's not that
             # expensive to just do it, and we really don't want "false positive"
@@ -1131,6 +1273,8 @@ class Depsolve(object):
             if not provs and not txmbr.po.inPrcoRange('provides', req):
                 ret.append( (txmbr.po, self._prco_req2req(req), weakdep) )
                 return
+            if self._resolved_providers is not None:
+                self._resolved_providers.update(provs)
 
             #Add relationship
             for po in provs:
@@ -1157,6 +1301,9 @@ class Depsolve(object):
         for newpo in txmbr.updated_by + txmbr.obsoleted_by:
             for p in newpo.provides:
                 newpoprovs[p] = 1
+        if self._resolved_providers is not None:
+            self._resolved_providers.update(txmbr.updated_by)
+            self._resolved_providers.update(txmbr.obsoleted_by)
         ret = []
         
         # iterate over the provides of the package being removed
@@ -1220,8 +1367,11 @@ class Depsolve(object):
 
                     # It doesn't, so see what else might...
                     rn, rf, rv = hit
-                    if not self.tsInfo.getProvides(rn, rf, rv):
+                    hitprovs = self.tsInfo.getProvides(rn, rf, rv)
+                    if not hitprovs:
                         ret.append( (pkg, self._prco_req_nfv2req(rn, rf, rv)) )
+                    elif self._resolved_providers is not None:
+                        self._resolved_providers.update(hitprovs)
         return ret
 
     def _checkFileRequires(self):
@@ -1288,6 +1438,7 @@ class Depsolve(object):
             del self.installedFileProviders[fname]
 
         # check the file requires
+        self._dsprof.count('file_requires', len(fileRequires))
         iFP = self.installedFileProviders
         for filename in fileRequires:
             # In theory we need this to be:
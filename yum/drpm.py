@@ -22,10 +22,15 @@ from yum.Errors import RepoError, MiscError
 from yum.i18n import exception2msg, _
 from yum.Errors import MiscError
 from yum.misc import checksum, repo_gen_decompress, unlink_f
+from yum.misc import num_cpus_online
+from yum.packages import verify_local_file
+from yum.sqlutils import sqlite, executeSQL, open_gen_index
 from urlgrabber import grabber, progress
 async = hasattr(grabber, 'parallel_wait')
 from xml.etree.cElementTree import iterparse
-import os, re
+import os, re, errno, time
+import threading
+import Queue
 
 APPLYDELTA = '/usr/bin/applydeltarpm'
 
@@ -92,34 +97,119 @@ class DeltaPackage:
     def returnIdSum(self):
         return self.csum
 
-def _num_cpus_online(unknown=1):
-    if not hasattr(os, "sysconf"):
-        return unknown
-
-    if not os.sysconf_names.has_key("SC_NPROCESSORS_ONLN"):
-        return unknown
-
-    ncpus = os.sysconf("SC_NPROCESSORS_ONLN")
-    try:
-        if int(ncpus) > 0:
-            return ncpus
-    except:
-        pass
+#  The parsed prestodelta.xml is kept in gen/prestodelta.sqlite, with one row
+# per delta keyed by the new package's pkgtup, so we only need to look up the
+# pkgs in the transaction. It's regenerated when the MD checksum changes.
+_PRESTO_DBVERSION = 1
+
+def _prestodelta_index(repo, cpath, csum):
+    """ Return a sqlite connection to the prestodelta index for repo, made
+        from the prestodelta MD at cpath, with checksum csum. Returns None if
+        there's no usable MD. """
+    def build(cur):
+        path = repo_gen_decompress(cpath, 'prestodelta.xml', cached=repo.cache)
+        if path is None:
+            return False
 
-    return unknown
+        executeSQL(cur, """CREATE TABLE deltas (name TEXT, arch TEXT,
+                           epoch TEXT, version TEXT, release TEXT,
+                           oldepoch TEXT, oldversion TEXT, oldrelease TEXT,
+                           size INTEGER, filename TEXT, checksum_type TEXT,
+                           checksum TEXT)""")
+        rows = []
+        for ev, el in iterparse(path):
+            if el.tag != 'newpackage': continue
+            new = (el.get('name'), el.get('arch'), el.get('epoch'),
+                   el.get('version'), el.get('release'))
+            for delta in el.findall('delta'):
+                csum_el = delta.find('checksum')
+                rows.append(new + (delta.get('oldepoch'),
+                                   delta.get('oldversion'),
+                                   delta.get('oldrelease'),
+                                   int(delta.find('size').text),
+                                   delta.find('filename').text,
+                                   csum_el.get('type'), csum_el.text))
+            el.clear()
+        cur.executemany("INSERT INTO deltas VALUES (?,?,?,?,?,?,?,?,?,?,?,?)",
+                        rows)
+        executeSQL(cur, """CREATE INDEX deltas_new ON deltas
+                           (name, arch, version, release, epoch)""")
+    return open_gen_index(repo, 'prestodelta.sqlite', _PRESTO_DBVERSION,
+                          csum, build)
+
+class _DeltaStage:
+    """ Counters for one stage (download, rebuild or verify) of the delta
+        rebuild pipeline. """
+
+    def __init__(self, name):
+        self.name = name
+        self.num = 0
+        self.size = 0
+        self.busy = 0.0
+        self.beg = None
+        self.end = None
+        self.depth_max = 0
+        self.depth_sum = 0
+        self.depth_num = 0
+
+    def queued(self, depth):
+        """ A job was added to this stage, with depth jobs already waiting. """
+        self.depth_max = max(self.depth_max, depth)
+        self.depth_sum += depth
+        self.depth_num += 1
+
+    def done(self, size, beg, end):
+        """ A job of size bytes went through this stage, from beg to end. """
+        self.num += 1
+        self.size += size
+        self.busy += end - beg
+        if self.beg is None or beg < self.beg:
+            self.beg = beg
+        if self.end is None or end > self.end:
+            self.end = end
+
+    def summary(self, workers=None):
+        if not self.num:
+            return '%-8s: nothing' % self.name
+        elapsed = max(self.end - self.beg, 0.001)
+        ret = '%-8s: %d pkgs, %s in %.1fs (%s/s)' % (self.name, self.num,
+                                progress.format_number(self.size), elapsed,
+                                progress.format_number(self.size / elapsed))
+        if workers:
+            ret += ', %d workers %d%% busy' % (workers,
+                                               self.busy * 100 / (elapsed * workers))
+        if self.depth_num:
+            ret += ', queue max %d avg %.1f' % (self.depth_max,
+                                                self.depth_sum / float(self.depth_num))
+        return ret
 
 class DeltaInfo:
     def __init__(self, ayum, pkgs, adderror):
         self.verbose_logger = ayum.verbose_logger
         self.adderror = adderror
-        self.jobs = {}
+        self.jobs = set() # pos handed to the rebuild threads
         self._future_jobs = []
+        self._downloading = {} # po => time the download was queued
         self.progress = None
         self.limit = ayum.conf.deltarpm
         if self.limit < 0:
-            nprocs = _num_cpus_online()
+            nprocs = num_cpus_online()
             self.limit *= -nprocs
 
+        #  Rebuilds are a pipeline: drpm downloaded => applydeltarpm => verify
+        # the checksum of the new rpm => deal with the result in the main
+        # thread. The rebuild and verify stages are threads, fed by bounded
+        # queues so that we never have too much work waiting in either one.
+        self._verify_limit = max(1, min(self.limit, num_cpus_online()))
+        self._threads = []
+        self._rebuild_q = Queue.Queue(max(1, self.limit))
+        self._verify_q = Queue.Queue(self._verify_limit * 2)
+        self._done_q = Queue.Queue()
+        self._stats_lock = threading.Lock()
+        self._stats = {}
+        for name in ('download', 'rebuild', 'verify'):
+            self._stats[name] = _DeltaStage(name)
+
         if not self.limit: # Turned off.
             return
 
@@ -160,6 +250,7 @@ class DeltaInfo:
 
         # download delta metadata
         mdpath = {}
+        mdcsum = {}
         for repo in reposize:
             for name in ('prestodelta', 'deltainfo'):
                 try: data = repo.repoXML.getData(name); break
@@ -167,6 +258,7 @@ class DeltaInfo:
             else:
                 self.verbose_logger.info(_('No Presto metadata available for %s'), repo)
                 continue
+            mdcsum[repo] = data.checksum[1]
             path = repo.cachedir +'/'+ os.path.basename(data.location[1])
             perc = repo.deltarpm_metadata_percentage
             data_size = int(data.size) * (perc / 100.0)
@@ -191,46 +283,198 @@ class DeltaInfo:
         if async:
             grabber.parallel_wait()
 
-        # parse metadata, create DeltaPackage instances
+        # look up our pkgs in the metadata, create DeltaPackage instances
         for repo, cpath in mdpath.items():
-            pinfo_repo = pinfo[repo]
-            path = repo_gen_decompress(cpath, 'prestodelta.xml',
-                                       cached=repo.cache)
-            for ev, el in iterparse(path):
-                if el.tag != 'newpackage': continue
-                name = el.get('name')
-                arch = el.get('arch')
-                new = name, arch, el.get('epoch'), el.get('version'), el.get('release')
-                index = pinfo_repo.get(new)
-                if index is not None:
-                    po = pkgs[index]
-                    perc = repo.deltarpm_percentage
-                    if perc is None:
-                        perc = ayum.conf.deltarpm_percentage
-                    best = po.size * (perc / 100.0)
-                    have = oldrpms.get(repo, {}).get((name, arch), {})
-                    for el in el.findall('delta'):
-                        size = int(el.find('size').text)
-                        if size >= best:
+            try:
+                conn = _prestodelta_index(repo, cpath, mdcsum[repo])
+            except (sqlite.Error, SyntaxError, OSError, IOError), e:
+                # SyntaxError is what iterparse() raises for bad XML.
+                self.verbose_logger.warn(_('Failed to read %s for repository %s: %s'),
+                                         'prestodelta', repo, exception2msg(e))
+                continue
+            if conn is None:
+                continue
+            cur = conn.cursor()
+
+            perc = repo.deltarpm_percentage
+            if perc is None:
+                perc = ayum.conf.deltarpm_percentage
+            for new, index in pinfo[repo].iteritems():
+                name, arch = new[:2]
+                po = pkgs[index]
+                best = po.size * (perc / 100.0)
+                have = oldrpms.get(repo, {}).get((name, arch), {})
+                executeSQL(cur, """SELECT oldepoch, oldversion, oldrelease, size,
+                                          filename, checksum_type, checksum
+                                   FROM deltas WHERE name = ? AND arch = ? AND
+                                   version = ? AND release = ? AND epoch = ?
+                                   ORDER BY rowid""",
+                           (name, arch, new[3], new[4], new[2]))
+                for (epoch, ver, rel, size, remote, ctype, csum) in cur.fetchall():
+                    if size >= best:
+                        continue
+
+                    # can we use this delta?
+                    if (ver, rel) in have:
+                        oldrpm = '%s/%s-%s-%s.%s.rpm' % (repo.pkgdir, name, ver, rel, arch)
+                    else:
+                        if not ayum.rpmdb.searchNevra(name, epoch, ver, rel, arch):
                             continue
+                        oldrpm = None
+
+                    best = size
+                    pkgs[index] = DeltaPackage(po, size, remote, (ctype, csum),
+                                               oldrpm)
+            conn.close()
+
+    def _start_workers(self):
+        """ Start the rebuild and verify threads, if they aren't running. """
+        if self._threads:
+            return
+        for num in range(self.limit):
+            self._threads.append(self._start_thread(self._rebuild_worker,
+                                                    'drpm-rebuild-%d' % num))
+        for num in range(self._verify_limit):
+            self._threads.append(self._start_thread(self._verify_worker,
+                                                    'drpm-verify-%d' % num))
+
+    def _start_thread(self, target, name):
+        thread = threading.Thread(target=target, name=name)
+        thread.setDaemon(True)
+        thread.start()
+        return thread
+
+    def _stop_workers(self):
+        """ Stop the rebuild and verify threads, only call this when there
+            are no jobs left. """
+        if not self._threads:
+            return
+        rebuilders = self._threads[:self.limit]
+        verifiers = self._threads[self.limit:]
+        for thread in rebuilders:
+            self._put(self._rebuild_q, None)
+        self._join(rebuilders)
+        for thread in verifiers:
+            self._put(self._verify_q, None)
+        self._join(verifiers)
+        self._threads = []
+        self.verbose_logger.debug('%s', self._stats_str())
+
+    def _join(self, threads):
+        for thread in threads:
+            #  A join() with no timeout can't be interrupted, so ^C wouldn't
+            # work until all the threads are done.
+            while thread.isAlive():
+                thread.join(0.25)
+
+    def _put(self, queue, item, block=True):
+        """ Put an item on one of the pipeline queues, the blocking put()
+            is done with a timeout, so it can still be interrupted. Returns
+            False if the queue is full (and we weren't blocking). """
+        while True:
+            try:
+                queue.put(item, block, 0.25)
+                return True
+            except Queue.Full:
+                if not block:
+                    return False
+
+    def _rebuild_worker(self):
+        """ Thread that takes drpms off the rebuild queue, and runs
+            applydeltarpm on them. """
+        while True:
+            job = self._rebuild_q.get()
+            if job is None:
+                return
+
+            po = job[0]
+            try:
+                self._rebuild_job(job)
+            except Exception, e:
+                #  The main thread needs a result for every job, or wait()
+                # never returns.
+                msg = _('Delta RPM rebuild of %s failed: %s') % (po.rpm,
+                                                                 exception2msg(e))
+                self._done_q.put((po, None, msg))
+
+    def _rebuild_job(self, job):
+        """ Run applydeltarpm for a single drpm, then hand it to the verify
+            threads or post the result. """
+        (po, csum_type, csum, size) = job
+        args = ('-a', po.arch)
+        if po.oldrpm: args += '-r', po.oldrpm
+        args += po.localpath, po.rpm.localpath
+
+        beg = time.time()
+        try:
+            pid = os.spawnl(os.P_NOWAIT, APPLYDELTA, APPLYDELTA, *args)
+            code = self._waitpid(pid)
+        except OSError, e:
+            msg = _('Couldn\'t spawn %s: %s') % (APPLYDELTA, exception2msg(e))
+            self._done_q.put((po, None, msg))
+            return
+        self._stage_done('rebuild', size, beg)
+
+        if code != 0:
+            self._done_q.put((po, code, None))
+        else:
+            self._stage_queued('verify', self._verify_q.qsize())
+            self._put(self._verify_q, job)
+
+    def _waitpid(self, pid):
+        while True:
+            try:
+                return os.waitpid(pid, 0)[1]
+            except OSError, e:
+                if e.errno != errno.EINTR:
+                    raise
+
+    def _verify_worker(self):
+        """ Thread that takes rebuilt rpms off the verify queue, and checks
+            them against the checksum from the repo. The pkg objects can't
+            be used here (they load data from sqlite, which only works in the
+            main thread), so the job has the checksum and size. """
+        while True:
+            job = self._verify_q.get()
+            if job is None:
+                return
 
-                        # can we use this delta?
-                        epoch = el.get('oldepoch')
-                        ver = el.get('oldversion')
-                        rel = el.get('oldrelease')
-                        if (ver, rel) in have:
-                            oldrpm = '%s/%s-%s-%s.%s.rpm' % (repo.pkgdir, name, ver, rel, arch)
-                        else:
-                            if not ayum.rpmdb.searchNevra(name, epoch, ver, rel, arch):
-                                continue
-                            oldrpm = None
-
-                        best = size
-                        remote = el.find('filename').text
-                        csum = el.find('checksum')
-                        csum = csum.get('type'), csum.text
-                        pkgs[index] = DeltaPackage(po, size, remote, csum, oldrpm)
-                el.clear()
+            (po, csum_type, csum, size) = job
+            try:
+                beg = time.time()
+                nst = verify_local_file(po.rpm.localpath, csum_type, csum, size)
+                self._stage_done('verify', size, beg)
+            except Exception, e:
+                msg = _('Checking the delta-rebuilt RPM %s failed: %s') % (po.rpm,
+                                                        exception2msg(e))
+                self._done_q.put((po, None, msg))
+                continue
+            self._done_q.put((po, 0, nst))
+
+    def _stage_queued(self, name, depth):
+        self._stats_lock.acquire()
+        self._stats[name].queued(depth)
+        self._stats_lock.release()
+
+    def _stage_done(self, name, size, beg, end=None):
+        if end is None:
+            end = time.time()
+        self._stats_lock.acquire()
+        self._stats[name].done(size, beg, end)
+        self._stats_lock.release()
+
+    def _stats_str(self):
+        """ Return a summary of the throughput and queue depth of each stage
+            of the rebuild pipeline. """
+        workers = {'download' : None, # urlgrabber runs those
+                   'rebuild'  : self.limit,
+                   'verify'   : self._verify_limit}
+        ret = ['Delta RPM pipeline:']
+        self._stats_lock.acquire()
+        for name in ('download', 'rebuild', 'verify'):
+            ret.append(self._stats[name].summary(workers[name]))
+        self._stats_lock.release()
+        return '\n  '.join(ret)
 
     def wait(self, num=None):
         """ Wait for "num" number of jobs to finish, or all of them. Blocks. """
@@ -240,31 +484,41 @@ class DeltaInfo:
         # wait for some jobs, run callbacks
         while num > 0:
             if not self.jobs: # This is probably broken logic, which is bad.
-                return
+                break
             num -= self._wait(block=True)
 
+        if not self.jobs and not self._future_jobs:
+            self._stop_workers()
+
     def _wait(self, block=False):
+        """ Deal with the results of finished rebuilds, in the main thread.
+            When blocking we wait for one job to finish. """
         num = 0
 
         while self.jobs:
-            if block:
-                pid, code = os.wait()
-            else:
-                pid, code = os.waitpid(-1, os.WNOHANG)
-                if not pid:
-                    break
-
-            # urlgrabber spawns child jobs, too.  But they exit synchronously,
-            # so we should never see an unknown pid here.
-            assert pid in self.jobs
-            po = self.jobs.pop(pid)
+            try:
+                if block:
+                    #  A get() with no timeout can't be interrupted, so ^C
+                    # wouldn't work until the job is done.
+                    po, code, ok = self._done_q.get(True, 0.25)
+                else:
+                    po, code, ok = self._done_q.get_nowait()
+            except Queue.Empty:
+                if block:
+                    continue
+                break
+
+            self.jobs.discard(po)
+            if code is None: # Failed to spawn applydeltarpm, or worse
+                raise MiscError, ok
+
             if self.progress:
                 self.done += po.rpm.size
                 self.progress.update(self.done)
             if code != 0:
                 unlink_f(po.rpm.localpath)
                 self.adderror(po, _('Delta RPM rebuild failed'))
-            elif not po.rpm.verifyLocalPkg():
+            elif not ok:
                 self.adderror(po, _('Checksum of the delta-rebuilt RPM failed'))
             else:
                 # done with drpm file, unlink when local
@@ -275,6 +529,7 @@ class DeltaInfo:
                     rpmfile = po.rpm.localpath.rsplit('.', 2)[0]
                     os.rename(po.rpm.localpath, rpmfile)
                     po.rpm.localpath = rpmfile
+                po.rpm._verifiedLocalPkg(ok)
             num += 1
 
             # when blocking, one is enough
@@ -282,9 +537,18 @@ class DeltaInfo:
                 break
         return num
 
+    def downloading(self, po):
+        """ The download of the drpm po has been started (or queued, when
+            urlgrabber does them in parallel), for the pipeline stats. """
+        self._stage_queued('download', len(self._downloading))
+        self._downloading[po] = time.time()
+
     def rebuild(self, po):
         """ Turn a drpm into an rpm, by adding it to the queue and trying to
             service the queue. """
+        beg = self._downloading.pop(po, None)
+        if beg is not None:
+            self._stage_done('download', po.size, beg)
         self._future_jobs.append(po)
         self.dequeue_max()
 
@@ -292,7 +556,7 @@ class DeltaInfo:
         """ De-Queue all delta rebuilds and spawn the rebuild processes. """
 
         count = total = 0
-        for po in self.jobs.values() + self._future_jobs:
+        for po in list(self.jobs) + self._future_jobs:
             count += 1
             total += po.rpm.size
         if total:
@@ -313,11 +577,11 @@ class DeltaInfo:
             self.dequeue()
 
     def dequeue_max(self):
-        """ De-Queue all delta rebuilds we can and spawn the rebuild
-            processes. """
+        """ De-Queue all delta rebuilds we can and hand them to the rebuild
+            threads. """
 
         if not self._future_jobs:
-            # Just trim the zombies...
+            # Just deal with the finished jobs...
             self._wait()
             return
 
@@ -326,26 +590,23 @@ class DeltaInfo:
                 break
 
     def dequeue(self, block=True):
-        """ Try to De-Queue a delta rebuild and spawn the rebuild process. """
-        # Do this here, just to keep the zombies at bay...
+        """ Try to De-Queue a delta rebuild and hand it to the rebuild
+            threads. The rebuild queue is bounded, so when it's full we either
+            wait for a free slot or give up (if not blocking). """
+        # Do this here, to keep the results from piling up...
         self._wait()
 
         if not self._future_jobs:
             return False
 
-        if self.limit <= len(self.jobs):
-            if not block:
-                return False
-            self.wait(len(self.jobs) - self.limit + 1)
-
-        po = self._future_jobs.pop(0)
-        args = ('-a', po.arch)
-        if po.oldrpm: args += '-r', po.oldrpm
-        args += po.localpath, po.rpm.localpath
-
-        try:
-            pid = os.spawnl(os.P_NOWAIT, APPLYDELTA, APPLYDELTA, *args)
-        except OSError, e:
-            raise MiscError, _('Couldn\'t spawn %s: %s') % (APPLYDELTA, exception2msg(e))
-        self.jobs[pid] = po
+        self._start_workers()
+        po = self._future_jobs[0]
+        (csum_type, csum) = po.rpm.returnIdSum()
+        job = (po, csum_type, csum, po.rpm.packagesize)
+        depth = self._rebuild_q.qsize()
+        if not self._put(self._rebuild_q, job, block):
+            return False
+        self._stage_queued('rebuild', depth)
+        self._future_jobs.pop(0)
+        self.jobs.add(po)
         return True
@@ -23,7 +23,7 @@ import glob
 import re
 from weakref import proxy as weakref
 
-from sqlutils import sqlite, executeSQL, sql_esc_glob
+from sqlutils import sqlite, executeSQL, executeSQLMany, sql_esc_glob
 import yum.misc as misc
 import yum.constants
 from yum.constants import *
@@ -653,10 +653,30 @@ class YumMergedHistoryTransaction(YumHistoryTransaction):
             self.end_rpmdbversion = obj.end_rpmdbversion
 
 
+#  The inserts done for each pkg. in a transaction, these are done with
+# executemany() and the per. row functions use the same SQL so sqlite only
+# needs to prepare each of them once.
+_trans_with_sql = """INSERT INTO trans_with_pkgs
+                     (tid, pkgtupid)
+                     VALUES (?, ?)"""
+_trans_data_sql = """INSERT INTO trans_data_pkgs
+                     (tid, pkgtupid, state)
+                     VALUES (?, ?, ?)"""
+_trans_skip_sql = """INSERT INTO trans_skip_pkgs
+                     (tid, pkgtupid)
+                     VALUES (?, ?)"""
+_trans_prob_pkgs_sql = """INSERT INTO trans_prob_pkgs
+                          (rpid, pkgtupid, main)
+                          VALUES (?, ?, ?)"""
+_pkg_anydb_sql = """INSERT INTO pkg_%(db)sdb
+                    (pkgtupid, %(db)sdb_key, %(db)sdb_val)
+                    VALUES (?, ?, ?)"""
+
 class YumHistory:
     """ API for accessing the history sqlite data. """
 
-    def __init__(self, root='/', db_path=_history_dir, releasever=None):
+    def __init__(self, root='/', db_path=_history_dir, releasever=None,
+                 wal=False):
         self._conn = None
         
         self.conf = yum.misc.GenericHolder()
@@ -666,6 +686,7 @@ class YumHistory:
             self.conf.db_path = os.path.normpath('/' + db_path)
         self.conf.writable = False
         self.conf.readable = True
+        self.conf.wal = wal
 
         self.releasever = releasever
 
@@ -746,14 +767,36 @@ class YumHistory:
             # Could/should do this when installroot'ing?
             # executeSQL(self._conn.cursor(), "PRAGMA synchronous = OFF")
 
+            #  With WAL a commit just appends to the -wal file, instead of
+            # copying the old pages to the journal first. As we use an
+            # EXCLUSIVE lock there's no -shm file. It's turned off again in
+            # close(), so older sqlite and non-root users can read the DB.
+            if self.conf.wal and self.conf.writable:
+                try:
+                    executeSQL(self._conn.cursor(),
+                               "PRAGMA journal_mode = WAL")
+                except (sqlite.OperationalError, sqlite.DatabaseError):
+                    pass
+
         return self._conn.cursor()
     def _commit(self):
         return self._conn.commit()
     def _rollback(self):
         return self._conn.rollback()
 
+    def commit(self):
+        """ Commit anything that was written with commit=False. """
+        if self._conn is not None:
+            self._commit()
+
     def close(self):
         if self._conn is not None:
+            if self.conf.wal and self.conf.writable:
+                try:
+                    executeSQL(self._conn.cursor(),
+                               "PRAGMA journal_mode = DELETE")
+                except (sqlite.OperationalError, sqlite.DatabaseError):
+                    pass
             self._conn.close()
             self._conn = None
 
@@ -834,10 +877,7 @@ class YumHistory:
         cur = self._get_cursor()
         if cur is None:
             return None
-        res = executeSQL(cur,
-                         """INSERT INTO trans_with_pkgs
-                         (tid, pkgtupid)
-                         VALUES (?, ?)""", (self._tid, pid))
+        res = executeSQL(cur, _trans_with_sql, (self._tid, pid))
         return cur.lastrowid
 
     def trans_skip_pid(self, pid):
@@ -845,10 +885,7 @@ class YumHistory:
         if cur is None or not self._update_db_file_2():
             return None
         
-        res = executeSQL(cur,
-                         """INSERT INTO trans_skip_pkgs
-                         (tid, pkgtupid)
-                         VALUES (?, ?)""", (self._tid, pid))
+        res = executeSQL(cur, _trans_skip_sql, (self._tid, pid))
         return cur.lastrowid
 
     def trans_data_pid_beg(self, pid, state):
@@ -858,10 +895,7 @@ class YumHistory:
         cur = self._get_cursor()
         if cur is None:
             return # Should never happen, due to above
-        res = executeSQL(cur,
-                         """INSERT INTO trans_data_pkgs
-                         (tid, pkgtupid, state)
-                         VALUES (?, ?, ?)""", (self._tid, pid, state))
+        res = executeSQL(cur, _trans_data_sql, (self._tid, pid, state))
         return cur.lastrowid
     def trans_data_pid_end(self, pid, state):
         # State can be none here, Eg. TS_FAILED from rpmtrans
@@ -906,16 +940,15 @@ class YumHistory:
         if problem.problem == 'duplicates':
             pkgs[problem.duplicate.pkgtup] = problem.duplicate
 
+        rows = []
         for pkg in pkgs.values():
             pid = self.pkg2pid(pkg)
             if pkg.pkgtup == problem.pkg.pkgtup:
                 main = 'TRUE'
             else:
                 main = 'FALSE'
-            res = executeSQL(cur,
-                             """INSERT INTO trans_prob_pkgs
-                             (rpid, pkgtupid, main)
-                             VALUES (?, ?, ?)""", (rpid, pid, main))
+            rows.append((rpid, pid, main))
+        executeSQLMany(cur, _trans_prob_pkgs_sql, rows)
 
         return rpid
 
@@ -944,18 +977,26 @@ class YumHistory:
                                                     yum.misc.getloginuid()))
         self._tid = cur.lastrowid
 
+        #  Each table is written in one go, and it's all one commit. The
+        # pkgtups still have to be looked up (and maybe created) one at a time.
+        rows = []
         for pkg in using_pkgs:
-            pid = self._ipkg2pid(pkg)
-            self.trans_with_pid(pid)
-        
+            rows.append((self._tid, self._ipkg2pid(pkg)))
+        executeSQLMany(cur, _trans_with_sql, rows)
+
+        rows = []
         for txmbr in txmbrs:
             pid   = self.pkg2pid(txmbr.po)
             state = self.txmbr2state(txmbr)
-            self.trans_data_pid_beg(pid, state)
-        
-        for pkg in skip_packages:
-            pid   = self.pkg2pid(pkg)
-            self.trans_skip_pid(pid)
+            assert state is not None
+            rows.append((self._tid, pid, state))
+        executeSQLMany(cur, _trans_data_sql, rows)
+
+        if skip_packages and self._update_db_file_2():
+            rows = []
+            for pkg in skip_packages:
+                rows.append((self._tid, self.pkg2pid(pkg)))
+            executeSQLMany(cur, _trans_skip_sql, rows)
 
         for problem in rpmdb_problems:
             self._trans_rpmdb_problem(problem)
@@ -1310,46 +1351,68 @@ class YumHistory:
         if pid is None:
             return None
 
-        sql = """INSERT INTO pkg_%(db)sdb (pkgtupid, %(db)sdb_key, %(db)sdb_val)
-                        VALUES (?, ?, ?)""" % {'db' : db}
+        sql = _pkg_anydb_sql % {'db' : db}
         executeSQL(cur, sql, (pid, attr, to_unicode(val)))
 
         return cur.lastrowid
 
+    def _save_anydb(self, pkg, db, data, pid=None):
+        """ Save all the (attr, val) data for rpmdb/yumdb for this pkg., with
+            one executemany(). """
+        if not data:
+            return True
+
+        cur = self._get_cursor()
+        if cur is None or not self._update_db_file_3():
+            return False
+
+        if pid is None:
+            pid = self.pkg2pid(pkg, create=False)
+        if pid is None:
+            return False
+
+        rows = []
+        for (attr, val) in data:
+            rows.append((pid, attr, to_unicode(val)))
+        executeSQLMany(cur, _pkg_anydb_sql % {'db' : db}, rows)
+
+        return True
+
     def _save_rpmdb_key(self, pkg, attr, val):
         return self._save_anydb_key(pkg, "rpm", attr, val)
     def _save_yumdb_key(self, pkg, attr, val):
         return self._save_anydb_key(pkg, "yum", attr, val)
 
-    def _save_rpmdb(self, ipkg):
+    def _save_rpmdb(self, ipkg, pid=None):
         """ Save all the data for rpmdb for this installed pkg, assumes
             there is no data currently. """
+        data = []
         for attr in YumHistoryPackage._valid_rpmdb_keys:
             val = getattr(ipkg, attr, None)
             if val is None:
                 continue
-            if not self._save_anydb_key(ipkg, "rpm", attr, val):
-                return False
-        return True
+            data.append((attr, val))
+        return self._save_anydb(ipkg, "rpm", data, pid)
 
-    def _save_yumdb(self, ipkg):
+    def _save_yumdb(self, ipkg, pid=None):
         """ Save all the data for yumdb for this installed pkg, assumes
             there is no data currently. """
+        data = []
         for attr in _YumHistPackageYumDB._valid_yumdb_keys:
             val = ipkg.yumdb_info.get(attr)
             if val is None:
                 continue
-            if not self._save_anydb_key(ipkg, "yum", attr, val):
-                return False
-        return True
+            data.append((attr, val))
+        return self._save_anydb(ipkg, "yum", data, pid)
 
-    def _wipe_anydb(self, pkg, db):
+    def _wipe_anydb(self, pkg, db, pid=None):
         """ Delete all the data for rpmdb/yumdb for this installed pkg. """
         cur = self._get_cursor()
         if cur is None or not self._update_db_file_3():
             return False
 
-        pid = self.pkg2pid(pkg, create=False)
+        if pid is None:
+            pid = self.pkg2pid(pkg, create=False)
         if pid is None:
             return False
 
@@ -1358,17 +1421,64 @@ class YumHistory:
 
         return True
 
-    def sync_alldb(self, ipkg):
-        """ Sync. all the data for rpmdb/yumdb for this installed pkg. """
-        if not self._wipe_anydb(ipkg, "rpm"):
+    def _load_alldb(self, pid):
+        """ Return all the rpmdb/yumdb (db, attr, val) data for this pid, so
+            _restore_alldb() can put it back. """
+        cur = self._get_cursor()
+        ret = []
+        for db in ("rpm", "yum"):
+            sql = """SELECT %(db)sdb_key, %(db)sdb_val FROM pkg_%(db)sdb
+                     WHERE pkgtupid=?""" % {'db' : db}
+            executeSQL(cur, sql, (pid,))
+            for (attr, val) in cur:
+                ret.append((db, attr, val))
+        return ret
+
+    def _restore_alldb(self, pid, data):
+        """ Put the rpmdb/yumdb data from _load_alldb() back for this pid,
+            replacing anything that was saved since. """
+        cur = self._get_cursor()
+        for db in ("rpm", "yum"):
+            sql = """DELETE FROM pkg_%(db)sdb WHERE pkgtupid=?""" % {'db' : db}
+            executeSQL(cur, sql, (pid,))
+            rows = [(pid, attr, val) for (vdb, attr, val) in data if vdb == db]
+            if rows:
+                executeSQLMany(cur, _pkg_anydb_sql % {'db' : db}, rows)
+
+    def sync_alldb(self, ipkg, commit=True):
+        """ Sync. all the data for rpmdb/yumdb for this installed pkg. If
+            commit is False then the caller has to call commit(), so all the
+            pkgs. in a transaction can be synced with a single commit. """
+        if self._get_cursor() is None or not self._update_db_file_3():
             return False
-        if not (self._wipe_anydb(ipkg, "yum") and
-                self._save_rpmdb(ipkg) and
-                self._save_yumdb(ipkg)):
-            self._rollback()
+        pid = self.pkg2pid(ipkg, create=False)
+        if pid is None:
             return False
 
-        self._commit()
+        #  We can't rollback() without throwing away the other pkgs. that
+        # haven't been committed yet, and python's sqlite doesn't let us use
+        # savepoints. So if anything fails we put the old data back ourself.
+        old = None
+        if not commit:
+            old = self._load_alldb(pid)
+
+        done = False
+        try:
+            done = (self._wipe_anydb(ipkg, "rpm", pid) and
+                    self._wipe_anydb(ipkg, "yum", pid) and
+                    self._save_rpmdb(ipkg, pid) and
+                    self._save_yumdb(ipkg, pid))
+        finally:
+            if not done:
+                if commit:
+                    self._rollback()
+                else:
+                    self._restore_alldb(pid, old)
+        if not done:
+            return False
+
+        if commit:
+            self._commit()
         return True
 
     def _pkg_stats(self):
@@ -1624,6 +1734,8 @@ class YumHistory:
             # Just in case ... move the journal file too.
             if os.path.exists(_db_file + '-journal'):
                 os.rename(_db_file  + '-journal', _db_file + '-journal.old')
+            if os.path.exists(_db_file + '-wal'):
+                os.rename(_db_file  + '-wal', _db_file + '-wal.old')
         self._db_file = _db_file
         if not self.conf.writable:
             return False
@@ -24,6 +24,8 @@ import bz2
 import gzip
 import shutil
 import urllib
+import weakref
+import threading
 _available_compression = ['gz', 'bz2']
 try:
     import lzma
@@ -38,6 +40,12 @@ try:
     import gpgme.editutil
 except ImportError:
     gpgme = None
+try:
+    import xattr
+    if not hasattr(xattr, 'get') or not hasattr(xattr, 'set'):
+        xattr = None # This is a "newer" API.
+except ImportError:
+    xattr = None
 try:
     import hashlib
     _available_checksums = set(['md5', 'sha1', 'sha256', 'sha384', 'sha512'])
@@ -248,6 +256,137 @@ def unique(s):
             u.append(x)
     return u
 
+#  All the LRUCache()s that are alive, so cache_stats() can report on them.
+_lru_caches = weakref.WeakValueDictionary()
+
+class LRUCache(object):
+    """ A dict. like cache, which holds at most maxsize worth of entries
+        (maxsize=0 means no limit). Each entry has a size of 1, or whatever
+        sizefunc(value) returns, and when the cache is full the least recently
+        used entries are evicted. Hits, misses and evictions are counted, for
+        cache_stats(). Note that "in" doesn't count as a use. """
+
+    def __init__(self, name, maxsize=0, sizefunc=None):
+        self.name = name
+        self.maxsize = maxsize
+        self.sizefunc = sizefunc
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        #  key => [prev, next, key, value, size], in a circular list where
+        # root[1] is the least recently used entry and root[0] the most.
+        self._data = {}
+        self._root = []
+        self._root[:] = [self._root, self._root, None, None, 0]
+        _lru_caches[id(self)] = self
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def _unlink(self, link):
+        link[0][1] = link[1]
+        link[1][0] = link[0]
+
+    def _append(self, link):
+        root = self._root
+        link[0] = root[0]
+        link[1] = root
+        root[0][1] = link
+        root[0] = link
+
+    def get(self, key, default=None):
+        link = self._data.get(key)
+        if link is None:
+            self.misses += 1
+            return default
+        self.hits += 1
+        self._unlink(link)
+        self._append(link)
+        return link[3]
+
+    def __getitem__(self, key):
+        link = self._data.get(key)
+        if link is None:
+            self.misses += 1
+            raise KeyError(key)
+        self.hits += 1
+        self._unlink(link)
+        self._append(link)
+        return link[3]
+
+    def __setitem__(self, key, value):
+        if key in self._data:
+            self.pop(key)
+        size = 1
+        if self.sizefunc is not None:
+            size = self.sizefunc(value)
+        link = [None, None, key, value, size]
+        self._append(link)
+        self._data[key] = link
+        self.size += size
+
+        # Evict the oldest entries, but always keep the one we just added.
+        while self.maxsize and self.size > self.maxsize and len(self._data) > 1:
+            oldest = self._root[1]
+            self._unlink(oldest)
+            del self._data[oldest[2]]
+            self.size -= oldest[4]
+            self.evictions += 1
+
+    def pop(self, key, *args):
+        link = self._data.pop(key, None)
+        if link is None:
+            if args:
+                return args[0]
+            raise KeyError(key)
+        self._unlink(link)
+        self.size -= link[4]
+        return link[3]
+
+    def __delitem__(self, key):
+        self.pop(key)
+
+    def iteritems(self):
+        """ Iterate over the (key, value) pairs, oldest first. This doesn't
+            count as a use. """
+        link = self._root[1]
+        while link is not self._root:
+            yield link[2], link[3]
+            link = link[1]
+
+    def clear(self):
+        """ Drop all the entries, the counters are kept. """
+        self._data = {}
+        self._root[:] = [self._root, self._root, None, None, 0]
+        self.size = 0
+
+    def stats(self):
+        """ Return a dict. of the counters for this cache. """
+        return {'entries' : len(self._data), 'size' : self.size,
+                'maxsize' : self.maxsize, 'hits' : self.hits,
+                'misses' : self.misses, 'evictions' : self.evictions}
+
+def cache_stats():
+    """ Return the counters of all the live LRUCache()s, added together for
+        each cache name: name => stats dict. (with "caches" as the number of
+        caches with that name). """
+    ret = {}
+    for cache in _lru_caches.values():
+        stats = cache.stats()
+        if cache.name not in ret:
+            stats['caches'] = 1
+            ret[cache.name] = stats
+            continue
+        tot = ret[cache.name]
+        tot['caches'] += 1
+        for key in stats:
+            tot[key] += stats[key]
+    return ret
+
 class Checksums:
     """ Generate checksum(s), on given pieces of data. Producing the
         Length and the result(s) when complete. """
@@ -289,7 +428,7 @@ class Checksums:
         for sumalgo in self._sumalgos:
             sumalgo.update(data)
 
-    def read(self, fo, size=2**16):
+    def read(self, fo, size=2**20):
         data = fo.read(size)
         self.update(data)
         return data
@@ -340,12 +479,17 @@ class AutoFileChecksums:
         return self.checksums.read(self._fo, size)
 
 
-def checksum(sumtype, file, CHUNK=2**16, datasize=None):
+def checksum(sumtype, file, CHUNK=2**20, datasize=None):
     """takes filename, hand back Checksum of it
        sumtype = md5 or sha/sha1/sha256/sha512 (note sha == sha1)
        filename = /path/to/file
-       CHUNK=65536 by default"""
-     
+       CHUNK=1MB by default, see checksums() for more than one sumtype"""
+    return checksums([sumtype], file, CHUNK, datasize)[sumtype]
+
+def checksums(sumtypes, file, CHUNK=2**20, datasize=None):
+    """ Like checksum(), but does all of the sumtypes in a single pass over the
+        file. Returns a dict. of sumtype => checksum. """
+
     # chunking brazenly lifted from Ryan Tomayko
     try:
         if type(file) not in types.StringTypes:
@@ -353,22 +497,152 @@ def checksum(sumtype, file, CHUNK=2**16, datasize=None):
         else:           
             fo = open(file, 'r')
 
-        data = Checksums([sumtype])
+        data = Checksums(sumtypes)
         while data.read(fo, CHUNK):
             if datasize is not None and data.length > datasize:
                 break
 
         if type(file) is types.StringType:
             fo.close()
-            
+    except (IOError, OSError), e:
+        raise MiscError, 'Error opening file for checksum: %s' % file
+
+    ret = {}
+    for sumtype in sumtypes:
+        ret[sumtype] = data.hexdigest(sumtype)
         # This screws up the length, but that shouldn't matter. We only care
         # if this checksum == what we expect.
         if datasize is not None and datasize != data.length:
-            return '!%u!%s' % (datasize, data.hexdigest(sumtype))
+            ret[sumtype] = '!%u!%s' % (datasize, ret[sumtype])
+    return ret
 
-        return data.hexdigest(sumtype)
-    except (IOError, OSError), e:
-        raise MiscError, 'Error opening file for checksum: %s' % file
+#  The problem we are trying to solve here is that:
+#
+# 1. We rarely want to be downloading MD/pkgs/etc.
+# 2. We want to check those files are valid (match checksums) when we do
+#    download them.
+# 3. We _really_ don't want to checksum all the files every time we
+#    run (100s of MBs).
+# 4. We can continue to download files from bad mirrors, or retry files due to
+#    C-c etc.
+#
+# ...we used to solve this by just checking the file size, and assuming the
+# files had been downloaded and checksumed as correct if that matched. But that
+# was error prone on bad mirrors, so now we store the checksum in an
+# xattr ... this does mean that if you can't store xattrs (Eg. NFS) you will
+# rechecksum everything constantly.
+
+def xattr_get_chksum(filename, chktype):
+    """ Get the checksum of type chktype we stored on the file, or None. """
+    if not xattr:
+        return None
+
+    try:
+        ret = xattr.get(filename, 'user.yum.checksum.' + chktype)
+    except: # Documented to be "EnvironmentError", but make sure
+        return None
+
+    return ret
+
+def xattr_set_chksum(filename, chktype, chksum):
+    """ Store the checksum of type chktype on the file, if we can. """
+    if not xattr:
+        return None
+
+    try:
+        xattr.set(filename, 'user.yum.checksum.' + chktype, chksum)
+    except:
+        return False # Data too long. = IOError ... ignore everything.
+
+    return True
+
+class WorkerPool:
+    """ Run func(item) for each item put() into the pool, in up to workers
+        threads. The results are collected by the caller, as (item, result,
+        exception) tuples, from done() or wait(). With workers <= 1 put()
+        just calls func, so nothing is threaded. """
+
+    def __init__(self, func, workers=1, name='worker'):
+        self.func = func
+        self.workers = workers
+        self.name = name
+        self._cond = threading.Condition()
+        self._todo = []
+        self._results = []
+        self._pending = 0
+        self._active = 0
+
+    def _run(self, item):
+        try:
+            return (item, self.func(item), None)
+        except Exception, e:
+            return (item, None, e)
+
+    def _worker(self):
+        while True:
+            self._cond.acquire()
+            try:
+                if not self._todo:
+                    self._active -= 1
+                    return
+                item = self._todo.pop(0)
+            finally:
+                self._cond.release()
+
+            ret = self._run(item)
+
+            self._cond.acquire()
+            try:
+                self._results.append(ret)
+                self._pending -= 1
+                self._cond.notify()
+            finally:
+                self._cond.release()
+
+    def put(self, item):
+        """ Queue func(item) to be run. """
+        if self.workers <= 1:
+            self._results.append(self._run(item))
+            return
+
+        self._cond.acquire()
+        try:
+            self._todo.append(item)
+            self._pending += 1
+            if self._active < self.workers:
+                self._active += 1
+                thread = threading.Thread(target=self._worker,
+                                          name='%s-%d' % (self.name,
+                                                          self._active))
+                thread.setDaemon(True)
+                thread.start()
+        finally:
+            self._cond.release()
+
+    def done(self):
+        """ Return the results that are ready now, without waiting. """
+        self._cond.acquire()
+        try:
+            ret = self._results
+            self._results = []
+        finally:
+            self._cond.release()
+        return ret
+
+    def wait(self):
+        """ Wait for everything put() so far, and return all the results not
+            returned by done() already. """
+        self._cond.acquire()
+        try:
+            while self._pending:
+                #  A wait() with no timeout can't be interrupted, so ^C
+                # wouldn't work until all the items are done.
+                self._cond.wait(0.25)
+            ret = self._results
+            self._results = []
+        finally:
+            self._cond.release()
+        return ret
 
 def getFileList(path, ext, filelist):
     """Return all files in path matching ext, store them in filelist, 
@@ -766,7 +1040,7 @@ def refineSearchPattern(arg):
     return restring
 
 
-def _decompress_chunked(source, dest, ztype):
+def _decompress_chunked(source, dest, ztype, sumtypes=()):
 
     if ztype not in _available_compression:
         msg = "%s compression not available" % ztype
@@ -782,6 +1056,9 @@ def _decompress_chunked(source, dest, ztype):
     
     destination = open(dest, 'w')
 
+    #  Checksum the data as we write it, so checking the open checksum of dest
+    # afterwards doesn't have to read it all again.
+    csums = Checksums(sumtypes, ignore_missing=True, ignore_none=True)
     while True:
         try:
             data = s_fn.read(1024000)
@@ -791,6 +1068,7 @@ def _decompress_chunked(source, dest, ztype):
         
         if not data: break
 
+        csums.update(data)
         try:
             destination.write(data)
         except (OSError, IOError), e:
@@ -799,6 +1077,9 @@ def _decompress_chunked(source, dest, ztype):
     
     destination.close()
     s_fn.close()
+
+    for (sumtype, csum) in csums.hexdigests().iteritems():
+        xattr_set_chksum(dest, sumtype, csum)
     
 def bunzipFile(source,dest):
     """ Extract the bzipped contents of source to dest. """
@@ -1035,6 +1316,23 @@ def get_my_lang_code():
     
     return mylang
     
+def num_cpus_online(unknown=1):
+    """return the number of CPUs online, or unknown if we can't tell"""
+    if not hasattr(os, "sysconf"):
+        return unknown
+
+    if not os.sysconf_names.has_key("SC_NPROCESSORS_ONLN"):
+        return unknown
+
+    ncpus = os.sysconf("SC_NPROCESSORS_ONLN")
+    try:
+        if int(ncpus) > 0:
+            return ncpus
+    except:
+        pass
+
+    return unknown
+
 def return_running_pids():
     """return list of running processids, excluding this one"""
     mypid = os.getpid()
@@ -1120,9 +1418,11 @@ def get_uuid_obj(savepath):
     """ Like get_uuid() but doesn't create the uuid file until it's needed. """
     return _Dynamic_UUID(savepath)
         
-def decompress(filename, dest=None, fn_only=False, check_timestamps=False):
+def decompress(filename, dest=None, fn_only=False, check_timestamps=False,
+               sumtypes=()):
     """take a filename and decompress it into the same relative location.
-       if the file is not compressed just return the file"""
+       if the file is not compressed just return the file. The sumtypes
+       checksums of the decompressed data are stored in its xattrs."""
     
     out = dest
     if not dest:
@@ -1163,7 +1463,7 @@ def decompress(filename, dest=None, fn_only=False, check_timestamps=False):
 
     if not fn_only:
         try:
-            _decompress_chunked(filename, out, ztype)
+            _decompress_chunked(filename, out, ztype, sumtypes)
             if check_timestamps and fi:
                 os.utime(out, (fi.st_mtime, fi.st_mtime))
         except:
@@ -1172,13 +1472,14 @@ def decompress(filename, dest=None, fn_only=False, check_timestamps=False):
         
     return out
     
-def repo_gen_decompress(filename, generated_name, cached=False):
+def repo_gen_decompress(filename, generated_name, cached=False, sumtypes=()):
     """ This is a wrapper around decompress, where we work out a cached
         generated name, and use check_timestamps. filename _must_ be from
         a repo. and generated_name is the type of the file. """
     dest = os.path.dirname(filename) + '/gen/' + generated_name
     try:
-        return decompress(filename, dest=dest, check_timestamps=True)
+        return decompress(filename, dest=dest, check_timestamps=True,
+                          sumtypes=sumtypes)
     except (OSError, IOError), e:
         if cached and e.errno == errno.EACCES:
             return None
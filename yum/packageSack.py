@@ -25,7 +25,7 @@ import fnmatch
 import misc
 from packages import parsePackages
 import rpmUtils.miscutils
-from rpmUtils.miscutils import compareEVR
+from rpmUtils.miscutils import compareEVR, evrKey
 
 class PackageSackVersion:
     def __init__(self):
@@ -134,6 +134,24 @@ class PackageSackBase(object):
         """return dict { packages -> list of matching requires }"""
         raise NotImplementedError()
 
+    def getProvidesMultiple(self, reqs):
+        """return dict { (name, flags, version) ->
+                         dict { packages -> list of matching provides } }
+           for a list of (name, flags, version) requirements"""
+        ret = {}
+        for req in reqs:
+            ret[req] = self.getProvides(*req)
+        return ret
+
+    def getRequiresMultiple(self, reqs):
+        """return dict { (name, flags, version) ->
+                         dict { packages -> list of matching requires } }
+           for a list of (name, flags, version) requirements"""
+        ret = {}
+        for req in reqs:
+            ret[req] = self.getRequires(*req)
+        return ret
+
     def searchRequires(self, name):
         """return list of package requiring the name (any evr and flag)"""
         raise NotImplementedError()
@@ -413,6 +431,20 @@ class MetaSack(PackageSackBase):
         """return dict { packages -> list of matching requires }"""
         return self._computeAggregateDictResult("getRequires", name, flags, version)
 
+    def getProvidesMultiple(self, reqs):
+        """return dict { (name, flags, version) ->
+                         dict { packages -> list of matching provides } }
+           for a list of (name, flags, version) requirements"""
+        return self._computeAggregateMultiDictResult("getProvidesMultiple",
+                                                     reqs)
+
+    def getRequiresMultiple(self, reqs):
+        """return dict { (name, flags, version) ->
+                         dict { packages -> list of matching requires } }
+           for a list of (name, flags, version) requirements"""
+        return self._computeAggregateMultiDictResult("getRequiresMultiple",
+                                                     reqs)
+
     def searchRequires(self, name):
         """return list of package requiring the name (any evr and flag)"""
         return self._computeAggregateListResult("searchRequires", name)
@@ -449,7 +481,7 @@ class MetaSack(PackageSackBase):
             ret = cmp(x[0], y[0])
             if ret: return ret
             # This is negated so we get higher versions first, in the list.
-            return -compareEVR((x[2], x[3], x[4]), (y[2], y[3], y[4]))
+            return -cmp(evrKey(x[2], x[3], x[4]), evrKey(y[2], y[3], y[4]))
         def _pkgtup_nevr_eq(x, y):
             return _pkgtup_nevr_cmp(x, y) == 0
         for pkgtup in sorted(self.searchNames(names, return_pkgtups=True),
@@ -615,6 +647,22 @@ class MetaSack(PackageSackBase):
                     result.update(sackResult)
         return result
 
+    def _computeAggregateMultiDictResult(self, methodName, reqs):
+        result = {}
+        for req in reqs:
+            result[req] = {}
+        for sack in sorted(self.sacks.values()):
+            if hasattr(sack, methodName):
+                method = getattr(sack, methodName)
+                try:
+                    sackResult = method(reqs)
+                except PackageSackError:
+                    continue
+
+                for req in sackResult:
+                    result[req].update(sackResult[req])
+        return result
+
 
 
 class PackageSack(PackageSackBase):
@@ -57,13 +57,38 @@ import grp
 # check if rpm has the new weakdeps tags
 _rpm_has_new_weakdeps = hasattr(rpm, 'RPMTAG_ENHANCENAME')
 
+def _po_evr_key(po):
+    """ Get the evrKey() for a Package or PackageEVR object. """
+    if isinstance(po, PackageObject):
+        return po.evr_key
+    return rpmUtils.miscutils.evrKey(po.epoch, po.version, po.release)
+
+def verify_local_file(filename, csum_type, csum, size, nst=None):
+    """ Check that the file is size bytes and has the checksum csum, using
+        the xattr checksum cache (see misc.xattr_get_chksum) when we've done
+        this before. Returns the os.stat() of the file if it's good, and None
+        if not. This doesn't need a package object, so it's fine to call from
+        other threads. """
+    try:
+        if nst is None:
+            nst = os.stat(filename)
+        if (nst.st_size == size and
+            misc.xattr_get_chksum(filename, csum_type) == csum):
+            return nst
+        filesum = misc.checksum(csum_type, filename, datasize=size)
+    except (OSError, Errors.MiscError):
+        return None
+
+    if filesum != csum:
+        return None
+    misc.xattr_set_chksum(filename, csum_type, csum)
+    return nst
+
 def comparePoEVR(po1, po2):
     """
     Compare two Package or PackageEVR objects.
     """
-    (e1, v1, r1) = (po1.epoch, po1.version, po1.release)
-    (e2, v2, r2) = (po2.epoch, po2.version, po2.release)
-    return rpmUtils.miscutils.compareEVR((e1, v1, r1), (e2, v2, r2))
+    return cmp(_po_evr_key(po1), _po_evr_key(po2))
 def comparePoEVREQ(po1, po2):
     """
     Compare two Package or PackageEVR objects for equality.
@@ -240,6 +265,10 @@ class FakeRepository:
 class PackageObject(object):
     """Base Package Object - sets up the default storage dicts and the
        most common returns"""
+
+    #  Cached rpmUtils.miscutils.evrKey() for the package, this is a class
+    # attribute so it doesn't hit __getattr__ in the sqlite/rpmdb packages.
+    _evr_key_cache = None
        
     def __init__(self):
         self.name = None
@@ -333,6 +362,17 @@ class PackageObject(object):
                                    self.arch)
     envra = property(fget=lambda self: self._envra())
 
+    def _evr_key(self):
+        """ Return a precomputed key for comparing the rpm-version of this
+            package, so comparisons against other packages are just tuple
+            comparisons instead of calls into rpm. """
+        if self._evr_key_cache is None:
+            self._evr_key_cache = rpmUtils.miscutils.evrKey(self.epoch,
+                                                            self.version,
+                                                            self.release)
+        return self._evr_key_cache
+    evr_key = property(fget=lambda self: self._evr_key())
+
     def __str__(self):
         return self.ui_envra
 
@@ -757,7 +797,7 @@ class PackageEVR:
         self.release = r
         
     def compare(self,other):
-        return rpmUtils.miscutils.compareEVR((self.epoch, self.ver, self.rel), (other.epoch, other.ver, other.rel))
+        return rpmUtils.miscutils.compareEVRKey((self.epoch, self.ver, self.rel), (other.epoch, other.ver, other.rel))
     
     def __lt__(self, other):
         if self.compare(other) < 0:
@@ -1003,24 +1043,20 @@ class YumAvailablePackage(PackageObject, RpmBase):
                 return True
 
         (csum_type, csum) = self.returnIdSum()
-        
-        try:
-            filesum = misc.checksum(csum_type, self.localPkg(),
-                                    datasize=self.packagesize)
-        except Errors.MiscError:
+        if not verify_local_file(self.localPkg(), csum_type, csum,
+                                 self.packagesize, nst):
             if from_cashe:
                 self._cashe.unlink()
             elif from_cashe is None and nst.st_size >= self.packagesize:
                 return self.verifyLocalPkg(from_cashe=False) # Try: cashe
             return False
-        
-        if filesum != csum:
-            if from_cashe:
-                self._cashe.unlink()
-            elif from_cashe is None and nst.st_size >= self.packagesize:
-                return self.verifyLocalPkg(from_cashe=False) # Try: cashe
-            return False
-        
+
+        return self._verifiedLocalPkg(nst)
+
+    def _verifiedLocalPkg(self, nst):
+        """ The local pkg, with os.stat() result nst, has been checked (maybe
+            by verify_local_file() in another thread). So remember that, and
+            save it to the cashe. """
         self._verify_local_pkg_cache = nst
         if self._cashe is not None and not self._cashe.exists:
             try:
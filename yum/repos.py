@@ -23,6 +23,7 @@ import os
 import Errors
 from packageSack import MetaSack
 import urlgrabber.grabber
+import threading
 
 from weakref import proxy as weakref
 
@@ -72,16 +73,19 @@ class RepoStorage:
         # listEnabled() call.
         self._list_enabled_hasrun = False
 
-    def retrieveAllMD(self):
-        """ Download metadata for all enabled repositories,
-            based on mdpolicy.
+    def retrieveAllMD(self, repos=None, mdtypes=None):
+        """ Download metadata for all enabled repositories (or just the
+            given ones), based on mdpolicy (or the given mdtypes).
         """
 
         if not hasattr(urlgrabber.grabber, 'parallel_wait'):
             return
 
+        if repos is None:
+            repos = self.listEnabled()
+        todo = repos
         repos = []
-        for repo in self.listEnabled():
+        for repo in todo:
             if repo.cache:
                 continue
             try:
@@ -92,8 +96,10 @@ class RepoStorage:
                 self.disableRepo(repo.id)
                 dl = False
             if dl:
-                mdtypes = repo._mdpolicy2mdtypes()
-                downloading = repo._commonRetrieveDataMD_list(mdtypes)
+                rmdtypes = mdtypes
+                if rmdtypes is None:
+                    rmdtypes = repo._mdpolicy2mdtypes()
+                downloading = repo._commonRetrieveDataMD_list(rmdtypes)
                 repos.append((repo, downloading, [False]))
 
         # with sizes first, then without sizes..
@@ -113,7 +119,11 @@ class RepoStorage:
             else:
                 repo._commonRetrieveDataMD_done(downloading)
 
-    def doSetup(self, thisrepo = None):
+    def doSetup(self, thisrepo = None, retrieve=True):
+        """ Set up the enabled repos. (or just thisrepo), running the
+            prereposetup and postreposetup plugin hooks. Unless retrieve is
+            False, this also downloads any expired metadata, see
+            retrieveAllMD(). """
         
         if thisrepo is None:
             # Just in case the prelistenabledrepos plugin point hasn't run.
@@ -154,7 +164,8 @@ class RepoStorage:
                     repo.pkgdir = pkgdir
                 
         self._setup = True
-        self.retrieveAllMD()
+        if retrieve:
+            self.retrieveAllMD()
         self.ayum.plugins.run('postreposetup')
         
     def __str__(self):
@@ -377,6 +388,10 @@ class RepoStorage:
                     sack._retrieve_async(repo, data)
             urlgrabber.grabber.parallel_wait()
 
+        workers = self._populate_workers()
+        if workers > 1 and len(myrepos) > 1:
+            self._populate_prepare(myrepos, mdtype, workers)
+
         for repo in myrepos:
             sack = repo.getPackageSack()
             try:
@@ -396,6 +411,58 @@ class RepoStorage:
             else:
                 self.pkgSack.addSack(repo.id, sack)
 
+    def _populate_workers(self):
+        """ Return the number of threads to use for populateSack(), from the
+            populate_workers option. """
+        conf = getattr(self.ayum, 'conf', None)
+        workers = getattr(conf, 'populate_workers', 1)
+        if workers < 0:
+            workers *= -misc.num_cpus_online()
+        return workers
+
+    def _populate_prepare(self, repos, mdtype, workers):
+        """ Run the sack._populate_prepare() for each of the repos. in a pool
+            of worker threads, so that the decompression and XML => sqlite
+            conversions happen at the same time. The populate() calls
+            afterwards then just open the results, in order, so the sack we
+            build is the same. """
+        todo = []
+        for repo in repos:
+            sack = repo.getPackageSack()
+            if not hasattr(sack, '_populate_prepare'):
+                continue
+            try: # Load repomd.xml here, so the threads don't download it.
+                repo.repoXML
+            except Errors.RepoError:
+                continue
+            todo.append((sack, repo))
+
+        def _worker():
+            while True:
+                try:
+                    sack, repo = todo.pop(0)
+                except IndexError:
+                    return
+                try:
+                    sack._populate_prepare(repo, mdtype)
+                except Exception:
+                    #  Whatever went wrong, populate() will hit it again and
+                    # deal with it.
+                    pass
+
+        threads = []
+        for num in range(min(workers, len(todo))):
+            thread = threading.Thread(target=_worker,
+                                      name='populate-%d' % num)
+            thread.setDaemon(True)
+            thread.start()
+            threads.append(thread)
+        for thread in threads:
+            #  A join() with no timeout can't be interrupted, so ^C wouldn't
+            # work until all the threads are done.
+            while thread.isAlive():
+                thread.join(0.25)
+
 
 class Repository:
     """this is an actual repository object"""       
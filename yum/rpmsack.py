@@ -14,18 +14,23 @@
 # Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA 02111-1307, USA.
 
 import rpm
+import sys
 import types
 import warnings
 import glob
 import os
 import os.path
+import mmap
+import struct
+import array
+import cPickle
 
 from rpmUtils import miscutils
 from rpmUtils import arch
 from rpmUtils.transaction import initReadOnlyTransaction
 import misc
 import Errors
-from packages import YumInstalledPackage, parsePackages
+from packages import YumInstalledPackage, PackageObject, parsePackages
 from packageSack import PackageSackBase, PackageSackVersion
 
 # For returnPackages(patterns=)
@@ -36,6 +41,7 @@ from yum.i18n import to_unicode, _
 import constants
 
 import yum.depsolve
+from sqlutils import sqlite, executeSQL
 
 def _open_no_umask(*args):
     """ Annoying people like to set umask's for root, which screws everything
@@ -48,6 +54,20 @@ def _open_no_umask(*args):
 
     return ret
 
+#  The yumdb data simpleVersion() needs for each pkg., which is cached in
+# pkgtups-yumdb. Changing any of these in the yumdb removes the cache.
+_yumdb_version_attrs = ('checksum_type', 'checksum_data',
+                        'from_repo', 'from_repo_revision')
+
+def _yumdb_attr_changed(conf, attr):
+    """ Remove the rpmdb caches that use the yumdb attr. """
+    #  These two are special, as they have an index and are used as our
+    # cache-breaker.
+    if attr in ('checksum_type', 'checksum_data'):
+        misc.unlink_f(conf.version_path)
+    if attr in _yumdb_version_attrs and conf.version_data_path is not None:
+        misc.unlink_f(conf.version_data_path)
+
 def _makedirs_no_umask(*args):
     """ Annoying people like to set umask's for root, which screws everything
         up for user readable stuff. """
@@ -87,6 +107,7 @@ class RPMInstalledPackage(YumInstalledPackage):
 
         ts = self.rpmdb.readOnlyTS()
         mi = ts.dbMatch(0, self.idx)
+        self.rpmdb._header_loads += 1
         try:
             return mi.next()
         except StopIteration:
@@ -188,6 +209,262 @@ class RPMDBProblemProvides(RPMDBProblem):
                                                              self.provide)
 
 
+class _RPMDBProblemPkg(tuple):
+    """ The pkgtup of an installed pkg. in an RPMDBProblem, while it's passed
+        back from a check_*() child process. """
+    pass
+
+def _rpmdb_problems_map(problems, func):
+    """ Replace the pkgs. in the problems, including the keys of a dict
+        (Eg. conflicts), with func(pkg). """
+    for prob in problems:
+        for (key, val) in prob.__dict__.items():
+            if isinstance(val, dict):
+                val = dict([(func(k), v) for (k, v) in val.iteritems()])
+            else:
+                val = func(val)
+            prob.__dict__[key] = val
+    return problems
+
+def _rpmdb_problem_dump(val):
+    if isinstance(val, PackageObject):
+        return _RPMDBProblemPkg(val.pkgtup)
+    return val
+
+class RPMDBPrcoIndex:
+    """ A compact index of the provides, requires and files of the installed
+        packages, which is mmap()'d so lookups don't need to load it all in
+        or go to the rpm headers. The file is the rpmdb version on a line, and
+        then (all numbers are little endian uint32s):
+
+          header:   magic, nstrs, npkgs, nprovides, nrequires, nfiles
+          strs:     offset of each string in strdata, plus the end offset
+          pkgs:     rpmdb index, n, a, e, v, r (strs) for each package
+          provides: name, flags, e, v, r (strs), pkg; sorted by name
+          requires: name, flags, e, v, r (strs), pkg; sorted by name
+          files:    basename, dirname (strs), pkg; sorted by both
+          strdata:  the strings, sorted so we can bsearch them
+
+        ...with None stored as NONE. """
+
+    MAGIC = 0x31495059 # YPI1
+    NONE  = 0xFFFFFFFF
+
+    _hdr_fmt  = '<6I'
+    _prco_fmt = '<6I'
+    _file_fmt = '<3I'
+
+    def __init__(self, mm, offset):
+        self._mm = mm
+        hdr = struct.unpack_from(self._hdr_fmt, mm, offset)
+        if hdr[0] != self.MAGIC:
+            raise ValueError, 'Bad magic'
+        (nstrs, npkgs, nprovs, nreqs, nfiles) = hdr[1:]
+        offset += struct.calcsize(self._hdr_fmt)
+
+        self._strs    = offset
+        self._nstrs   = nstrs
+        offset += 4 * (nstrs + 1)
+        self._pkgs    = offset
+        self._npkgs   = npkgs
+        offset += 4 * 6 * npkgs
+        self._prcos   = {'provides' : (offset, nprovs)}
+        offset += 4 * 6 * nprovs
+        self._prcos['requires'] = (offset, nreqs)
+        offset += 4 * 6 * nreqs
+        self._files   = offset
+        self._nfiles  = nfiles
+        offset += 4 * 3 * nfiles
+        self._strdata = offset
+        if self._str_end(nstrs) + offset != len(mm):
+            raise ValueError, 'Bad size'
+
+        self._str_cache = {}
+        self._id_cache  = {}
+
+    @staticmethod
+    def load(fname, rpmdbv):
+        """ Open the index in fname, returns None if it isn't there or isn't
+            for rpmdbv. """
+        fo, e = _iopen(fname)
+        if fo is None:
+            return None
+        try:
+            frpmdbv = fo.readline()
+            if not frpmdbv or str(rpmdbv) != frpmdbv[:-1]:
+                return None
+            try:
+                mm = mmap.mmap(fo.fileno(), 0, access=mmap.ACCESS_READ)
+            except (EnvironmentError, ValueError):
+                return None
+        finally:
+            fo.close()
+
+        try:
+            return RPMDBPrcoIndex(mm, len(frpmdbv))
+        except (ValueError, struct.error):
+            mm.close()
+            return None
+
+    @staticmethod
+    def write(fname, rpmdbv, pkgs):
+        """ Write an index to fname, pkgs is a list of:
+            (rpmdb index, pkgtup, provides, requires, filenames). """
+        str2id = {None : RPMDBPrcoIndex.NONE}
+        def _id(val):
+            if val is not None:
+                val = misc.to_utf8(val)
+            if val not in str2id:
+                str2id[val] = None # Real ids are given out once sorted.
+            return val
+
+        data = {'provides' : [], 'requires' : []}
+        afiles = []
+        apkgs = []
+        for num, (idx, pkgtup, provs, reqs, fnames) in enumerate(pkgs):
+            apkgs.append([idx] + [_id(x) for x in pkgtup])
+            for prcotype, prcos in (('provides', provs), ('requires', reqs)):
+                for (n, f, (e, v, r)) in prcos:
+                    data[prcotype].append((_id(n), _id(f), _id(e),
+                                           _id(v), _id(r), num))
+            for fn in fnames:
+                (d, b) = os.path.split(fn)
+                afiles.append((_id(b), _id(d), num))
+
+        strs = sorted([val for val in str2id if val is not None])
+        for num, val in enumerate(strs):
+            str2id[val] = num
+        def _ids(vals):
+            return tuple([str2id.get(val, val) for val in vals])
+        # Only the strings are keys in str2id, the pkg/rpmdb nums aren't.
+        apkgs = [(pkg[0],) + _ids(pkg[1:]) for pkg in apkgs]
+        for prcotype in data:
+            data[prcotype] = [_ids(val[:5]) + (val[5],)
+                              for val in data[prcotype]]
+        afiles = [_ids(val[:2]) + (val[2],) for val in afiles]
+
+        astrs = array.array('I')
+        strdata = []
+        end = 0
+        for val in strs:
+            astrs.append(end)
+            strdata.append(val)
+            end += len(val)
+        astrs.append(end)
+
+        # We don't need to store any dups.
+        provs = sorted(set(data['provides']))
+        reqs = sorted(set(data['requires']))
+        afiles = sorted(set(afiles))
+
+        arrs = [array.array('I', [RPMDBPrcoIndex.MAGIC, len(strs), len(apkgs),
+                                  len(provs), len(reqs), len(afiles)]),
+                astrs]
+        for vals in (apkgs, provs, reqs, afiles):
+            arr = array.array('I')
+            for val in vals:
+                arr.extend(val)
+            arrs.append(arr)
+
+        fo = _open_no_umask(fname + '.tmp', 'wb')
+        fo.write("%s\n" % rpmdbv)
+        for arr in arrs:
+            if sys.byteorder != 'little':
+                arr.byteswap()
+            fo.write(arr.tostring())
+        fo.write(''.join(strdata))
+        fo.close()
+        os.rename(fname + '.tmp', fname)
+
+    def close(self):
+        self._mm.close()
+
+    def _str_end(self, num):
+        return struct.unpack_from('<I', self._mm, self._strs + 4 * num)[0]
+
+    def _str(self, num):
+        if num == self.NONE:
+            return None
+        if num not in self._str_cache:
+            beg, end = struct.unpack_from('<2I', self._mm, self._strs + 4*num)
+            val = misc.share_data(self._mm[self._strdata + beg:
+                                           self._strdata + end])
+            self._str_cache[num] = val
+        return self._str_cache[num]
+
+    def _str_id(self, val):
+        """ Find the id of the string val, or None. """
+        if val in self._id_cache:
+            return self._id_cache[val]
+        ret = None
+        beg, end = 0, self._nstrs
+        while beg < end:
+            mid = (beg + end) / 2
+            cur = self._str(mid)
+            if cur < val:
+                beg = mid + 1
+            elif cur > val:
+                end = mid
+            else:
+                ret = mid
+                break
+        self._id_cache[val] = ret
+        return ret
+
+    def _bsearch(self, offset, num, fmt, key):
+        """ Return the entries from the sorted table at offset, which start
+            with the key values. """
+        size = struct.calcsize(fmt)
+        keylen = len(key)
+        beg, end = 0, num
+        while beg < end:
+            mid = (beg + end) / 2
+            if struct.unpack_from(fmt, self._mm, offset + size*mid)[:keylen] < key:
+                beg = mid + 1
+            else:
+                end = mid
+        ret = []
+        while beg < num:
+            val = struct.unpack_from(fmt, self._mm, offset + size * beg)
+            if val[:keylen] != key:
+                break
+            ret.append(val)
+            beg += 1
+        return ret
+
+    def __len__(self):
+        return self._npkgs
+
+    def pkg(self, num):
+        """ Return the (rpmdb index, pkgtup) for the package number. """
+        vals = struct.unpack_from('<6I', self._mm, self._pkgs + 4 * 6 * num)
+        return vals[0], tuple([self._str(x) for x in vals[1:]])
+
+    def prcos(self, prcotype, name):
+        """ Return a list of (package number, prco tuple) for all the entries
+            with the given name. """
+        num = self._str_id(misc.to_utf8(name))
+        if num is None:
+            return []
+        offset, nprcos = self._prcos[prcotype]
+        ret = []
+        for (n, f, e, v, r, pkg) in self._bsearch(offset, nprcos,
+                                                  self._prco_fmt, (num,)):
+            prco = (self._str(n), self._str(f),
+                    (self._str(e), self._str(v), self._str(r)))
+            ret.append((pkg, misc.share_data(prco)))
+        return ret
+
+    def files(self, fname):
+        """ Return a list of package numbers that have the file. """
+        (d, b) = os.path.split(misc.to_utf8(fname))
+        d = self._str_id(d)
+        b = self._str_id(b)
+        if d is None or b is None:
+            return []
+        return [x[2] for x in self._bsearch(self._files, self._nfiles,
+                                            self._file_fmt, (b, d))]
+
 class RPMDBPackageSack(PackageSackBase):
     '''
     Represent rpmdb as a packagesack
@@ -212,8 +489,12 @@ class RPMDBPackageSack(PackageSackBase):
     __cache_rpmdb__ = True
 
     def __init__(self, root='/', releasever=None, cachedir=None,
-                 persistdir='/var/lib/yum'):
+                 persistdir='/var/lib/yum', use_index=False,
+                 yumdb_backend='dirs', cache_size=0):
         self.root = root
+        self._cache_size = cache_size
+        self.use_index = use_index
+        self._prco_index = None
         self._idx2pkg = {}
         self._name2pkg = {}
         self._pkgnames_loaded = set()
@@ -223,8 +504,8 @@ class RPMDBPackageSack(PackageSackBase):
         self._pkgmatch_fails = set()
         self._provmatch_fails = set()
         self._simple_pkgtup_list = []
-        self._get_pro_cache = {}
-        self._get_req_cache  = {}
+        self._new_lookup_caches()
+        self._header_loads = 0 # For the depsolve profile
         self._loaded_gpg_keys = False
         if cachedir is None:
             cachedir = persistdir + "/rpmdb-indexes"
@@ -249,17 +530,37 @@ class RPMDBPackageSack(PackageSackBase):
                                      # any lingering locks.
         self._cached_rpmdb_mtime = None
 
-        self._cache = {
-            'provides' : { },
-            'requires' : { },
-            'conflicts' : { },
-            'obsoletes' : { },
-            }
         
         addldb_path = os.path.normpath(self._persistdir + '/yumdb')
         version_path = os.path.normpath(cachedir + '/version')
-        self.yumdb = RPMDBAdditionalData(db_path=addldb_path,
-                                         version_path=version_path)
+        if yumdb_backend == 'sqlite':
+            yumdb_class = RPMDBAdditionalDataSqlite
+        else:
+            yumdb_class = RPMDBAdditionalData
+        self.yumdb = yumdb_class(db_path=addldb_path,
+                                 version_path=version_path)
+
+    def _new_lookup_caches(self):
+        """ Create the (empty) caches for getProvides()/getRequires() and
+            searchPrco() results. The size of each result is the number of
+            pkgs in it. """
+        def _size(result):
+            return len(result) + 1
+        self._get_pro_cache = misc.LRUCache('rpmdb.provides',
+                                            self._cache_size, _size)
+        self._get_req_cache = misc.LRUCache('rpmdb.requires',
+                                            self._cache_size, _size)
+        self._cache = {}
+        for prcotype in ('provides', 'requires', 'conflicts', 'obsoletes'):
+            self._cache[prcotype] = misc.LRUCache('rpmdb.search.' + prcotype,
+                                                  self._cache_size, _size)
+
+    def _clear_lookup_caches(self):
+        """ Empty the caches from _new_lookup_caches(), but keep the stats. """
+        self._get_pro_cache.clear()
+        self._get_req_cache.clear()
+        for cache in self._cache.values():
+            cache.clear()
 
     def _get_pkglist(self):
         '''Getter for the pkglist property. 
@@ -292,20 +593,15 @@ class RPMDBPackageSack(PackageSackBase):
         self._pkgname_fails = set()
         self._provmatch_fails = set()
         self._simple_pkgtup_list = []
-        self._get_pro_cache = {}
-        self._get_req_cache = {}
+        self._clear_lookup_caches()
         #  We can be called on python shutdown (due to yb.__del__), at which
         # point other modules might not be available.
         if misc is not None:
             misc.unshare_data()
-        self._cache = {
-            'provides' : { },
-            'requires' : { },
-            'conflicts' : { },
-            'obsoletes' : { },
-            }
         self._have_cached_rpmdbv_data = None
         self._cached_conflicts_data = None
+        self._close_prco_index()
+        self.yumdb.commit()
         self.transactionReset() # Should do nothing, but meh...
         self._cached_rpmdb_mtime = None
 
@@ -323,20 +619,14 @@ class RPMDBPackageSack(PackageSackBase):
         # -- Below -- self._pkgname_fails = set()
         self._provmatch_fails = set()
         self._simple_pkgtup_list = []
-        self._get_pro_cache = {}
-        self._get_req_cache = {}
+        self._clear_lookup_caches()
         #  We can be called on python shutdown (due to yb.__del__), at which
         # point other modules might not be available.
         if misc is not None:
             misc.unshare_data()
-        self._cache = {
-            'provides' : { },
-            'requires' : { },
-            'conflicts' : { },
-            'obsoletes' : { },
-            }
         self._have_cached_rpmdbv_data = None
         self._cached_conflicts_data = None
+        self._close_prco_index()
         self.transactionReset() # Should do nothing, but meh...
 
         #  We are keeping some data from before, and sometimes (Eg. remove only)
@@ -407,6 +697,8 @@ class RPMDBPackageSack(PackageSackBase):
         if hasattr(self, 'yumdb'): # Need to keep this up to date, after init.
             version_path = os.path.normpath(self._cachedir + '/version')
             self.yumdb.conf.version_path = version_path
+            self.yumdb.conf.version_data_path = os.path.normpath(
+                self._cachedir + '/pkgtups-yumdb')
 
     def readOnlyTS(self):
         if not self.ts:
@@ -449,6 +741,12 @@ class RPMDBPackageSack(PackageSackBase):
         result = {}
         
         name = os.path.normpath(name)
+        index = self._get_prco_index()
+        if index is not None:
+            pkgs = self._prco_index_pkgs(index, index.files(name))
+            if pkgs is not None:
+                return pkgs.values()
+
         # Note that globs can't be done. As of 4.8.1:
         #   mi.pattern('basenames', rpm.RPMMIRE_GLOB, name)
         # ...produces no results.
@@ -763,6 +1061,9 @@ class RPMDBPackageSack(PackageSackBase):
         misc.unlink_f(self._cachedir + '/obsoletes')
         misc.unlink_f(self._cachedir + '/file-requires')
         misc.unlink_f(self._cachedir + '/pkgtups-checksums')
+        misc.unlink_f(self._cachedir + '/pkgtups-yumdb')
+        self._close_prco_index()
+        misc.unlink_f(self._cachedir + '/prco-index')
         #  We have a couple of options here, we can:
         #
         # . Ignore it and continue - least invasive, least likely to get any
@@ -1139,6 +1440,207 @@ class RPMDBPackageSack(PackageSackBase):
         os.rename(self._cachedir + '/pkgtups-checksums.tmp',
                   self._cachedir + '/pkgtups-checksums')
 
+    def _read_yumdb_version_data(self):
+        """ Return the yumdb data simpleVersion() needs (see
+            _yumdb_version_attrs) as pkgtup => tuple, with None for anything
+            that isn't set, from pkgtups-yumdb. Returns None if we don't have
+            it for the current rpmdb version. """
+        if not self.__cache_rpmdb__:
+            return None
+
+        #  If we don't have the main version cached, we need to read the
+        # checksums to make it anyway.
+        rpmdbv = self._get_cached_simpleVersion_main()
+        if rpmdbv is None:
+            return None
+
+        fo, e = _iopen(self._cachedir + '/pkgtups-yumdb')
+        if fo is None:
+            return None
+
+        frpmdbv = fo.readline()
+        if not frpmdbv or rpmdbv != frpmdbv[:-1]:
+            return None
+
+        def _read_str(fo):
+            return fo.readline()[:-1]
+
+        data = {}
+        try:
+            pkgtups_num = int(_read_str(fo))
+            while pkgtups_num > 0:
+                pkgtups_num -= 1
+
+                # n, a, e, v, r
+                pkgtup = (_read_str(fo), _read_str(fo),
+                          _read_str(fo), _read_str(fo), _read_str(fo))
+                int(pkgtup[2]) # Check epoch is valid
+
+                vals = []
+                for attr in _yumdb_version_attrs:
+                    val = fo.readline()
+                    if val == '\n':
+                        vals.append(None)
+                    elif val.startswith('=') and val.endswith('\n'):
+                        vals.append(val[1:-1])
+                    else:
+                        raise ValueError
+                data[pkgtup] = tuple(vals)
+
+            if fo.readline() != '': # Should be EOF
+                return None
+        except ValueError:
+            self._deal_with_bad_rpmdbcache("yumdb version data")
+            return None
+
+        return data
+
+    def _write_yumdb_version_data(self, rpmdbversion, data):
+        """ Write the data from simpleVersion() to pkgtups-yumdb, values are
+            written as "=value" and unset ones as an empty line. """
+        if not self.__cache_rpmdb__:
+            return
+
+        if not os.access(self._cachedir, os.W_OK):
+            return
+
+        #  Same as for the main version, if something changed the rpmdb while
+        # we were reading it the data is suspect.
+        rpmdbfname  = self._rpmdbpath + "/Packages"
+        if (self._cached_rpmdb_mtime is None or
+            not os.path.exists(rpmdbfname) or
+            self._cached_rpmdb_mtime != os.path.getmtime(rpmdbfname)):
+            return
+
+        for vals in data.itervalues():
+            for val in vals:
+                if val is not None and '\n' in val:
+                    return
+
+        fo = _open_no_umask(self._cachedir + '/pkgtups-yumdb.tmp', 'w')
+        fo.write("%s\n" % rpmdbversion)
+        fo.write("%u\n" % len(data))
+        for pkgtup in sorted(data):
+            for var in pkgtup:
+                fo.write("%s\n" % var)
+            for val in data[pkgtup]:
+                if val is None:
+                    fo.write("\n")
+                else:
+                    fo.write("=%s\n" % val)
+        fo.close()
+        os.rename(self._cachedir + '/pkgtups-yumdb.tmp',
+                  self._cachedir + '/pkgtups-yumdb')
+
+    def _close_prco_index(self):
+        #  We can be called on python shutdown (due to yb.__del__), at which
+        # point this might be gone.
+        if getattr(self, '_prco_index', None):
+            self._prco_index.close()
+        self._prco_index = None
+
+    def _get_prco_index(self):
+        """ Return the RPMDBPrcoIndex for the rpmdb, creating it if needed, or
+            None if we aren't using it. """
+        if self._prco_index is not None:
+            return self._prco_index or None
+
+        self._prco_index = False
+        if not self.use_index or not self.__cache_rpmdb__:
+            return None
+
+        fname = self._cachedir + '/prco-index'
+        rpmdbv = self.simpleVersion(main_only=True)[0]
+        index = RPMDBPrcoIndex.load(fname, rpmdbv)
+        if index is None:
+            if not os.access(self._cachedir, os.W_OK):
+                return None
+            self._write_prco_index(fname, rpmdbv)
+            index = RPMDBPrcoIndex.load(fname, rpmdbv)
+        if index is None:
+            return None
+
+        self._prco_index = index
+        return index
+
+    def _write_prco_index(self, fname, rpmdbv):
+        """ Load all the headers, and write out the data for the index. """
+        pkgs = []
+        for hdr, idx in self._get_packages():
+            # Don't want to keep all this data in the real pkg objects.
+            po = YumInstalledPackage(hdr)
+            fnames = []
+            for ftype in ('file', 'dir', 'ghost'):
+                fnames.extend(po.returnFileEntries(ftype))
+            pkgs.append((idx, po.pkgtup, po.returnPrco('provides'),
+                         po.returnPrco('requires'), fnames))
+        RPMDBPrcoIndex.write(fname, rpmdbv, pkgs)
+
+    def _prco_index_pkgs(self, index, nums):
+        """ Given package numbers from the index, get the package objects
+            for them. Returns None if the index doesn't match the rpmdb. """
+        ret = {}
+        for num in nums:
+            idx, pkgtup = index.pkg(num)
+            if pkgtup in self._tup2pkg:
+                ret[num] = self._tup2pkg[pkgtup]
+                continue
+            for hdr, hidx in self._get_packages(0, idx):
+                if self._hdr2pkgTuple(hdr) == pkgtup:
+                    ret[num] = self._makePackageObject(hdr, hidx)
+            if num in ret:
+                continue
+            # rpmdb indexes changed, Eg. rpm --rebuilddb
+            pkgs = self.searchPkgTuple(pkgtup)
+            if not pkgs:
+                self._close_prco_index()
+                self._prco_index = False
+                misc.unlink_f(self._cachedir + '/prco-index')
+                return None
+            ret[num] = pkgs[0]
+        return ret
+
+    def _prco_index_search(self, prcotype, deptup):
+        """ Do getProvides()/getRequires() using the index, returns None if
+            we can't. """
+        index = self._get_prco_index()
+        if index is None:
+            return None
+
+        name = deptup[0]
+        r_v = deptup[2][1]
+        hits = {}
+        for num, (n, f, (e, v, r)) in index.prcos(prcotype, name):
+            if name[0] == '/' and r_v is None:
+                hits[num] = [(name, None, (None, None, None))]
+                continue
+
+            # Same as pkg.matchingPrcos() does.
+            if f == '=':
+                f = 'EQ'
+            if f != 'EQ' and prcotype == 'provides':
+                (pn, pa, pe, pv, pr) = index.pkg(num)[1]
+                if e is None:
+                    e = pe
+                if v is None:
+                    v = pv
+                if r is None:
+                    r = pr
+            if miscutils.rangeCompare(deptup, (n, f, (e, v, r))):
+                hits.setdefault(num, []).append((n, f, (e, v, r)))
+
+        if prcotype == 'provides' and name[0] == '/' and r_v is None:
+            for num in index.files(os.path.normpath(name)):
+                hits[num] = [(name, None, (None, None, None))]
+
+        pkgs = self._prco_index_pkgs(index, hits)
+        if pkgs is None:
+            return None
+        result = {}
+        for num in hits:
+            result[pkgs[num]] = hits[num]
+        return result
+
     def _get_cached_simpleVersion_main(self):
         """ Return the cached string of the main rpmdbv. """
         if self._have_cached_rpmdbv_data is not None:
@@ -1215,15 +1717,35 @@ class RPMDBPackageSack(PackageSackBase):
             if rpmdbv is not None:
                 return [rpmdbv, {}]
 
+        #  The yumdb data for all the pkgs. is cached for the rpmdb version,
+        # so we don't need to go to the yumdb for each pkg. every time.
+        vdata = None
+        if not main_only:
+            vdata = self._read_yumdb_version_data()
+        write_vdata = vdata is None and not main_only
+        if vdata is None:
+            vdata = {}
+
         main = PackageSackVersion()
         irepos = {}
         main_grps = {}
         irepos_grps = {}
         for pkg in sorted(self.returnPackages()):
-            ydbi = pkg.yumdb_info
+            if pkg.pkgtup in vdata:
+                (T, D, from_repo, rev) = vdata[pkg.pkgtup]
+            else:
+                ydbi = pkg.yumdb_info
+                T = ydbi.get('checksum_type')
+                D = ydbi.get('checksum_data')
+                from_repo = rev = None
+                if not main_only:
+                    from_repo = ydbi.get('from_repo')
+                    rev = ydbi.get('from_repo_revision')
+                if write_vdata:
+                    vdata[pkg.pkgtup] = (T, D, from_repo, rev)
             csum = None
-            if 'checksum_type' in ydbi and 'checksum_data' in ydbi:
-                csum = (ydbi.checksum_type, ydbi.checksum_data)
+            if T is not None and D is not None:
+                csum = (T, D)
             main.update(pkg, csum)
 
             for group in groups:
@@ -1237,11 +1759,10 @@ class RPMDBPackageSack(PackageSackBase):
                 continue
 
             repoid = 'installed'
-            rev = None
-            if 'from_repo' in pkg.yumdb_info:
-                repoid = '@' + pkg.yumdb_info.from_repo
-                if 'from_repo_revision' in pkg.yumdb_info:
-                    rev = pkg.yumdb_info.from_repo_revision
+            if from_repo is not None:
+                repoid = '@' + from_repo
+            else:
+                rev = None
 
             _up_revs(irepos, repoid, rev, pkg, csum)
             for group in groups:
@@ -1250,6 +1771,8 @@ class RPMDBPackageSack(PackageSackBase):
 
         if self._have_cached_rpmdbv_data is None:
             self._put_cached_simpleVersion_main(main)
+        if write_vdata:
+            self._write_yumdb_version_data(main, vdata)
 
         if groups:
             return [main, irepos, main_grps, irepos_grps]
@@ -1300,6 +1823,7 @@ class RPMDBPackageSack(PackageSackBase):
 
         mi = ts.dbMatch(*args, **kwds)
         for h in mi:
+            self._header_loads += 1
             if h['name'] != 'gpg-pubkey':
                 yield (h, mi.instance())
         del mi
@@ -1487,9 +2011,15 @@ class RPMDBPackageSack(PackageSackBase):
 
         name = misc.share_data(name)
         deptup = self._genDeptup(name, flags, version)
-        if deptup in self._get_pro_cache:
-            return self._get_pro_cache[deptup]
+        result = self._get_pro_cache.get(deptup)
+        if result is not None:
+            return result
         r_v = deptup[2][1]
+
+        result = self._prco_index_search('provides', deptup)
+        if result is not None:
+            self._get_pro_cache[deptup] = result
+            return result
         
         pkgs = self.searchProvides(name)
         
@@ -1515,10 +2045,16 @@ class RPMDBPackageSack(PackageSackBase):
 
         name = misc.share_data(name)
         deptup = self._genDeptup(name, flags, version)
-        if deptup in self._get_req_cache:
-            return self._get_req_cache[deptup]
+        result = self._get_req_cache.get(deptup)
+        if result is not None:
+            return result
         r_v = deptup[2][1]
 
+        result = self._prco_index_search('requires', deptup)
+        if result is not None:
+            self._get_req_cache[deptup] = result
+            return result
+
         pkgs = self.searchRequires(name)
 
         result = { }
@@ -1549,15 +2085,91 @@ class RPMDBPackageSack(PackageSackBase):
 
         return sorted(pkgs.keys())
 
-    def check_dependencies(self, pkgs=None):
-        """ Checks for any missing dependencies. """
+    def _check_forked(self, check, items, workers=1):
+        """ Return check(items), but with workers > 1 the items are split into
+            that many contiguous chunks and check() is run on each one in a
+            forked child, with its own read-only ts. The problems come back
+            with the pkgs. as pkgtups, and are joined in order, so the result
+            is the same as doing it all here. If a child fails, its chunk is
+            checked here. """
+        if workers <= 1 or len(items) < 2:
+            return check(items)
+
+        #  Load the index now, or the children would all try to write it.
+        self._get_prco_index()
+
+        size = (len(items) + workers - 1) / workers
+        children = []
+        for num in range(0, len(items), size):
+            chunk = items[num:num + size]
+            (rfd, wfd) = os.pipe()
+            try:
+                pid = os.fork()
+            except OSError:
+                os.close(rfd)
+                os.close(wfd)
+                children.append((None, None, chunk))
+                continue
+            if not pid:
+                #  Keep a ref. to the parent's ts, so it isn't closed here, and
+                # don't run any cleanup on the way out.
+                parent_ts = self.ts
+                self.ts = None
+                ret = 1
+                try:
+                    try:
+                        os.close(rfd)
+                        problems = _rpmdb_problems_map(check(chunk),
+                                                       _rpmdb_problem_dump)
+                        fo = os.fdopen(wfd, 'w')
+                        cPickle.dump(problems, fo, cPickle.HIGHEST_PROTOCOL)
+                        fo.close()
+                        ret = 0
+                    except:
+                        pass
+                finally:
+                    os._exit(ret)
+            os.close(wfd)
+            children.append((pid, os.fdopen(rfd), chunk))
+
+        def _load(val):
+            if isinstance(val, _RPMDBProblemPkg):
+                return self.searchPkgTuple(val)[0]
+            return val
+
+        problems = []
+        for (pid, fo, chunk) in children:
+            probs = None
+            status = 1
+            if pid is not None:
+                data = fo.read()
+                fo.close()
+                status = os.waitpid(pid, 0)[1]
+            if not status:
+                try:
+                    probs = _rpmdb_problems_map(cPickle.loads(data), _load)
+                except (cPickle.UnpicklingError, EOFError, IndexError):
+                    probs = None
+            if probs is None:
+                probs = check(chunk)
+            problems.extend(probs)
+        return problems
+
+    def check_dependencies(self, pkgs=None, workers=1):
+        """ Checks for any missing dependencies. With workers > 1 the checks
+            are split over that many processes, see _check_forked(). """
 
         if pkgs is None:
             pkgs = self.returnPackages()
 
+        # The sort here is mainly for "UI"
+        return self._check_forked(self._check_dependencies, sorted(pkgs),
+                                  workers)
+
+    def _check_dependencies(self, pkgs):
         providers = set() # Speedup, as usual :)
         problems = []
-        for pkg in sorted(pkgs): # The sort here is mainly for "UI"
+        for pkg in pkgs:
             for rreq in pkg.strong_requires:
                 if rreq[0].startswith('rpmlib'): continue
                 if rreq in providers:            continue
@@ -1610,13 +2222,16 @@ class RPMDBPackageSack(PackageSackBase):
             yield last, pkg
             last = pkg
 
-    def check_duplicates(self, ignore_provides=[]):
+    def check_duplicates(self, ignore_provides=[], workers=1):
         """ Checks for any "duplicate packages" (those with multiple versions
             installed), we ignore any packages with a provide in the passed
             provide list (this is how installonlyworks, so we do the same). """
-        ignore_provides = set(ignore_provides)
+        pairs = list(self._iter_two_pkgs(set(ignore_provides)))
+        return self._check_forked(self._check_duplicates, pairs, workers)
+
+    def _check_duplicates(self, pairs):
         problems = []
-        for last, pkg in self._iter_two_pkgs(ignore_provides):
+        for last, pkg in pairs:
             if pkg.name != last.name:
                 continue
             if pkg.verEQ(last) and pkg != last:
@@ -1629,18 +2244,23 @@ class RPMDBPackageSack(PackageSackBase):
             problems.append(RPMDBProblemDuplicate(pkg, duplicate=last))
         return problems
 
-    def check_obsoleted(self):
+    def check_obsoleted(self, workers=1):
         """ Checks for any packages which are obsoleted by other packages. """
         obsoleters = []
-        problems = []
-        for pkg in sorted(self.returnPackages()):
+        pkgs = sorted(self.returnPackages())
+        for pkg in pkgs:
             if not pkg.obsoletes:
                 continue
             obsoleters.append(pkg)
-        for pkg in sorted(self.returnPackages()):
-            for obspo in pkg.obsoletedBy(obsoleters):
-                problems.append(RPMDBProblemObsoleted(pkg, obsoleter=obspo))
-        return problems
+
+        def _check_obsoleted(pkgs):
+            problems = []
+            for pkg in pkgs:
+                for obspo in pkg.obsoletedBy(obsoleters):
+                    problems.append(RPMDBProblemObsoleted(pkg,
+                                                          obsoleter=obspo))
+            return problems
+        return self._check_forked(_check_obsoleted, pkgs, workers)
 
     def _check_provides_get(self, pkg, provtup):
         """ This is kind of a super quick version of getProvides(), because all
@@ -1660,11 +2280,15 @@ class RPMDBPackageSack(PackageSackBase):
                 return True
         return False
 
-    def check_provides(self):
+    def check_provides(self, workers=1):
         """ For each package, check that a provides search for it's name (and
             everything it provides) finds it. """
+        return self._check_forked(self._check_provides,
+                                  sorted(self.returnPackages()), workers)
+
+    def _check_provides(self, pkgs):
         problems = []
-        for pkg in sorted(self.returnPackages()):
+        for pkg in pkgs:
             for provtup in pkg.provides:
                 if not self._check_provides_get(pkg, provtup):
                     problems.append(RPMDBProblemProvides(pkg, provide=provtup))
@@ -1687,6 +2311,10 @@ class RPMDBAdditionalData(object):
         self.conf = misc.GenericHolder()
         self.conf.db_path = db_path
         self.conf.version_path = version_path
+        self.conf.version_data_path = None
+        if version_path is not None:
+            self.conf.version_data_path = os.path.normpath(
+                os.path.dirname(version_path) + '/pkgtups-yumdb')
         self.conf.writable = False
         
         self._packages = {} # pkgid = dir
@@ -1734,6 +2362,10 @@ class RPMDBAdditionalData(object):
         return RPMDBAdditionalDataPackage(self.conf, thisdir,
                                           yumdb_cache=self.yumdb_cache)
 
+    def commit(self):
+        """ Nothing to do, each attribute is written to its own file. """
+        pass
+
     def sync_with_rpmdb(self, rpmdbobj):
         """populate out the dirs and remove all the items no longer in the rpmd
            and/or populate various bits to the currently installed version"""
@@ -1851,10 +2483,7 @@ class RPMDBAdditionalDataPackage(object):
         if attr.endswith('.tmp'):
             raise AttributeError, "Cannot set attribute %s on %s" % (attr, self)
 
-        #  These two are special, as they have an index and are used as our
-        # cache-breaker.
-        if attr in ('checksum_type', 'checksum_data'):
-            misc.unlink_f(self._conf.version_path)
+        _yumdb_attr_changed(self._conf, attr)
 
         # Auto hardlink some of the attrs...
         if self._link_yumdb_cache(fn, value):
@@ -1916,6 +2545,7 @@ class RPMDBAdditionalDataPackage(object):
         fn = self._attr2fn(attr)
         if attr in self._read_cached_data:
             del self._read_cached_data[attr]
+        _yumdb_attr_changed(self._conf, attr)
         self._unlink_yumdb_cache(fn)
         if os.path.exists(fn):
             try:
@@ -1975,7 +2605,197 @@ class RPMDBAdditionalDataPackage(object):
         except AttributeError:
             return default
         return res
-        
+
+
+class RPMDBAdditionalDataSqlite(RPMDBAdditionalData):
+    """ The same as RPMDBAdditionalData, but all the data is kept in a single
+        sqlite DB (yumdb.sqlite in the yumdb dir.) keyed by the pkgid,
+        instead of a dir. per. package and a file per. attribute. Any data in
+        the dirs. is migrated into the DB the first time it's created. If we
+        can't create/open the DB, this just uses the dirs. """
+
+    def __init__(self, db_path='/var/lib/yum/yumdb', version_path=None):
+        RPMDBAdditionalData.__init__(self, db_path, version_path)
+        self.conf.db_file = os.path.normpath(self.conf.db_path +
+                                             '/yumdb.sqlite')
+        self._conn = None
+        self._attr_cache = {}
+        self._open_db()
+
+    def _open_db(self):
+        if not os.path.exists(self.conf.db_file):
+            if not self.conf.writable:
+                return
+            try:
+                self._migrate_dirs()
+            except (sqlite.Error, IOError, OSError):
+                misc.unlink_f(self.conf.db_file + '.tmp')
+                return
+
+        try:
+            self._conn = sqlite.connect(self.conf.db_file)
+            if hasattr(self._conn, 'text_factory'):
+                self._conn.text_factory = str
+            #  Like the history DB, NORMAL is very safe already and writes
+            # are committed in batches (see commit()), so we don't need FULL.
+            executeSQL(self._conn.cursor(), "PRAGMA synchronous = NORMAL")
+        except sqlite.Error:
+            self._conn = None
+
+    def _migrate_dirs(self):
+        """ Create the DB, with all the data from the dirs. in it. """
+        misc.unlink_f(self.conf.db_file + '.tmp')
+        conn = sqlite.connect(self.conf.db_file + '.tmp')
+        if hasattr(conn, 'text_factory'):
+            conn.text_factory = str
+        cur = conn.cursor()
+        executeSQL(cur, """CREATE TABLE yumdb (pkgkey TEXT, pkgid TEXT,
+                           attr TEXT, value TEXT, PRIMARY KEY (pkgkey, attr))""")
+        executeSQL(cur, "CREATE INDEX yumdb_attr ON yumdb (attr)")
+
+        rows = []
+        for pkgdir in glob.glob('%s/*/*/' % self.conf.db_path):
+            pkgkey = os.path.basename(os.path.normpath(pkgdir))
+            pkgid = pkgkey.split('-')[0]
+            for fn in glob.glob(pkgdir + '*'):
+                attr = os.path.basename(fn)
+                if attr.endswith('.tmp'):
+                    continue
+                fo, e = _iopen(fn)
+                if fo is None:
+                    continue
+                rows.append((pkgkey, pkgid, attr, fo.read()))
+                fo.close()
+        cur.executemany("INSERT INTO yumdb VALUES (?, ?, ?, ?)", rows)
+        conn.commit()
+        conn.close()
+        oumask = os.umask(022)
+        try:
+            os.chmod(self.conf.db_file + '.tmp', 0644)
+        finally:
+            os.umask(oumask)
+        os.rename(self.conf.db_file + '.tmp', self.conf.db_file)
+
+    def get_package(self, po=None, pkgtup=None, pkgid=None):
+        """Return an RPMDBAdditionalDataPackage Object for this package"""
+        if po:
+            pkgtup = po.pkgtup
+            pkgid = po.pkgid
+        elif not (pkgtup and pkgid):
+            raise ValueError,"Pass something to RPMDBAdditionalData.get_package"
+        thisdir = self._get_dir_name(pkgtup, pkgid)
+        if self._conn is None:
+            return RPMDBAdditionalDataPackage(self.conf, thisdir,
+                                              yumdb_cache=self.yumdb_cache)
+
+        return RPMDBAdditionalDataPackageSqlite(self.conf, thisdir, self,
+                                                os.path.basename(thisdir),
+                                                pkgid)
+
+    def _attr_values(self, attr):
+        """ Get the values of the attribute for all packages, in one go. """
+        if attr not in self._attr_cache:
+            cur = self._conn.cursor()
+            executeSQL(cur, "SELECT pkgkey, value FROM yumdb WHERE attr = ?",
+                       (attr,))
+            self._attr_cache[attr] = dict([(x[0], x[1]) for x in cur])
+        return self._attr_cache[attr]
+
+    def _attrs(self, pkgkey):
+        cur = self._conn.cursor()
+        executeSQL(cur, "SELECT attr FROM yumdb WHERE pkgkey = ?", (pkgkey,))
+        return [x[0] for x in cur]
+
+    def _set(self, pkgkey, pkgid, attr, value):
+        cur = self._conn.cursor()
+        executeSQL(cur, "INSERT OR REPLACE INTO yumdb VALUES (?, ?, ?, ?)",
+                   (pkgkey, pkgid, attr, value))
+        if attr in self._attr_cache:
+            self._attr_cache[attr][pkgkey] = value
+
+    def _del(self, pkgkey, attr):
+        cur = self._conn.cursor()
+        executeSQL(cur, "DELETE FROM yumdb WHERE pkgkey = ? AND attr = ?",
+                   (pkgkey, attr))
+        if attr in self._attr_cache:
+            self._attr_cache[attr].pop(pkgkey, None)
+
+    def commit(self):
+        """ Commit the attributes written since the last commit(). A
+            transaction writes a lot of attributes, so rpmdb.dropCachedData()
+            commits them all at once instead of one sync per. attribute. """
+        if self._conn is not None:
+            self._conn.commit()
+
+class RPMDBAdditionalDataPackageSqlite(RPMDBAdditionalDataPackage):
+    """ RPMDBAdditionalDataPackage for data in RPMDBAdditionalDataSqlite. """
+
+    def __init__(self, conf, pkgdir, yumdb, pkgkey, pkgid):
+        RPMDBAdditionalDataPackage.__init__(self, conf, pkgdir)
+        self._yumdb = yumdb
+        self._pkgkey = pkgkey
+        self._pkgid = pkgid
+
+    def _write(self, attr, value):
+        value = str(value)
+
+        attr = _sanitize(attr)
+        if attr in self._read_cached_data:
+            del self._read_cached_data[attr]
+
+        if attr.endswith('.tmp'):
+            raise AttributeError, "Cannot set attribute %s on %s" % (attr, self)
+
+        _yumdb_attr_changed(self._conf, attr)
+
+        try:
+            self._yumdb._set(self._pkgkey, self._pkgid, attr, value)
+        except sqlite.Error:
+            raise AttributeError, "Cannot set attribute %s on %s" % (attr, self)
+        self._read_cached_data[attr] = value
+
+    def _read(self, attr):
+        attr = _sanitize(attr)
+
+        if attr in self._read_cached_data:
+            return self._read_cached_data[attr]
+
+        if attr.endswith('.tmp'):
+            raise AttributeError, "%s has no attribute %s" % (self, attr)
+
+        try:
+            value = self._yumdb._attr_values(attr).get(self._pkgkey)
+        except sqlite.Error, e:
+            return '<E:%s>' % e
+        if value is None:
+            raise AttributeError, "%s has no attribute %s" % (self, attr)
+
+        self._read_cached_data[attr] = value
+        return value
+
+    def _delete(self, attr):
+        attr = _sanitize(attr)
+        if attr in self._read_cached_data:
+            del self._read_cached_data[attr]
+        _yumdb_attr_changed(self._conf, attr)
+        try:
+            self._yumdb._del(self._pkgkey, attr)
+        except sqlite.Error:
+            raise AttributeError, "Cannot delete attribute %s on %s " % (attr, self)
+
+    def __iter__(self, show_hidden=False):
+        for item in self._read_cached_data:
+            yield item
+        for item in self._yumdb._attrs(self._pkgkey):
+            if item in self._read_cached_data:
+                continue
+            yield item
+
+    def clean(self):
+        # purge out everything
+        for item in list(self.__iter__(show_hidden=True)):
+            self._delete(item)
+
         
 def main():
     sack = RPMDBPackageSack('/')
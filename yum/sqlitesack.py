@@ -22,9 +22,12 @@
 import os
 import os.path
 import fnmatch
+import array
+import zlib
 
 import yumRepo
 from packages import PackageObject, RpmBase, YumAvailablePackage, parsePackages
+from packages import YumLocalPackage
 import Errors
 import misc
 
@@ -175,36 +178,389 @@ def _excluder_match(excluder, match, regexp_match, data, e,v,r,a):
 
     return False
 
+_FILES_INDEX_DBVERSION = 1
+
+def _filelists_index(repo, fconn):
+    """ Return a sqlite connection to the file path index for repo, made from
+        the filelists MD connection fconn. This has a files table of
+        (pkgKey, path, nameid) with an index on path, and a names table of
+        the unique basenames (nameid, name, rname), with indexes on the name
+        and on the reversed name (for suffix lookups). It's saved in gen/ and
+        only rebuilt when the filelists MD changes. """
+    csum = None
+    try:
+        fcur = fconn.cursor()
+        executeSQL(fcur, "SELECT checksum FROM db_info")
+        row = fcur.fetchone()
+        if row is not None:
+            csum = row[0]
+    except sqlutils.sqlite.Error:
+        pass
+
+    def build(cur):
+        executeSQL(cur, """CREATE TABLE names (nameid INTEGER PRIMARY KEY,
+                           name TEXT, rname TEXT)""")
+        executeSQL(cur, """CREATE TABLE files (pkgKey INTEGER, path TEXT,
+                           nameid INTEGER)""")
+
+        names = {}
+        def _files():
+            fcur = fconn.cursor()
+            executeSQL(fcur, "SELECT pkgKey, dirname, filenames FROM filelist")
+            for (pkgKey, dirname, filenames) in fcur:
+                if dirname == '/':
+                    dirname = ''
+                for filename in filenames.split('/'):
+                    nameid = names.get(filename)
+                    if nameid is None:
+                        nameid = names[filename] = len(names) + 1
+                    yield (pkgKey, dirname + '/' + filename, nameid)
+        cur.executemany("INSERT INTO files VALUES (?, ?, ?)", _files())
+        cur.executemany("INSERT INTO names VALUES (?, ?, ?)",
+                        ((nameid, name, name[::-1])
+                         for (name, nameid) in names.iteritems()))
+        executeSQL(cur, "CREATE INDEX files_path ON files (path)")
+        executeSQL(cur, "CREATE INDEX files_nameid ON files (nameid)")
+        executeSQL(cur, "CREATE INDEX names_name ON names (name)")
+        executeSQL(cur, "CREATE INDEX names_rname ON names (rname)")
+    return sqlutils.open_gen_index(repo, 'filelists-index.sqlite',
+                                   _FILES_INDEX_DBVERSION, csum, build)
+
+def _glob_literals(pattern):
+    """ Return the literal prefix and suffix of a glob pattern. """
+    beg = len(pattern)
+    end = 0
+    for num, char in enumerate(pattern):
+        if char in '*?[]':
+            beg = min(beg, num)
+            end = num + 1
+    if beg == len(pattern):
+        return pattern, pattern
+    return pattern[:beg], pattern[end:]
+
+def _filelists_index_search(conn, name, glob=True):
+    """ Return the set of pkgKeys that have a file matching name in the
+        filelists index conn. If glob is True name is a (normalized) glob,
+        matched in the same way fnmatch does. """
+    cur = conn.cursor()
+    if not glob or not misc.re_glob(name):
+        executeSQL(cur, "SELECT pkgKey FROM files WHERE path = ?", (name,))
+        return set([x[0] for x in cur])
+
+    filename = os.path.basename(name)
+    name_re = re.compile(fnmatch.translate(name))
+    if not misc.re_glob(filename):
+        # Just a glob in the dirname, so look up the basename.
+        executeSQL(cur, """SELECT pkgKey, path FROM files WHERE nameid IN
+                           (SELECT nameid FROM names WHERE name = ?)""",
+                   (filename,))
+        return set([x[0] for x in cur if name_re.match(x[1])])
+
+    #  Find the basenames that match, using the literal start or end of the
+    # pattern with the name/rname indexes if we can (the names table is much
+    # smaller than the files table, so even a full scan of it isn't terrible).
+    # Then get the files for those.
+    (prefix, suffix) = _glob_literals(filename)
+    if not prefix and not suffix:
+        (dirprefix, dirsuffix) = _glob_literals(name)
+        if len(dirprefix) > 1:
+            # Nothing in the basename, but we know the start of the path.
+            executeSQL(cur, "SELECT pkgKey, path FROM files WHERE path GLOB ?",
+                       (dirprefix + '*',))
+            return set([x[0] for x in cur if name_re.match(x[1])])
+
+    if prefix and len(prefix) >= len(suffix):
+        executeSQL(cur, "SELECT nameid, name FROM names WHERE name GLOB ?",
+                   (prefix + '*',))
+    elif suffix:
+        executeSQL(cur, "SELECT nameid, name FROM names WHERE rname GLOB ?",
+                   (suffix[::-1] + '*',))
+    else:
+        executeSQL(cur, "SELECT nameid, name FROM names")
+    filename_re = re.compile(fnmatch.translate(filename))
+    nameids = [x[0] for x in cur if filename_re.match(x[1])]
+
+    ret = set()
+    for split in misc.seq_max_split(nameids, constants.PATTERNS_INDEXED_MAX):
+        executeSQL(cur, """SELECT pkgKey, path FROM files
+                           WHERE nameid IN (%s)""" % ",".join("?" * len(split)),
+                   split)
+        for x in cur:
+            if name_re.match(x[1]):
+                ret.add(x[0])
+    return ret
+
+_SEARCH_INDEX_DBVERSION = 1
+_SEARCH_INDEX_FIELDS = ('name', 'summary', 'description', 'url')
+
+def _trigrams(text):
+    """ Return the set of lower cased trigrams in text. """
+    text = to_unicode(text).lower()
+    return set([text[num:num + 3] for num in xrange(len(text) - 2)])
+
+def _search_index(repo, pconn):
+    """ Return a sqlite connection to the search index for repo, made from
+        the primary MD connection pconn. This maps each trigram in the
+        lower cased name, summary, description and url of the packages to
+        the pkgKeys that have it, as a zlib compressed array of the
+        differences between the sorted pkgKeys. It's saved in gen/ and only
+        rebuilt when the primary MD changes. """
+    csum = None
+    try:
+        pcur = pconn.cursor()
+        executeSQL(pcur, "SELECT checksum FROM db_info")
+        row = pcur.fetchone()
+        if row is not None:
+            csum = row[0]
+    except sqlutils.sqlite.Error:
+        pass
+
+    def build(cur):
+        index = {}
+        pcur = pconn.cursor()
+        executeSQL(pcur, "SELECT pkgKey, %s FROM packages ORDER BY pkgKey" %
+                   ", ".join(_SEARCH_INDEX_FIELDS))
+        for row in pcur:
+            grams = set()
+            for value in row[1:]:
+                if value:
+                    grams.update(_trigrams(value))
+            for gram in grams:
+                index.setdefault(gram, []).append(row[0])
+
+        executeSQL(cur, """CREATE TABLE trigrams (trigram TEXT PRIMARY KEY,
+                           pkgKeys BLOB)""")
+        def _postings():
+            for gram, pkgKeys in index.iteritems():
+                last = 0
+                deltas = array.array('I')
+                for pkgKey in pkgKeys:
+                    deltas.append(pkgKey - last)
+                    last = pkgKey
+                yield (gram, buffer(zlib.compress(deltas.tostring())))
+        cur.executemany("INSERT INTO trigrams VALUES (?, ?)", _postings())
+    return sqlutils.open_gen_index(repo, 'search-index.sqlite',
+                                   _SEARCH_INDEX_DBVERSION, csum, build)
+
+def _search_index_lookup(conn, searchstring):
+    """ Return the set of pkgKeys that might have searchstring in one of the
+        indexed fields (ignoring case), from the search index conn. Returns
+        None if searchstring is too short to look up. """
+    grams = _trigrams(searchstring)
+    if not grams:
+        return None
+
+    cur = conn.cursor()
+    postings = []
+    for gram in grams:
+        executeSQL(cur, "SELECT pkgKeys FROM trigrams WHERE trigram = ?",
+                   (gram,))
+        row = cur.fetchone()
+        if row is None:
+            return set()
+        postings.append(str(row[0]))
+
+    ret = None
+    for data in sorted(postings, key=len):
+        deltas = array.array('I')
+        deltas.fromstring(zlib.decompress(data))
+        pkgKeys = set()
+        last = 0
+        for delta in deltas:
+            last += delta
+            pkgKeys.add(last)
+        if ret is None:
+            ret = pkgKeys
+        else:
+            ret.intersection_update(pkgKeys)
+        if not ret:
+            break
+    return ret
+
+#  The saved prco lookups are in gen/prco-cache.sqlite, one row in reqs per.
+# (prcotype, req) lookup and a row in hits for each prco entry it matched.
+_PRCO_CACHE_DBVERSION = 2
+
+def _prco_pcache_key(prcotype, req):
+    """ The reqs.reqkey for a (prcotype, req) lookup, the req values have to
+        be strings or None (see YumSqlitePackageSack._prco_pcache_ok()). """
+    (n, f, (e, v, r)) = req
+    ret = [prcotype]
+    for val in (n, f, e, v, r):
+        if val is None:
+            ret.append('-')
+        else:
+            ret.append('=' + val)
+    return ' '.join(ret)
+
+class _PrcoLookupCache:
+    """ The prco lookup results for a repo. of: (prcotype, req) =>
+        {pkgKey : [hits]}. The recently used ones are kept in an LRUCache, any
+        others are looked up in the saved gen/prco-cache.sqlite as they are
+        needed. New results are added to that by save(). """
+
+    def __init__(self, repo, csum, size):
+        self.repo = repo
+        self.csum = csum
+        self.mem = misc.LRUCache('sqlite.prco-pcache', size,
+                                 lambda tmp: len(tmp) + 1)
+        self.dirty = {}
+        self._conn = None
+        self._checked = csum is None
+
+    def _open(self):
+        """ Return the connection to the saved lookups, if there are any for
+            the current primary MD. """
+        if self._conn is None and not self._checked:
+            self._checked = True
+            fname = self.repo.cachedir + '/gen/prco-cache.sqlite'
+            if os.path.exists(fname):
+                self._conn = self._open_gen_index()
+        return self._conn
+
+    def _open_gen_index(self):
+        def build(cur):
+            executeSQL(cur, """CREATE TABLE reqs (reqid INTEGER PRIMARY KEY,
+                               reqkey TEXT UNIQUE)""")
+            executeSQL(cur, """CREATE TABLE hits (reqid INTEGER,
+                               pkgKey INTEGER, flags TEXT,
+                               epoch TEXT, version TEXT, release TEXT)""")
+            executeSQL(cur, "CREATE INDEX hits_reqid ON hits (reqid)")
+        try:
+            return sqlutils.open_gen_index(self.repo, 'prco-cache.sqlite',
+                                           _PRCO_CACHE_DBVERSION, self.csum,
+                                           build)
+        except (sqlutils.sqlite.Error, OSError, IOError):
+            return None
+
+    def get(self, key):
+        """ Return the result for the (prcotype, req) lookup, or None if we
+            haven't done it before. """
+        tmp = self.mem.get(key)
+        if tmp is not None:
+            return tmp
+        if key in self.dirty: # Not saved yet, but dropped from the LRU
+            self.mem[key] = self.dirty[key]
+            return self.dirty[key]
+
+        (prcotype, req) = key
+        if not YumSqlitePackageSack._prco_pcache_ok(req):
+            return None
+        conn = self._open()
+        if conn is None:
+            return None
+        try:
+            cur = conn.cursor()
+            executeSQL(cur, "SELECT reqid FROM reqs WHERE reqkey = ?",
+                       (_prco_pcache_key(prcotype, req),))
+            row = cur.fetchone()
+            if row is None:
+                return None
+            executeSQL(cur, """SELECT pkgKey, flags, epoch, version, release
+                               FROM hits WHERE reqid = ?""", (row[0],))
+            tmp = {}
+            for x in cur:
+                val = (req[0], _share_data(x[1]),
+                       (_share_data(x[2]), _share_data(x[3]),
+                        _share_data(x[4])))
+                tmp.setdefault(x[0], []).append(_share_data(val))
+        except sqlutils.sqlite.Error:
+            self.close()
+            return None
+        self.mem[key] = tmp
+        return tmp
+
+    def set(self, key, tmp, save=True):
+        """ Add the result of the (prcotype, req) lookup, if save is True it
+            is also added to the saved lookups by the next save(). """
+        self.mem[key] = tmp
+        if save and self.csum is not None:
+            self.dirty[key] = tmp
+
+    def save(self):
+        """ Add the new lookups to the saved ones, replacing them if the
+            primary MD changed. """
+        dirty = self.dirty
+        self.dirty = {}
+        if not dirty or not os.access(self.repo.cachedir + '/gen', os.W_OK):
+            return
+
+        if self._conn is None:
+            self._checked = True
+            self._conn = self._open_gen_index()
+            if self._conn is None:
+                return
+        try:
+            cur = self._conn.cursor()
+            for (prcotype, req), tmp in dirty.iteritems():
+                reqkey = _prco_pcache_key(prcotype, req)
+                executeSQL(cur, """DELETE FROM hits WHERE reqid IN
+                                   (SELECT reqid FROM reqs WHERE reqkey = ?)""",
+                           (reqkey,))
+                executeSQL(cur, """INSERT OR REPLACE INTO reqs (reqkey)
+                                   VALUES (?)""", (reqkey,))
+                reqid = cur.lastrowid
+                hits = []
+                for pkgKey, vals in tmp.iteritems():
+                    for (vn, vf, (ve, vv, vr)) in vals:
+                        hits.append((reqid, pkgKey, vf, ve, vv, vr))
+                cur.executemany("INSERT INTO hits VALUES (?,?,?,?,?,?)", hits)
+            self._conn.commit()
+        except sqlutils.sqlite.Error:
+            self.close()
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+#  The prco data for a pkg. that hasn't been loaded from the primary db yet. It
+# is a tuple, so anything looking at .prco directly sees it as empty, but it
+# isn't the same object as a loaded tuple with nothing in it.
+class _PrcoUnloaded(tuple):
+    pass
+_prco_unloaded = _PrcoUnloaded()
+_prco_types = ('obsoletes', 'conflicts', 'requires', 'provides',
+               'suggests', 'enhances', 'recommends', 'supplements')
+#  Shared by all the pkgs. until they load some prco data. Never change it.
+_prco_none_loaded = dict.fromkeys(_prco_types, _prco_unloaded)
+
+#  Tuples for pkgtups and prco data, shared between all the sqlite pkgs.
+# misc.share_data() doesn't do tuples as str/unicode versions of them are
+# equal, but everything here comes from the sqlite dbs so that's not a problem.
+_share_tuple_store = {}
+def _share_tuple(value):
+    return _share_tuple_store.setdefault(value, value)
 
 class YumAvailablePackageSqlite(YumAvailablePackage, PackageObject, RpmBase):
+    #  We can get a lot of these (every pkg. in every repo.), so anything that
+    # is the same for most of them is a class attribute, and anything we can
+    # work out from the rest is a property. So the __dict__ stays small.
+    #  They aren't __slots__, as the parents (and __getattr__, and plugins)
+    # all need the __dict__.
+    prco = _prco_none_loaded
+    state = None
+    _loadedfiles = False
+    _files = None
+    _changelog = None
+    _hash = None
+
+    sack = property(fget=lambda self: self.repo.sack)
+    repoid = property(fget=lambda self: self.repo.id)
+    id = property(fget=lambda self: self.pkgId)
+    name = property(fget=lambda self: self.pkgtup[0])
+    arch = property(fget=lambda self: self.pkgtup[1])
+    epoch = property(fget=lambda self: self.pkgtup[2])
+    version = property(fget=lambda self: self.pkgtup[3])
+    release = property(fget=lambda self: self.pkgtup[4])
+    ver = version
+    rel = release
+    _checksums = property(fget=lambda self: [(self.checksum_type,
+                                              self.pkgId, True)])
+
     def __init__(self, repo, db_obj):
-        self.prco = { 'obsoletes': (),
-                      'conflicts': (),
-                      'requires': (),
-                      'provides': (),
-                      'suggests': (),
-                      'enhances': (),
-                      'recommends': (),
-                      'supplements': () }
-        self.sack = repo.sack
-        self.repoid = repo.id
         self.repo = repo
-        self.state = None
-        self._loadedfiles = False
-        self._files = None
         self._read_db_obj(db_obj)
-        # for stupid metadata created without epochs listed in the version tag
-        # die die
-        if self.epoch is None:
-            self.epoch = '0'
-        self.id = self.pkgId
-        self.ver = self.version 
-        self.rel = self.release 
-        self.pkgtup = (self.name, self.arch, self.epoch, self.version, self.release)
-
-        self._changelog = None
-        self._hash = None
-        
 
     files = property(fget=lambda self: self._loadFiles())
 
@@ -217,18 +573,24 @@ class YumAvailablePackageSqlite(YumAvailablePackage, PackageObject, RpmBase):
             except (IndexError, KeyError):
                 return None
 
-        for item in ['name', 'arch', 'epoch', 'version', 'release', 'pkgKey']:
+        pkgtup = []
+        for item in ['name', 'arch', 'epoch', 'version', 'release']:
             try:
-                setattr(self, item, _share_data(db_obj[item]))
+                pkgtup.append(_share_data(db_obj[item]))
             except (IndexError, KeyError):
-                pass
+                pkgtup.append(None)
+        # for stupid metadata created without epochs listed in the version tag
+        # die die
+        if pkgtup[2] is None:
+            pkgtup[2] = '0'
+        self.pkgtup = _share_tuple(tuple(pkgtup))
 
+        try:
+            self.pkgKey = db_obj['pkgKey']
+        except (IndexError, KeyError):
+            pass
         try:
             self.pkgId = db_obj['pkgId']
-
-            checksum_type = _share_data(db_obj['checksum_type'])
-            check_sum = (checksum_type, db_obj['pkgId'], True)
-            self._checksums = [ check_sum ]
         except (IndexError, KeyError):
             pass
 
@@ -282,7 +644,7 @@ class YumAvailablePackageSqlite(YumAvailablePackage, PackageObject, RpmBase):
             # Maybe others here? ... location_base is a bad NONO though.
             value = '' # Description for picasa, probably among others *sigh*
         if varname in {'vendor' : 1, 'packager' : 1, 'buildhost' : 1,
-                       'license' : 1, 'group' : 1,
+                       'license' : 1, 'group' : 1, 'checksum_type' : 1,
                        'summary' : 1, 'description' : 1, 'sourcerpm' : 1,
                        'url' : 1}:
             value  = _share_data(value)
@@ -295,7 +657,14 @@ class YumAvailablePackageSqlite(YumAvailablePackage, PackageObject, RpmBase):
             return self._files
 
         result = {}
-        
+
+        if self.repo not in self.sack.filelistsdb:
+            lpo = self._local_hdr_pkg()
+            if lpo is not None:
+                self._loadedfiles = True
+                self._files = lpo.files
+                return self._files
+
         #FIXME - this should be try, excepting
         self.sack.populate(self.repo, mdtype='filelists')
         cur = self._sql_MD('filelists',
@@ -323,6 +692,13 @@ class YumAvailablePackageSqlite(YumAvailablePackage, PackageObject, RpmBase):
         result = []
         if not self._changelog:
             if self.repo not in self.sack.otherdb:
+                lpo = self._local_hdr_pkg()
+                if lpo is not None:
+                    for (c_date, c_author, c_log) in lpo.returnChangelog():
+                        c_date = 100 * (c_date / 100)
+                        result.append((c_date, _share_data(c_author), c_log))
+                    self._changelog = result
+                    return
                 try:
                     self.sack.populate(self.repo, mdtype='otherdata')
                 except Errors.RepoError:
@@ -350,6 +726,28 @@ class YumAvailablePackageSqlite(YumAvailablePackage, PackageObject, RpmBase):
             self._changelog = result
             return
         
+    def _local_hdr_pkg(self):
+        """ With filelists_on_demand, if we already have a good copy of the
+            rpm downloaded, return a YumLocalPackage for it. Then the files and
+            changelog for this one pkg. can come from its header, instead of
+            loading the filelists/other MD for the whole repo. """
+        if not getattr(self.repo, 'filelists_on_demand', False):
+            return None
+        if hasattr(self, '_local_hdr_po'):
+            return self._local_hdr_po
+
+        self._local_hdr_po = None
+        try:
+            if not os.path.exists(self.localPkg()) or not self.verifyLocalPkg():
+                return None
+            lpo = YumLocalPackage(filename=self.localPkg())
+        except (Errors.YumBaseError, EnvironmentError):
+            return None
+        if lpo.pkgtup == self.pkgtup:
+            lpo._loadFiles()
+            self._local_hdr_po = lpo
+        return self._local_hdr_po
+
     def returnIdSum(self):
         return (self.checksum_type, self.pkgId)
     
@@ -406,19 +804,22 @@ class YumAvailablePackageSqlite(YumAvailablePackage, PackageObject, RpmBase):
             else:
                 sql_table_exists = False
 
-        if sql_table_exists and isinstance(self.prco[prcotype], tuple):
+        if sql_table_exists and self.prco[prcotype] is _prco_unloaded:
             sql = "SELECT name, version, release, epoch, flags " \
                   "FROM %s WHERE pkgKey = ?" % prcotype
             cur = self._sql_MD('primary', sql, (self.pkgKey,))
-            self.prco[prcotype] = [ ]
+            prcos = []
             for ob in cur:
                 if not ob['name']:
                     continue
                 prco_set = (_share_data(ob['name']), _share_data(ob['flags']),
-                            (_share_data(ob['epoch']),
-                             _share_data(ob['version']),
-                             _share_data(ob['release'])))
-                self.prco[prcotype].append(_share_data(prco_set))
+                            _share_tuple((_share_data(ob['epoch']),
+                                          _share_data(ob['version']),
+                                          _share_data(ob['release']))))
+                prcos.append(_share_tuple(prco_set))
+            if self.prco is _prco_none_loaded:
+                self.prco = _prco_none_loaded.copy()
+            self.prco[prcotype] = tuple(prcos)
 
         return RpmBase.returnPrco(self, prcotype, printable)
     
@@ -443,20 +844,24 @@ class YumSqlitePackageSack(yumRepo.YumPackageSack):
     """ Implementation of a PackageSack that uses sqlite cache instead of fully
     expanded metadata objects to provide information """
 
-    def __init__(self, packageClass):
+    def __init__(self, packageClass, cache_size=0):
         # Just init as usual and create a dict to hold the databases
         yumRepo.YumPackageSack.__init__(self, packageClass)
+        self._search_cache_size = cache_size
         self.primarydb = {}
         self.filelistsdb = {}
         self.otherdb = {}
+        #  Indexes of the files in filelistsdb, per. repo. (see
+        # _filelists_index()), made the first time we search the files.
+        self._filelists_index = {}
+        #  Trigram indexes of the primarydb search fields, per. repo. (see
+        # _search_index()), for repos. with search_index set.
+        self._search_index = {}
         self.excludes = {}     # of [repo] => {} of pkgId's => 1
         self._excludes = set() # of (repo, pkgKey)
         self._exclude_whitelist = set() # of (repo, pkgKey)
         self._all_excludes = {}
-        self._search_cache = {
-            'provides' : { },
-            'requires' : { },
-            }
+        self._search_cache = self._new_search_cache()
         self._key2pkg = {}
         self._pkgname2pkgkeys = {}
         self._pkgtup2pkgs = {}
@@ -467,6 +872,24 @@ class YumSqlitePackageSack(yumRepo.YumPackageSack):
         self._pkgExcluder = []
         self._pkgExcludeIds = {}
         self._pkgobjlist_dirty = False
+        #  Results of the prco SQL lookups in _search(), per. repo. (see
+        # _prco_pcache_load()). These are saved in the repo's gen/ dir. so
+        # they survive between runs, if prco_cache is set.
+        self._prco_pcache = {}
+        #  The same for the pkgKeys that have a file, from the filelists. So
+        # file requires that we've seen before don't need the filelists.
+        self._file_pcache = {}
+        self._file_pcache_dirty = set()
+
+    def _new_search_cache(self):
+        """ The cache of _search() results, for each prcotype. The size of
+            each result is the number of pkgs in it. """
+        ret = {}
+        for prcotype in ('provides', 'requires'):
+            ret[prcotype] = misc.LRUCache('sqlite.' + prcotype,
+                                          self._search_cache_size,
+                                          lambda result: len(result) + 1)
+        return ret
 
     @catchSqliteException
     def _sql_MD(self, MD, repo, sql, *args):
@@ -529,11 +952,15 @@ class YumSqlitePackageSack(yumRepo.YumPackageSack):
         self._pkgmatch_fails = set()
         self._provmatch_fails = set()
         self._pkgtup2pkgs = {}
-        self._search_cache = {
-            'provides' : { },
-            'requires' : { },
-            }
+        for cache in self._search_cache.values():
+            cache.clear()
+        self._prco_pcache_save()
+        self._prco_pcache = {}
+        if self._file_pcache_dirty:
+            self._file_pcache_save()
+        self._file_pcache = {}
         misc.unshare_data()
+        _share_tuple_store.clear()
 
     @catchSqliteException
     def close(self):
@@ -541,10 +968,14 @@ class YumSqlitePackageSack(yumRepo.YumPackageSack):
 
         for dataobj in self.primarydb.values() + \
                        self.filelistsdb.values() + \
+                       self._filelists_index.values() + \
+                       self._search_index.values() + \
                        self.otherdb.values():
             dataobj.close()
         self.primarydb = {}
         self.filelistsdb = {}
+        self._filelists_index = {}
+        self._search_index = {}
         self.otherdb = {}
         self.excludes = {}
         self._excludes = set()
@@ -793,8 +1224,8 @@ class YumSqlitePackageSack(yumRepo.YumPackageSack):
             self._pkgname2pkgkeys[repo] = {}
         elif data['pkgKey'] in prepo:
             return prepo[data['pkgKey']].pkgtup
-        return (data['name'], data['arch'],
-                data['epoch'], data['version'], data['release'])
+        return _share_tuple((data['name'], data['arch'],
+                             data['epoch'], data['version'], data['release']))
 
     def _packagesByName(self, pkgname):
         """ Load all pkgnames from cache, with a given name. """
@@ -911,6 +1342,62 @@ class YumSqlitePackageSack(yumRepo.YumPackageSack):
             self._cached_fRFE = self._have_fastReturnFileEntries()
         return self._cached_fRFE
 
+    def _check_filelists_pkgs(self, repo):
+        """ Check to make sure the DB data matches, this should always pass
+            but we've had weird errors. So check it for a bit. """
+        # Only check each repo. once ... the libguestfs check :).
+        if hasattr(repo, '_checked_filelists_pkgs'):
+            return
+        pri_pkgs = self._sql_MD_pkg_num('primary',   repo)
+        fil_pkgs = self._sql_MD_pkg_num('filelists', repo)
+        if pri_pkgs != fil_pkgs:
+            raise Errors.RepoError('Check of Primary and Filelists sync. failed.', repo=repo)
+        repo._checked_filelists_pkgs = True
+
+    def _filelists_repo_index(self, repo):
+        """ Return the file path index for the repo, loading its filelists
+            first if we need to. """
+        conn = self._filelists_index.get(repo)
+        if conn is not None:
+            return conn
+        if repo not in self.filelistsdb:
+            self.populate(repo, mdtype='filelists')
+        self._check_filelists_pkgs(repo)
+        conn = _filelists_index(repo, self.filelistsdb[repo])
+        self._filelists_index[repo] = conn
+        return conn
+
+    def _search_files_pcache(self, name):
+        """ The same as searchFiles(name, strict=True), but the pkgKeys found
+            for each path are saved per. repo. (like the prco lookups), so we
+            only need the filelists for paths we haven't looked up before. """
+        name = os.path.normpath(name)
+        pkgs = []
+        for (rep,cache) in self.primarydb.items():
+            if rep in self._all_excludes:
+                continue
+
+            pkgs.extend(self._search_files_pcache_repo(rep, name))
+        return pkgs
+
+    def _search_files_pcache_repo(self, rep, name):
+        """ _search_files_pcache() for a single repo., name must already be
+            normalized. """
+        pkgs = []
+        fcache = self._file_pcache_load(rep)
+        pkgKeys = fcache.get(name)
+        if pkgKeys is None:
+            conn = self._filelists_repo_index(rep)
+            pkgKeys = sorted(_filelists_index_search(conn, name, glob=False))
+            fcache[name] = pkgKeys
+            self._file_pcache_dirty.add(rep)
+        for pkgKey in pkgKeys:
+            pkg = self._packageByKey(rep, pkgKey)
+            if pkg is None:
+                continue
+            pkgs.append(pkg)
+        return pkgs
+
     @catchSqliteException
     def searchFiles(self, name, strict=False):
         """search primary if file will be in there, if not, search filelists, use globs, if possible"""
@@ -923,17 +1410,13 @@ class YumSqlitePackageSack(yumRepo.YumPackageSack):
         # if so, just use those for the lookup
         
         glob = True
-        file_glob = True
         querytype = 'glob'
         name = os.path.normpath(name)
         dirname  = os.path.dirname(name)
         filename = os.path.basename(name)
         if strict or not misc.re_glob(name):
             glob = False
-            file_glob = False
             querytype = '='
-        elif not misc.re_glob(filename):
-            file_glob = False
 
         # Take off the trailing slash to act like rpm
         if name[-1] == '/':
@@ -945,40 +1428,36 @@ class YumSqlitePackageSack(yumRepo.YumPackageSack):
         if misc.re_primary_filename(name):
             return self._search_primary_files(name)
         
-        if len(self.filelistsdb) == 0:
-            # grab repo object from primarydb and force filelists population in this sack using repo
-            # sack.populate(repo, mdtype, callback, cacheonly)
-            for (repo,cache) in self.primarydb.items():
-                if repo in self._all_excludes:
-                    continue
+        #  Repos. with filelists_on_demand only load their filelists when they
+        # have to. Exact paths go through the per. repo. file lookup cache, so
+        # only the repos. that haven't seen the path before are loaded. Globs
+        # could be anywhere, so they need every repo. loaded, even the
+        # on demand ones that have only loaded for some exact paths so far.
+        ondemand = set()
+        for repo in self.primarydb:
+            if getattr(repo, 'filelists_on_demand', False):
+                ondemand.add(repo)
+        pcache_repos = set()
+        if not glob:
+            pcache_repos = ondemand
 
-                self.populate(repo, mdtype='filelists')
+        # grab repo object from primarydb and force filelists population in this sack using repo
+        # sack.populate(repo, mdtype, callback, cacheonly)
+        for (repo,cache) in self.primarydb.items():
+            if repo in self._all_excludes or repo in pcache_repos:
+                continue
+            if repo in self.filelistsdb:
+                continue
+
+            self.populate(repo, mdtype='filelists')
 
-        # Check to make sure the DB data matches, this should always pass but
-        # we've had weird errors. So check it for a bit.
         for repo in self.filelistsdb:
-            # Only check each repo. once ... the libguestfs check :).
-            if hasattr(repo, '_checked_filelists_pkgs'):
+            if repo in pcache_repos:
                 continue
-            pri_pkgs = self._sql_MD_pkg_num('primary',   repo)
-            fil_pkgs = self._sql_MD_pkg_num('filelists', repo)
-            if pri_pkgs != fil_pkgs:
-                raise Errors.RepoError('Check of Primary and Filelists sync. failed.', repo=repo)
-            repo._checked_filelists_pkgs = True
+            self._check_filelists_pkgs(repo)
 
         sql_params = []
-        dirname_check = ""
-        if not glob:
-            (pattern, esc) = sql_esc(filename)
-            dirname_check = "dirname = ? and filenames LIKE ? %s and " % esc
-            sql_params.append(dirname)
-            sql_params.append('%' + pattern + '%')
-        elif not file_glob:
-            (pattern, esc) = sql_esc(filename)
-            dirname_check = "dirname GLOB ? and filenames LIKE ? %s and " % esc
-            sql_params.append(dirname)
-            sql_params.append('%' + pattern + '%')
-        elif filename == '*':
+        if glob and filename == '*':
             # We only care about matching on dirname...
             for (rep,cache) in self.filelistsdb.items():
                 if rep in self._all_excludes:
@@ -994,49 +1473,59 @@ class YumSqlitePackageSack(yumRepo.YumPackageSack):
             return misc.unique(pkgs)
 
         for (rep,cache) in self.filelistsdb.items():
-            if rep in self._all_excludes:
+            if rep in self._all_excludes or rep in pcache_repos:
                 continue
 
-            cur = cache.cursor()
+            #  Look the file(s) up in the path index, instead of splitting up
+            # every multi-file row in the filelists.
+            conn = self._filelists_repo_index(rep)
+            for pkgKey in _filelists_index_search(conn, name, glob):
+                pkg = self._packageByKey(rep, pkgKey)
+                if pkg is None:
+                    continue
+                pkgs.append(pkg)
 
-            # grab the entries that are a single file in the 
-            # filenames section, use sqlites globbing if it is a glob
-            executeSQL(cur, "select pkgKey from filelist where \
-                    %s length(filetypes) = 1 and \
-                    dirname || ? || filenames \
-                    %s ?" % (dirname_check, querytype), sql_params + ['/',name])
-            self._sql_pkgKey2po(rep, cur, pkgs)
-
-            if file_glob:
-                name_re = re.compile(fnmatch.translate(name))
-            def filelist_globber(sql_dirname, sql_filenames):
-                # Note: Can't return bool, because sqlite doesn't like it in
-                #       weird ways. Test:
-                #                         install '*bin/autoheader'
-                #                         provides /lib/security/pam_loginuid.so
-                files = sql_filenames.split('/')
-                if not file_glob:
-                    return int(filename in files)
-
-                fns = map(lambda f: '%s/%s' % (sql_dirname, f), files)
-                for match in fns:
-                    if name_re.match(match):
-                        return 1
-                return 0
-
-            cache.create_function("filelist_globber", 2, filelist_globber)
-            # for all the ones where filenames is multiple files, 
-            # make the files up whole and use python's globbing method
-            executeSQL(cur, "select pkgKey from filelist where \
-                             %s length(filetypes) > 1 \
-                             and filelist_globber(dirname,filenames)" % dirname_check,
-                       sql_params)
-
-            self._sql_pkgKey2po(rep, cur, pkgs)
+        for rep in pcache_repos:
+            if rep in self._all_excludes:
+                continue
+            pkgs.extend(self._search_files_pcache_repo(rep, name))
 
         pkgs = misc.unique(pkgs)
         return pkgs
         
+    def _search_index_pkgKeys(self, repo, cache, fields, searchstring):
+        """ Return the pkgKeys in repo that have searchstring in one of fields,
+            using the search index, or None if we can't use it. """
+        if not getattr(repo, 'search_index', False):
+            return None
+        for f in fields:
+            if f not in _SEARCH_INDEX_FIELDS:
+                return None
+
+        conn = self._search_index.get(repo)
+        if conn is None:
+            conn = _search_index(repo, cache)
+            self._search_index[repo] = conn
+        pkgKeys = _search_index_lookup(conn, searchstring)
+        if pkgKeys is None:
+            return None
+
+        #  The index only tells us which pkgs. have all the trigrams, so check
+        # them with the same LIKE we'd do without it.
+        searchstring = searchstring.replace("'", "''")
+        (searchstring, esc) = sql_esc(searchstring)
+        like = " or ".join(["%s like '%%%s%%'%s" % (f, searchstring, esc)
+                            for f in fields])
+        ret = []
+        cur = cache.cursor()
+        for split in misc.seq_max_split(sorted(pkgKeys),
+                                        constants.PATTERNS_INDEXED_MAX):
+            executeSQL(cur, """SELECT pkgKey FROM packages
+                               WHERE pkgKey IN (%s) AND (%s)""" %
+                       (",".join("?" * len(split)), like), split)
+            ret.extend([x[0] for x in cur])
+        return ret
+
     @catchSqliteException
     def searchPrimaryFields(self, fields, searchstring):
         """search arbitrary fields from the primarydb for a string"""
@@ -1047,6 +1536,7 @@ class YumSqlitePackageSack(yumRepo.YumPackageSack):
         if len(fields) < 1:
             return result
         
+        origstring = searchstring
         searchstring = searchstring.replace("'", "''")
         (searchstring, esc) = sql_esc(searchstring)
         sql = "select DISTINCT pkgKey from packages where %s like '%%%s%%'%s " % (fields[0], searchstring, esc)
@@ -1055,6 +1545,14 @@ class YumSqlitePackageSack(yumRepo.YumPackageSack):
             sql = "%s or %s like '%%%s%%'%s " % (sql, f, searchstring, esc)
         
         for (rep,cache) in self.primarydb.items():
+            pkgKeys = self._search_index_pkgKeys(rep, cache, fields, origstring)
+            if pkgKeys is not None:
+                for pkgKey in pkgKeys:
+                    pkg = self._packageByKey(rep, pkgKey)
+                    if pkg is not None:
+                        result.append(pkg)
+                continue
+
             cur = cache.cursor()
             executeSQL(cur, sql)
             self._sql_pkgKey2po(rep, cur, result)
@@ -1103,6 +1601,22 @@ class YumSqlitePackageSack(yumRepo.YumPackageSack):
         totalstring = unionstring + " UNION ALL ".join(selects) + endunionstring
 
         for (rep,cache) in self.primarydb.items():
+            tot = {}
+            for s in searchstrings:
+                pkgKeys = self._search_index_pkgKeys(rep, cache, fields, s)
+                if pkgKeys is None:
+                    tot = None
+                    break
+                for pkgKey in pkgKeys:
+                    tot[pkgKey] = tot.get(pkgKey, 0) + 1
+            if tot is not None:
+                for pkgKey in sorted(tot, key=tot.get, reverse=True):
+                    pkg = self._packageByKey(rep, pkgKey)
+                    if pkg is None:
+                        continue
+                    result.append((pkg, tot[pkgKey]))
+                continue
+
             cur = cache.cursor()
             executeSQL(cur, totalstring)
             for ob in cur:
@@ -1196,12 +1710,126 @@ class YumSqlitePackageSack(yumRepo.YumPackageSack):
             setattr(self, '_memoize_' + prcotype, memoize)
         return getattr(self, '_memoize_' + prcotype)
 
-    @catchSqliteException
-    def _search(self, prcotype, name, flags, version):
+    def _prco_pcache_checksum(self, repo):
+        """ Return an ID for the primary MD of the repo. (which is what the
+            pkgKeys come from), or None if we shouldn't cache for it. """
+        if not getattr(repo, 'prco_cache', False):
+            return None
 
-        if self._skip_all():
-            return {}
-        
+        mdtype = 'primary_db'
+        if getattr(repo, '_xml2sqlite_local', False):
+            mdtype = 'primary'
+        try:
+            (ctype, csum) = repo.repoXML.getData(mdtype).checksum
+        except (Errors.RepoError, Errors.RepoMDError):
+            return None
+        return "%s:%s:%s" % (mdtype, ctype, csum)
+
+    @staticmethod
+    def _prco_pcache_ok(req):
+        """ Can we save the lookup for req, ie. will it compare the same way
+            when we load it back in. """
+        for val in (req[1],) + tuple(req[2]):
+            if val is not None and not isinstance(val, basestring):
+                return False
+        return True
+
+    def _prco_pcache_load(self, repo):
+        """ Get the prco lookup results for the repo, see _PrcoLookupCache.
+            The saved ones are only used if they are for the current
+            primary MD. """
+        if repo not in self._prco_pcache:
+            csum = self._prco_pcache_checksum(repo)
+            self._prco_pcache[repo] = _PrcoLookupCache(repo, csum,
+                                                       self._search_cache_size)
+        return self._prco_pcache[repo]
+
+    def _prco_pcache_save(self):
+        """ Save the new prco lookup results for each repo. to their gen/
+            dir., and close the saved ones. """
+        for pcache in self._prco_pcache.itervalues():
+            pcache.save()
+            pcache.close()
+
+    def _file_pcache_load(self, repo):
+        """ Get the file lookup results for the repo, loading the saved ones
+            if they are for the current primary MD. Returns an LRUCache of:
+            path => [pkgKeys] """
+        if repo in self._file_pcache:
+            return self._file_pcache[repo]
+
+        data = misc.LRUCache('sqlite.file-pcache', self._search_cache_size,
+                             lambda pkgKeys: len(pkgKeys) + 1)
+        self._file_pcache[repo] = data
+        csum = self._prco_pcache_checksum(repo)
+        if csum is None:
+            return data
+
+        fname = repo.cachedir + '/gen/file-cache.sqlite'
+        if not os.path.exists(fname):
+            return data
+
+        try:
+            conn = sqlutils.sqlite.connect(fname)
+            cur = conn.cursor()
+            executeSQL(cur, "SELECT checksum FROM db_info")
+            row = cur.fetchone()
+            if row is None or row[0] != csum: # Repodata changed, so not valid
+                conn.close()
+                return data
+
+            #  Paths that nothing has are saved with a NULL pkgKey, as we want
+            # to remember those too.
+            files = {}
+            executeSQL(cur, "SELECT name, pkgKey FROM files")
+            for x in cur:
+                tmp = files.setdefault(_share_data(x[0]), [])
+                if x[1] is not None:
+                    tmp.append(x[1])
+            conn.close()
+        except sqlutils.sqlite.Error:
+            return data
+
+        for name, pkgKeys in files.iteritems():
+            data[name] = pkgKeys
+        return data
+
+    def _file_pcache_save(self):
+        """ Save the file lookup results for any repos. that did new lookups,
+            to their gen/ dir. """
+        for repo in self._file_pcache_dirty:
+            data = self._file_pcache.get(repo)
+            csum = self._prco_pcache_checksum(repo)
+            if not data or csum is None:
+                continue
+            if not os.access(repo.cachedir + '/gen', os.W_OK):
+                continue
+
+            fname = repo.cachedir + '/gen/file-cache.sqlite'
+            misc.unlink_f(fname + '.tmp')
+            try:
+                conn = sqlutils.sqlite.connect(fname + '.tmp')
+                cur = conn.cursor()
+                executeSQL(cur, "CREATE TABLE db_info (checksum TEXT)")
+                executeSQL(cur, "INSERT INTO db_info VALUES (?)", (csum,))
+                executeSQL(cur, "CREATE TABLE files (name TEXT, pkgKey INTEGER)")
+                rows = []
+                for name, pkgKeys in data.iteritems():
+                    if not pkgKeys:
+                        rows.append((name, None))
+                    for pkgKey in pkgKeys:
+                        rows.append((name, pkgKey))
+                cur.executemany("INSERT INTO files VALUES (?,?)", rows)
+                conn.commit()
+                conn.close()
+                os.rename(fname + '.tmp', fname)
+            except (sqlutils.sqlite.Error, OSError, IOError):
+                misc.unlink_f(fname + '.tmp')
+        self._file_pcache_dirty = set()
+
+    @staticmethod
+    def _search_req(name, flags, version):
+        """ Convert the args. to _search() into the req we look up. """
         name = to_unicode(name)
         if flags == 0:
             flags = None
@@ -1210,11 +1838,27 @@ class YumSqlitePackageSack(yumRepo.YumPackageSack):
                 version))
         elif type(version) in (tuple, list): # would this ever be a list?
             req = (name, flags, version)
+        return _share_data(req)
+
+    @staticmethod
+    def _search_row2val(x):
+        val = (_share_data(x['name']), _share_data(x['flags']),
+               (_share_data(x['epoch']), _share_data(x['version']),
+                _share_data(x['release'])))
+        return _share_data(val)
+
+    @catchSqliteException
+    def _search(self, prcotype, name, flags, version):
 
+        if self._skip_all():
+            return {}
+        
+        req      = self._search_req(name, flags, version)
+        name     = req[0]
         prcotype = _share_data(prcotype)
-        req      = _share_data(req)
-        if req in self._search_cache[prcotype]:
-            return self._search_cache[prcotype][req]
+        result = self._search_cache[prcotype].get(req)
+        if result is not None:
+            return result
 
         result = { }
 
@@ -1249,17 +1893,20 @@ class YumSqlitePackageSack(yumRepo.YumPackageSack):
             if rep in self._all_excludes:
                 continue
 
-            cur = cache.cursor()
-            executeSQL(cur, "select * from %s where name=?" % prcotype,
-                       (name,))
-            tmp = { }
-            for x in cur:
-                val = (_share_data(x['name']), _share_data(x['flags']),
-                       (_share_data(x['epoch']), _share_data(x['version']),
-                        _share_data(x['release'])))
-                val = _share_data(val)
-                if rpmUtils.miscutils.rangeCompare(req, val):
-                    tmp.setdefault(x['pkgKey'], []).append(val)
+            #  Note that the pkgKeys we save are before any excludes, so the
+            # excludes can change without invalidating the saved data.
+            pcache = self._prco_pcache_load(rep)
+            tmp = pcache.get((prcotype, req))
+            if tmp is None:
+                cur = cache.cursor()
+                executeSQL(cur, "select * from %s where name=?" % prcotype,
+                           (name,))
+                tmp = { }
+                for x in cur:
+                    val = self._search_row2val(x)
+                    if rpmUtils.miscutils.rangeCompare(req, val):
+                        tmp.setdefault(x['pkgKey'], []).append(val)
+                pcache.set((prcotype, req), tmp, self._prco_pcache_ok(req))
             for pkgKey, hits in tmp.iteritems():
                 pkg = self._packageByKey(rep, pkgKey)
                 if pkg is None:
@@ -1274,7 +1921,7 @@ class YumSqlitePackageSack(yumRepo.YumPackageSack):
         if not misc.re_primary_filename(name):
             # If it is not in the primary.xml files
             # search the files.xml file info
-            for pkg in self.searchFiles(name, strict=True):
+            for pkg in self._search_files_pcache(name):
                 result[pkg] = [(name, None, None)]
             if not preload:
                 self._search_cache[prcotype][req] = result
@@ -1293,6 +1940,73 @@ class YumSqlitePackageSack(yumRepo.YumPackageSack):
     def getRequires(self, name, flags=None, version=(None, None, None)):
         return self._search("requires", name, flags, version)
 
+    @catchSqliteException
+    def _search_multiple(self, prcotype, reqs):
+        """ Do _search() for a list of (name, flags, version) reqs, but do
+            the lookups in each repo. using a few "name IN (...)" queries
+            instead of one query per req. """
+        if self._skip_all():
+            return dict([(req, {}) for req in reqs])
+
+        prcotype = _share_data(prcotype)
+        todo = {}
+        for req in reqs:
+            req = self._search_req(*req)
+            if req in self._search_cache[prcotype]:
+                continue
+            todo.setdefault(req[0], set()).add(req)
+
+        for (rep,cache) in self.primarydb.items():
+            if not todo:
+                break
+            if rep in self._all_excludes:
+                continue
+
+            pcache = self._prco_pcache_load(rep)
+            names = []
+            for name in todo:
+                for req in todo[name]:
+                    if pcache.get((prcotype, req)) is None:
+                        names.append(name)
+                        break
+            if not names:
+                continue
+
+            rows = {}
+            cur = cache.cursor()
+            max_entries = constants.PATTERNS_INDEXED_MAX
+            for chunk in seq_max_split(names, max_entries):
+                sql = "select * from %s where name IN (%s)"
+                sql = sql % (prcotype, ",".join(["?"] * len(chunk)))
+                executeSQL(cur, sql, chunk)
+                for x in cur:
+                    val = self._search_row2val(x)
+                    rows.setdefault(val[0], []).append((x['pkgKey'], val))
+
+            for name in names:
+                for req in todo[name]:
+                    if pcache.get((prcotype, req)) is not None:
+                        continue
+                    tmp = {}
+                    for pkgKey, val in rows.get(name, []):
+                        if rpmUtils.miscutils.rangeCompare(req, val):
+                            tmp.setdefault(pkgKey, []).append(val)
+                    pcache.set((prcotype, req), tmp,
+                               self._prco_pcache_ok(req))
+
+        #  Everything is in the per. repo. results now, so this just does the
+        # excludes/file checks and fills in _search_cache.
+        ret = {}
+        for req in reqs:
+            ret[req] = self._search(prcotype, *req)
+        return ret
+
+    def getProvidesMultiple(self, reqs):
+        return self._search_multiple("provides", reqs)
+
+    def getRequiresMultiple(self, reqs):
+        return self._search_multiple("requires", reqs)
+
     @catchSqliteException
     def searchNames(self, names=[], return_pkgtups=False):
         """return a list of packages matching any of the given names. This is 
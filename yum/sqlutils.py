@@ -19,6 +19,8 @@ These are from Wichert Akkerman <wichert@deephackmode.org>'s python-dhm
 http://www.wiggy.net/code/python-dhm
 """
 
+import os
+
 try:
     import sqlite3 as sqlite
 except ImportError:
@@ -167,10 +169,39 @@ def executeSQLQmark(cursor, query, params=None):
     
     return cursor.execute(query, params)
 
+def executeSQLManyPyFormat(cursor, query, seq_of_params):
+    """
+    Execute a python < 2.5 (external sqlite module) style query, for each
+    set of parameters.
+
+    @param cursor: A sqlite cursor
+    @param query: The query to execute
+    @param seq_of_params: A list of parameter lists for the query
+    """
+    # Leading whitespace confuses QmarkToPyformat()
+    query = query.strip()
+    for params in seq_of_params:
+        (q, p) = QmarkToPyformat(query, params)
+        cursor.execute(q, p)
+    return cursor
+
+def executeSQLManyQmark(cursor, query, seq_of_params):
+    """
+    Execute a python 2.5 (sqlite3) style query, for each set of parameters.
+    The query is only prepared once.
+
+    @param cursor: A sqlite cursor
+    @param query: The query to execute
+    @param seq_of_params: A list of parameter lists for the query
+    """
+    return cursor.executemany(query, seq_of_params)
+
 if sqlite.version_info[0] > 1:
     executeSQL = executeSQLQmark
+    executeSQLMany = executeSQLManyQmark
 else:
     executeSQL = executeSQLPyFormat
+    executeSQLMany = executeSQLManyPyFormat
 
 
 def sql_esc(pattern):
@@ -197,3 +228,59 @@ def sql_esc_glob(patterns):
         pattern = pattern.replace("?", "_")
         ret.append((pattern, esc))
     return ret
+
+def open_gen_index(repo, fname, dbversion, csum, build):
+    """ Return a sqlite connection to the index fname, in the gen/ dir. of
+        repo, made from the MD with checksum csum. If the saved index was made
+        from other MD (or is an older dbversion) build(cur) is called to fill
+        in a new one (the db_info table is done here), which is written to a
+        .tmp file and renamed into place. If build() returns False there's
+        nothing to index, and this returns None.
+        When csum is None, or we can't write to gen/, the new index is just
+        kept in memory for this run. """
+    fname = repo.cachedir + '/gen/' + fname
+    if csum is not None and os.path.exists(fname):
+        try:
+            conn = sqlite.connect(fname)
+            cur = conn.cursor()
+            executeSQL(cur, "SELECT dbversion, checksum FROM db_info")
+            if tuple(cur.fetchone() or ()) == (dbversion, csum):
+                return conn
+            conn.close()
+        except sqlite.Error:
+            pass
+
+    tmpname = None
+    if csum is not None and os.access(repo.cachedir + '/gen', os.W_OK):
+        tmpname = fname + '.tmp'
+        _unlink_f(tmpname)
+    conn = sqlite.connect(tmpname or ':memory:')
+    try:
+        cur = conn.cursor()
+        executeSQL(cur, """CREATE TABLE db_info (dbversion INTEGER,
+                           checksum TEXT)""")
+        executeSQL(cur, "INSERT INTO db_info VALUES (?, ?)", (dbversion, csum))
+        if build(cur) is False:
+            conn.close()
+            if tmpname is not None:
+                _unlink_f(tmpname)
+            return None
+        conn.commit()
+    except:
+        conn.close()
+        if tmpname is not None:
+            _unlink_f(tmpname)
+        raise
+    if tmpname is None:
+        return conn
+
+    conn.close()
+    os.rename(tmpname, fname)
+    return sqlite.connect(fname)
+
+def _unlink_f(filename):
+    """ os.unlink() that doesn't care if the file isn't there. """
+    try:
+        os.unlink(filename)
+    except OSError:
+        pass
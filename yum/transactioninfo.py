@@ -35,6 +35,7 @@ import warnings
 import misc
 
 import time
+import weakref
 
 class GetProvReqOnlyPackageSack(PackageSack):
     def __init__(self, need_files=False):
@@ -81,7 +82,15 @@ class TransactionData:
         self.root = '/'
         self.pkgdict = {} # key = pkgtup, val = list of TransactionMember obj
         self._namedict = {} # name -> list of TransactionMember obj
+        # output_state -> pkgtup -> list of TransactionMember obj
+        self._statedict = {}
         self._unresolvedMembers = set()
+        #  txmbr -> (output_state, updates, providers) from when its deps were
+        # last resolved, see resetChangedResolved().
+        self._resolvedProviders = {}
+        #  Set when a removal leaves the transaction, so what it was checked
+        # against isn't known anymore, see resetChangedResolved().
+        self._removalDropped = False
         self.debug = 0
         self.changed = False
         self.installonlypkgs = []
@@ -147,8 +156,42 @@ class TransactionData:
             print msg
 
     def getMembersWithState(self, pkgtup=None, output_states=None):
-        return filter(lambda p: p.output_state in output_states,
-                      self.getMembers(pkgtup))
+        if pkgtup is not None:
+            return [txmbr for txmbr in self.pkgdict.get(pkgtup, [])
+                    if txmbr.output_state in output_states]
+
+        returnlist = []
+        for state in set(output_states):
+            for members in self._statedict.get(state, {}).itervalues():
+                returnlist.extend(members)
+        return returnlist
+
+    def _addStateIndex(self, txmbr, state):
+        pkgtups = self._statedict.setdefault(state, {})
+        pkgtups.setdefault(txmbr.pkgtup, []).append(txmbr)
+
+    def _delStateIndex(self, txmbr, state):
+        pkgtups = self._statedict.get(state, {})
+        members = pkgtups.get(txmbr.pkgtup, [])
+        #  Can't use .remove() as txmbr __cmp__ is on the po, and we can
+        # have two members for the same pkg.
+        for num, member in enumerate(members):
+            if member is txmbr:
+                del members[num]
+                break
+        if not members and txmbr.pkgtup in pkgtups:
+            del pkgtups[txmbr.pkgtup]
+            if not pkgtups:
+                del self._statedict[state]
+
+    def _memberStateChanged(self, txmbr, old_state):
+        """ Called by a member of this transaction when its output_state
+            changes, to keep the getMembersWithState() index right. """
+        for member in self.pkgdict.get(txmbr.pkgtup, []):
+            if member is txmbr:
+                self._delStateIndex(txmbr, old_state)
+                self._addStateIndex(txmbr, txmbr.output_state)
+                break
 
     def getMembers(self, pkgtup=None):
         """takes an optional package tuple and returns all transaction members 
@@ -168,16 +211,72 @@ class TransactionData:
     def getUnresolvedMembers(self):
         return list(sorted(self._unresolvedMembers))
 
-    def markAsResolved(self, txmbr):
+    def markAsResolved(self, txmbr, providers=None):
+        """ Mark the txmbr as having its deps resolved. If we know the pkgs
+            that satisfied them pass them as providers, then
+            resetChangedResolved() only has to recheck it if they change. """
         self._unresolvedMembers.discard(txmbr)
+        if providers is None:
+            self._resolvedProviders.pop(txmbr, None)
+        else:
+            self._resolvedProviders[txmbr] = (txmbr.output_state,
+                                              txmbr.updates[:], providers)
 
     def resetResolved(self, hard=False):
         if hard or len(self) < len(self._unresolvedMembers):
             self._unresolvedMembers.clear()
             self._unresolvedMembers.update(self.getMembers())
+            self._removalDropped = False
             return True
         return False
 
+    def _providerInTransaction(self, po):
+        """ Will the po still be installed after the transaction. """
+        if po.repoid == 'installed':
+            return not self.getMembersWithState(po.pkgtup, TS_REMOVE_STATES)
+        return bool(self.getMembersWithState(po.pkgtup, TS_INSTALL_STATES))
+
+    def resetChangedResolved(self):
+        """ Like resetResolved(hard=True), but only the members that might
+            now resolve differently are marked as unresolved. That's any
+            member without recorded providers (see markAsResolved()), or
+            that has changed state, or where one of the providers is no longer
+            going to be installed.
+            A removal is only checked against the requirers that are in the
+            transaction at the time, so when any removal leaves the
+            transaction (say an update of one of those requirers is skipped,
+            leaving the old version installed) all the remaining removals are
+            rechecked too. Returns the number of members marked. """
+        members = self.getMembers()
+        current = set(members)
+        for txmbr in self._resolvedProviders.keys():
+            if txmbr not in current:
+                del self._resolvedProviders[txmbr]
+        self._unresolvedMembers.intersection_update(current)
+        removal_dropped = self._removalDropped
+        self._removalDropped = False
+
+        provider_ok = {}
+        num = 0
+        for txmbr in members:
+            data = self._resolvedProviders.get(txmbr)
+            recheck = (data is None or data[0] != txmbr.output_state or
+                       data[1] != txmbr.updates)
+            if (not recheck and removal_dropped and
+                txmbr.output_state in TS_REMOVE_STATES):
+                recheck = True
+            if not recheck:
+                for po in data[2]:
+                    if po not in provider_ok:
+                        provider_ok[po] = self._providerInTransaction(po)
+                    if not provider_ok[po]:
+                        recheck = True
+                        break
+            if recheck:
+                self._unresolvedMembers.add(txmbr)
+                num += 1
+        return num
+
     def getMode(self, name=None, arch=None, epoch=None, ver=None, rel=None):
         """returns the mode of the first match from the transaction set, 
            otherwise, returns None"""
@@ -298,6 +397,8 @@ class TransactionData:
                     return
         self.pkgdict[txmember.pkgtup].append(txmember)
         self._namedict.setdefault(txmember.name, []).append(txmember)
+        self._addStateIndex(txmember, txmember.output_state)
+        txmember._addTransactionData(self)
         self._changed()
 
         if self._isLocalPackage(txmember):
@@ -334,7 +435,11 @@ class TransactionData:
             if self._inSack is not None and txmbr.output_state in TS_INSTALL_STATES:
                 self._inSack.delPackage(txmbr.po)
             self._namedict[txmbr.name].remove(txmbr)
+            self._delStateIndex(txmbr, txmbr.output_state)
+            txmbr._delTransactionData(self)
             self._unresolvedMembers.add(txmbr)
+            if txmbr.output_state in TS_REMOVE_STATES:
+                self._removalDropped = True
         
         del self.pkgdict[pkgtup]
         if not self._namedict[pkgtup[0]]:
@@ -612,7 +717,11 @@ class TransactionData:
         result = { }
         if not self.pkgSackPackages:
             pass
-        elif self._inSack is None:
+        elif (self._inSack is None or
+              (name[0] == '/' and not misc.re_primary_filename(name))):
+            #  For files that aren't in primary, the repos. are much cheaper to
+            # ask than _inSack. They remember the paths they've looked up,
+            # where _inSack would need the filelists for every pkg.
             for pkg, hits in self.pkgSack.getProvides(name, flag, version).iteritems():
                 if self.getMembersWithState(pkg.pkgtup, TS_INSTALL_STATES):
                     result[pkg] = hits
@@ -637,6 +746,35 @@ class TransactionData:
         result.update(self.getNewProvides(name, flag, version))
         return result
 
+    def getProvidesMultiple(self, reqs):
+        """return dict { (name, flag, version) ->
+                         dict { packages -> list of matching provides } }
+        same as getProvides() for each of the reqs, but does the lookups
+        in the sacks all at once"""
+        result = {}
+        for req in reqs:
+            result[req] = {}
+
+        for req, pkgs in self.rpmdb.getProvidesMultiple(reqs).iteritems():
+            for pkg, hits in pkgs.iteritems():
+                if not self.getMembersWithState(pkg.pkgtup, TS_REMOVE_STATES):
+                    result[req][pkg] = hits
+
+        if not self.pkgSackPackages:
+            pass
+        elif self._inSack is None:
+            for req, pkgs in self.pkgSack.getProvidesMultiple(reqs).iteritems():
+                for pkg, hits in pkgs.iteritems():
+                    if self.getMembersWithState(pkg.pkgtup, TS_INSTALL_STATES):
+                        result[req][pkg] = hits
+        else:
+            for req, pkgs in self._inSack.getProvidesMultiple(reqs).iteritems():
+                result[req].update(pkgs)
+
+        for req, pkgs in self.localSack.getProvidesMultiple(reqs).iteritems():
+            result[req].update(pkgs)
+        return result
+
     def getNewRequires(self, name, flag=None, version=(None, None, None)):
         """return dict { packages -> list of matching provides }
         searches in packages to be installed"""
@@ -791,16 +929,41 @@ class SortableTransactionData(TransactionData):
         return self._sorted
 
 
-class TransactionMember:
+class TransactionMember(object):
     """Class to describe a Transaction Member (a pkg to be installed/
        updated/erased)."""
-    
+
+    _output_state = None
+    #  Weak refs. to the TransactionData objects we are in, so they can keep
+    # their output_state index up to date.
+    _tsInfos = ()
+
+    def _get_output_state(self):
+        return self._output_state
+
+    def _set_output_state(self, state):
+        old_state = self._output_state
+        self._output_state = state
+        for tsInfo in self._tsInfos:
+            tsInfo = tsInfo()
+            if tsInfo is not None:
+                tsInfo._memberStateChanged(self, old_state)
+
+    # what state to list if printing it
+    output_state = property(fget=_get_output_state, fset=_set_output_state)
+
+    def _addTransactionData(self, tsInfo):
+        self._tsInfos = self._tsInfos + (weakref.ref(tsInfo),)
+
+    def _delTransactionData(self, tsInfo):
+        self._tsInfos = tuple([ref for ref in self._tsInfos
+                               if ref() is not None and ref() is not tsInfo])
+
     def __init__(self, po):
         # holders for data
         self.po = po # package object
         self.current_state = None # where the package currently is (repo, installed)
         self.ts_state = None # what state to put it into in the transaction set
-        self.output_state = None # what state to list if printing it
         self.isDep = 0
         self.reason = 'user' # reason for it to be in the transaction set
         self.process = None #  I think this is used nowhere by nothing - skv 2010/11/03
@@ -55,51 +55,9 @@ import tempfile
 # This is unused now, probably nothing uses it but it was global/public.
 skip_old_DBMD_check = False
 
-try:
-    import xattr
-    if not hasattr(xattr, 'get') or not hasattr(xattr, 'set'):
-        xattr = None # This is a "newer" API.
-except ImportError:
-    xattr = None
-
-#  The problem we are trying to solve here is that:
-#
-# 1. We rarely want to be downloading MD/pkgs/etc.
-# 2. We want to check those files are valid (match checksums) when we do
-#    download them.
-# 3. We _really_ don't want to checksum all the files every time we
-#    run (100s of MBs).
-# 4. We can continue to download files from bad mirrors, or retry files due to
-#    C-c etc.
-#
-# ...we used to solve this by just checking the file size, and assuming the
-# files had been downloaded and checksumed as correct if that matched. But that
-# was error prone on bad mirrors, so now we store the checksum in an
-# xattr ... this does mean that if you can't store xattrs (Eg. NFS) you will
-# rechecksum everything constantly.
-
-def _xattr_get_chksum(filename, chktype):
-    if not xattr:
-        return None
-
-    try:
-        ret = xattr.get(filename, 'user.yum.checksum.' + chktype)
-    except: # Documented to be "EnvironmentError", but make sure
-        return None
-
-    return ret
-
-def _xattr_set_chksum(filename, chktype, chksum):
-    if not xattr:
-        return None
-
-    try:
-        xattr.set(filename, 'user.yum.checksum.' + chktype, chksum)
-    except:
-        return False # Data too long. = IOError ... ignore everything.
-
-    return True
-
+#  The xattr checksum cache is shared with packages now, so it lives in misc.
+_xattr_get_chksum = misc.xattr_get_chksum
+_xattr_set_chksum = misc.xattr_set_chksum
 
 warnings.simplefilter("ignore", Errors.YumFutureDeprecationWarning)
 
@@ -270,6 +228,63 @@ class YumPackageSack(packageSack.PackageSack):
         # get rid of all this stuff we don't need now
         del repo.cacheHandler
 
+    def _populate_prepare(self, repo, mdtype='metadata'):
+        """ Do the slow file work populate() would do for the repo, checking
+            and decompressing the DBs or converting the XML to sqlite, without
+            touching the sack. This is safe to run for different repos. at
+            the same time, and populate() then finds everything done. Nothing
+            is downloaded here, and any errors are left for populate() to
+            find and report. """
+        if mdtype == 'all':
+            data = ['metadata', 'filelists', 'otherdata']
+        else:
+            data = [ mdtype ]
+
+        for item in data:
+            if item in self.added.get(repo, []):
+                continue
+
+            if item == 'metadata':
+                mydbtype = 'primary_db'
+                mymdtype = 'primary'
+            elif item == 'filelists':
+                mydbtype = 'filelists_db'
+                mymdtype = 'filelists'
+            elif item == 'otherdata':
+                mydbtype = 'other_db'
+                mymdtype = 'other'
+            else:
+                continue
+
+            if self._check_db_version(repo, mydbtype):
+                if not self._check_uncompressed_db(repo, mydbtype):
+                    self._check_uncompressed_db_gen(repo, mydbtype)
+                continue
+
+            xmldata = repo.repoXML.getData(mymdtype)
+            xml = repo._get_mdtype_fname(xmldata)
+            if not repo._checkMD(xml, mymdtype, data=xmldata,
+                                 check_can_fail=True):
+                continue # populate() will need to download it.
+            xml = misc.repo_gen_decompress(xml, mymdtype + '.xml',
+                                           cached=repo.cache)
+            if not xml:
+                continue
+
+            # Use our own handler, so we don't share it between threads.
+            handler = sqlitecachec.RepodataParserSqlite(storedir=repo.cachedir,
+                                                        repoid=repo.id)
+            if item == 'metadata':
+                repo_cache_function = handler.getPrimary
+            elif item == 'filelists':
+                repo_cache_function = handler.getFilelists
+            else:
+                repo_cache_function = handler.getOtherdata
+            (ctype, csum) = xmldata.checksum
+            dobj = repo_cache_function(xml, csum)
+            if dobj is not None:
+                dobj.close()
+
     def _check_uncompressed_db_gen(self, repo, mdtype):
         """return file name of db in gen/ dir if good, None if not"""
 
@@ -283,8 +298,14 @@ class YumPackageSack(packageSack.PackageSack):
                              check_can_fail=True):
             return None
 
+        #  _check_uncompressed_db_fn() checks the open checksum, so get that
+        # while decompressing.
+        (ctype, csum) = mydbdata.openchecksum
+        sumtypes = []
+        if ctype:
+            sumtypes.append(ctype)
         ret = misc.repo_gen_decompress(compressed_fn, db_un_fn,
-                                       cached=repo.cache)
+                                       cached=repo.cache, sumtypes=sumtypes)
         if ret:
             return self._check_uncompressed_db_fn(repo, mdtype, ret)
         return None
@@ -405,7 +426,8 @@ class YumRepository(Repository, config.RepoConf):
         # repos from the sack ... thus. breaking the cycle.
         if self._sack is None:
             self._sack = sqlitesack.YumSqlitePackageSack(
-                sqlitesack.YumAvailablePackageSqlite)
+                sqlitesack.YumAvailablePackageSqlite,
+                cache_size=getattr(self, 'lookup_cache_size', 0))
         return self._sack
     sack = property(_getSack)
 
@@ -484,12 +506,12 @@ class YumRepository(Repository, config.RepoConf):
         # and use .ui_id explicitly.
         return self.id
 
-    def _checksum(self, sumtype, file, CHUNK=2**16, checksum_can_fail=False,
+    def _checksum(self, sumtype, file, CHUNK=2**20, checksum_can_fail=False,
                   datasize=None):
         """takes filename, hand back Checksum of it
            sumtype = md5 or sha
            filename = /path/to/file
-           CHUNK=65536 by default"""
+           CHUNK=1MB by default"""
         try:
             return misc.checksum(sumtype, file, CHUNK, datasize)
         except (Errors.MiscError, EnvironmentError), e:
@@ -1761,7 +1783,7 @@ Insufficient space in download directory %s
         if size is not None:
             size = int(size)
 
-        l_csum = _xattr_get_chksum(file, r_ctype)
+        l_csum = misc.xattr_get_chksum(file, r_ctype)
         if l_csum:
             fsize = misc.stat_f(file)
             if fsize is not None: # We just got an xattr, so it should be there
@@ -1783,7 +1805,7 @@ Insufficient space in download directory %s
             raise URLGrabError(-3, 'Error performing checksum')
 
         if l_csum == r_csum:
-            _xattr_set_chksum(file, r_ctype, l_csum)
+            misc.xattr_set_chksum(file, r_ctype, l_csum)
             if not openchecksum:
                 self._preload_to_cashe(r_ctype, r_csum, file)
             return 1
@@ -3233,6 +3233,106 @@ class CheckRpmdbCommand(YumCommand):
         return 'read-only:past'
 
 
+class CacheStatsCommand(YumCommand):
+    """A class containing methods needed by the cli to execute the
+    cache-stats command.
+    """
+
+    def getNames(self):
+        """Return a list containing the names of this command.  This
+        command can be called from the command line by using any of these names.
+
+        :return: a list containing the names of this command
+        """
+        return ['cache-stats']
+
+    def getUsage(self):
+        """Return a usage string for this command.
+
+        :return: a usage string for this command
+        """
+        return "[dependency...]"
+
+    def getSummary(self):
+        """Return a one line summary of this command.
+
+        :return: a one line summary of this command
+        """
+        return _("Show the hit/miss statistics of the lookup caches")
+
+    def doCommand(self, base, basecmd, extcmds):
+        """Execute this command.
+
+        :param base: a :class:`yum.Yumbase` object
+        :param basecmd: the name of the command
+        :param extcmds: the command line arguments passed to *basecmd*
+        :return: (exit_code, [ errors ])
+
+        exit_code is::
+
+            0 = we're done, exit
+            1 = we've errored, exit with error string
+            2 = we've got work yet to do, onto the next stage
+        """
+        #  Any dependencies given are looked up (twice) first, so you can see
+        # what the caches do for them. In the shell the stats are for
+        # everything done so far.
+        for dep in extcmds + extcmds:
+            base.returnInstalledPackagesByDep(dep)
+            base.returnPackagesByDep(dep)
+
+        stats = misc.cache_stats()
+        if not stats:
+            print _("No lookup caches in use")
+            return 0, [basecmd + ' done']
+
+        print "%-24s %6s %8s %8s %8s %9s %9s %5s %9s" % (_("Cache"),
+                                                        _("Caches"),
+                                                        _("Entries"),
+                                                        _("Size"), _("Max"),
+                                                        _("Hits"), _("Misses"),
+                                                        _("Hit%"),
+                                                        _("Evicted"))
+        for name in sorted(stats):
+            cur = stats[name]
+            lookups = cur['hits'] + cur['misses']
+            perc = 0
+            if lookups:
+                perc = cur['hits'] * 100 / lookups
+            maxsize = cur['maxsize'] or '-'
+            print "%-24s %6d %8d %8d %8s %9d %9d %4d%% %9d" % (name,
+                                                             cur['caches'],
+                                                             cur['entries'],
+                                                             cur['size'],
+                                                             maxsize,
+                                                             cur['hits'],
+                                                             cur['misses'],
+                                                             perc,
+                                                             cur['evictions'])
+        return 0, [basecmd + ' done']
+
+    def needTs(self, base, basecmd, extcmds):
+        """Return whether a transaction set must be set up before this
+        command can run.
+
+        :param base: a :class:`yum.Yumbase` object
+        :param basecmd: the name of the command
+        :param extcmds: a list of arguments passed to *basecmd*
+        :return: True if a transaction set is needed, False otherwise
+        """
+        return False
+
+    def cacheRequirement(self, base, basecmd, extcmds):
+        """Return the cache requirements for the remote repos.
+
+        :param base: a :class:`yum.Yumbase` object
+        :param basecmd: the name of the command
+        :param extcmds: a list of arguments passed to *basecmd*
+        :return: Type of requirement: read-only:past, read-only:present, read-only:future, write
+        """
+        return 'read-only:past'
+
+
 class LoadTransactionCommand(YumCommand):
     """A class containing methods needed by the cli to execute the
     load-transaction command.